@@ -0,0 +1,77 @@
+"""0.0.0.10_inspection_tree_fk_indexes
+
+Revision ID: 0.0.0.10
+Revises: 0.0.0.9
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.10"
+down_revision: Union[str, None] = "0.0.0.9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, столбцы, включаемые столбцы)
+INDEXES = [
+    # Дерево проверки: загрузка дочерних записей (selectinload, пересчет оценок) и ON DELETE CASCADE.
+    # Включенные столбцы - для Index Only Scan в запросах пересчета оценок.
+    (
+        "ix_direction_result_inspection_result_id",
+        "direction_result",
+        ["inspection_result_id", "id"],
+        ["direction_id", "grade"],
+    ),
+    (
+        "ix_topic_result_direction_result_id",
+        "topic_result",
+        ["direction_result_id", "id"],
+        ["topic_id", "grade"],
+    ),
+    # Фильтр по направлению (EXISTS по direction_result), поиск последнего результата по поднаправлению,
+    # ON DELETE SET NULL из справочников направлений и поднаправлений.
+    ("ix_direction_result_direction_id", "direction_result", ["direction_id", "inspection_result_id"], None),
+    ("ix_topic_result_topic_id", "topic_result", ["topic_id", "direction_result_id"], None),
+    # Фильтры списка проверок с сортировкой страницы (created_date DESC, id DESC) и условие политик RLS.
+    (
+        "ix_inspection_result_inspection_organ_id",
+        "inspection_result",
+        ["inspection_organ_id", sa.text("created_date DESC"), sa.text("id DESC")],
+        None,
+    ),
+    (
+        "ix_inspection_result_inspection_target_id",
+        "inspection_result",
+        ["inspection_target_id", sa.text("created_date DESC"), sa.text("id DESC")],
+        None,
+    ),
+    # Пересчет оценок проверок субъектов одного типа
+    ("ix_inspection_target_type_id", "inspection_target", ["type_id"], None),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY - без блокировки записи в таблицы, вне транзакции миграции.
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                schema="tables",
+                postgresql_include=include or [],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, schema="tables", postgresql_concurrently=True, if_exists=True)
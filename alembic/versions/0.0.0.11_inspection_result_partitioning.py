@@ -0,0 +1,392 @@
+"""0.0.0.11_inspection_result_partitioning
+
+Revision ID: 0.0.0.11
+Revises: 0.0.0.10
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from typing import Dict, List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.11"
+down_revision: Union[str, None] = "0.0.0.10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблицы дерева проверки в порядке от родителя к потомкам
+TABLES = ["inspection_result", "direction_result", "topic_result"]
+# Таблицы, политики RLS которых ссылаются на таблицы дерева (пересоздаются вместе с ними)
+DEPENDENT_POLICY_TABLES = ["latest_topic_result"]
+OLD_SUFFIX = "_old"
+# На сколько месяцев вперед создаются секции при миграции (далее - команда maintain-partitions)
+MONTHS_AHEAD = 3
+
+# Определения объектов таблиц дерева, которые пересоздаются на новых таблицах без изменений.
+# Запросы возвращают готовые команды, поэтому миграция переносит и объекты, добавленные предыдущими ревизиями.
+CAPTURE_QUERIES = {
+    "foreign_keys": """
+        SELECT format('ALTER TABLE %s ADD CONSTRAINT %I %s', conrelid::regclass, conname, pg_get_constraintdef(oid))
+        FROM pg_constraint
+        WHERE conrelid = ANY (CAST(:tables AS oid[]))
+            AND contype = 'f'
+            AND conparentid = 0
+            AND NOT confrelid = ANY (CAST(:tables AS oid[]))
+        ORDER BY conrelid, conname
+    """,
+    "indexes": """
+        SELECT replace(pg_get_indexdef(indexrelid), ' ON ONLY ', ' ON ')
+        FROM pg_index
+        WHERE indrelid = ANY (CAST(:tables AS oid[])) AND NOT indisprimary
+        ORDER BY indrelid, indexrelid
+    """,
+    "triggers": """
+        SELECT pg_get_triggerdef(oid)
+        FROM pg_trigger
+        WHERE tgrelid = ANY (CAST(:tables AS oid[])) AND NOT tgisinternal AND tgparentid = 0
+        ORDER BY tgrelid, tgname
+    """,
+    "row_security": """
+        SELECT format('ALTER TABLE %s ENABLE ROW LEVEL SECURITY', oid::regclass)
+        FROM pg_class
+        WHERE oid = ANY (CAST(:tables AS oid[])) AND relrowsecurity
+        UNION ALL
+        SELECT format('ALTER TABLE %s FORCE ROW LEVEL SECURITY', oid::regclass)
+        FROM pg_class
+        WHERE oid = ANY (CAST(:tables AS oid[])) AND relforcerowsecurity
+    """,
+    "policies": """
+        SELECT format(
+            'CREATE POLICY %I ON %I.%I AS %s FOR %s TO %s%s%s',
+            policyname,
+            schemaname,
+            tablename,
+            permissive,
+            cmd,
+            (
+                SELECT string_agg(CASE WHEN role = 'public' THEN 'PUBLIC' ELSE quote_ident(role) END, ', ')
+                FROM unnest(roles) role
+            ),
+            ' USING (' || qual || ')',
+            ' WITH CHECK (' || with_check || ')'
+        )
+        FROM pg_policies
+        WHERE format('%I.%I', schemaname, tablename)::regclass = ANY (CAST(:policy_tables AS oid[]))
+        ORDER BY tablename, policyname
+    """,
+    "grants": """
+        SELECT format(
+            'GRANT %s ON %s TO %s',
+            string_agg(acl.privilege_type, ', ' ORDER BY acl.privilege_type),
+            pg_class.oid::regclass,
+            CASE WHEN acl.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(acl.grantee)) END
+        )
+        FROM pg_class, aclexplode(pg_class.relacl) acl
+        WHERE pg_class.oid = ANY (CAST(:tables AS oid[])) AND acl.grantee <> pg_class.relowner
+        GROUP BY pg_class.oid, acl.grantee
+    """,
+}
+
+CREATE_PARTITIONS_FUNCTION = """
+    CREATE OR REPLACE FUNCTION tables.create_inspection_partitions(p_from timestamp, p_to timestamp)
+    RETURNS integer
+    LANGUAGE plpgsql
+    SET search_path = tables, pg_temp
+    AS $$
+    DECLARE
+        partition_start timestamp := date_trunc('month', p_from);
+        parent text;
+        partition_name text;
+        created integer := 0;
+    BEGIN
+        -- Параллельные вызовы из рабочих процессов приложения создают секции по очереди.
+        PERFORM pg_advisory_xact_lock(hashtext('tables.inspection_partitions'));
+        WHILE partition_start <= p_to LOOP
+            FOREACH parent IN ARRAY ARRAY['inspection_result', 'direction_result', 'topic_result'] LOOP
+                partition_name := parent || '_p' || to_char(partition_start, 'YYYYMM');
+                CONTINUE WHEN to_regclass(format('tables.%I', partition_name)) IS NOT NULL;
+                -- Пустая таблица присоединяется (ATTACH): родительская таблица блокируется в режиме
+                -- SHARE UPDATE EXCLUSIVE, а не ACCESS EXCLUSIVE, как при CREATE TABLE ... PARTITION OF. Но секции
+                -- direction_result и topic_result получают копию составного внешнего ключа, и таблица, на которую
+                -- он ссылается, блокируется в режиме SHARE ROW EXCLUSIVE. Этот режим конфликтует с записью,
+                -- поэтому секции создаются заранее командой maintain-partitions, а не при записи проверок.
+                EXECUTE format(
+                    'CREATE TABLE tables.%I (LIKE tables.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                    partition_name,
+                    parent
+                );
+                EXECUTE format(
+                    'ALTER TABLE tables.%I ATTACH PARTITION tables.%I FOR VALUES FROM (%L) TO (%L)',
+                    parent,
+                    partition_name,
+                    partition_start,
+                    partition_start + interval '1 month'
+                );
+                created := created + 1;
+            END LOOP;
+            partition_start := partition_start + interval '1 month';
+        END LOOP;
+        RETURN created;
+    END;
+    $$;
+
+    REVOKE ALL ON FUNCTION tables.create_inspection_partitions(timestamp, timestamp) FROM PUBLIC;
+"""
+
+# Архивация: секции месяца отсоединяются от всех трех таблиц (от потомков к родителю) и переносятся в схему archive.
+# Внешние ключи отсоединенных секций на рабочие таблицы удаляются: архив самодостаточен, его можно выгрузить
+# и удалить (DROP TABLE) без влияния на рабочие таблицы. Модель чтения latest_topic_result не изменяется.
+DETACH_PARTITIONS_FUNCTION = """
+    CREATE SCHEMA IF NOT EXISTS archive;
+
+    CREATE OR REPLACE FUNCTION tables.detach_inspection_partitions(p_before timestamp)
+    RETURNS integer
+    LANGUAGE plpgsql
+    SET search_path = tables, pg_temp
+    AS $$
+    DECLARE
+        suffix text;
+        parent text;
+        partition_name text;
+        constraint_name text;
+        detached integer := 0;
+    BEGIN
+        PERFORM pg_advisory_xact_lock(hashtext('tables.inspection_partitions'));
+        FOR suffix IN
+            SELECT substring(child.relname FROM '_p(\\d{6})$')
+            FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'tables.inspection_result'::regclass
+                AND child.relname ~ '^inspection_result_p\\d{6}$'
+                AND to_date(substring(child.relname FROM '_p(\\d{6})$'), 'YYYYMM') + interval '1 month' <= p_before
+            ORDER BY 1
+        LOOP
+            FOREACH parent IN ARRAY ARRAY['topic_result', 'direction_result', 'inspection_result'] LOOP
+                partition_name := parent || '_p' || suffix;
+                CONTINUE WHEN to_regclass(format('tables.%I', partition_name)) IS NULL;
+                EXECUTE format('ALTER TABLE tables.%I DETACH PARTITION tables.%I', parent, partition_name);
+                FOR constraint_name IN
+                    SELECT conname
+                    FROM pg_constraint
+                    WHERE conrelid = format('tables.%I', partition_name)::regclass
+                        AND contype = 'f'
+                        AND confrelid IN ('tables.inspection_result'::regclass, 'tables.direction_result'::regclass)
+                LOOP
+                    EXECUTE format('ALTER TABLE tables.%I DROP CONSTRAINT %I', partition_name, constraint_name);
+                END LOOP;
+                EXECUTE format('ALTER TABLE tables.%I SET SCHEMA archive', partition_name);
+            END LOOP;
+            detached := detached + 1;
+        END LOOP;
+        RETURN detached;
+    END;
+    $$;
+
+    REVOKE ALL ON FUNCTION tables.detach_inspection_partitions(timestamp) FROM PUBLIC;
+"""
+
+
+def capture() -> Dict[str, List[str]]:
+    """Команды пересоздания внешних ключей, индексов, триггеров, политик и прав таблиц дерева проверки."""
+    conn = op.get_bind()
+
+    def oids(tables: List[str]) -> List[int]:
+        return [conn.execute(sa.text(f"SELECT 'tables.{table}'::regclass::oid")).scalar_one() for table in tables]
+
+    params = {"tables": oids(TABLES), "policy_tables": oids(TABLES + DEPENDENT_POLICY_TABLES)}
+    return {name: conn.execute(sa.text(query), params).scalars().all() for name, query in CAPTURE_QUERIES.items()}
+
+
+def columns(table: str) -> List[str]:
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                """
+                SELECT quote_ident(column_name)
+                FROM information_schema.columns
+                WHERE table_schema = 'tables' AND table_name = :table
+                ORDER BY ordinal_position
+                """
+            ),
+            {"table": table},
+        )
+        .scalars()
+        .all()
+    )
+
+
+def rebuild(create_tables: str, copy_data, create_keys: str, saved: Dict[str, List[str]]):
+    """
+    Пересоздать таблицы дерева проверки: старые таблицы переименовываются, данные копируются в новые,
+    затем на новых таблицах создаются ключи и пересоздаются сохраненные объекты.
+    """
+    for table in DEPENDENT_POLICY_TABLES:
+        for (policy,) in op.get_bind().execute(
+            sa.text("SELECT policyname FROM pg_policies WHERE schemaname = 'tables' AND tablename = :table"),
+            {"table": table},
+        ):
+            op.execute(f'DROP POLICY "{policy}" ON tables.{table}')
+    for table in TABLES:
+        op.execute(f"ALTER TABLE tables.{table} RENAME TO {table}{OLD_SUFFIX}")
+
+    op.execute(create_tables)
+    copy_data()
+    for table in reversed(TABLES):
+        op.execute(f"DROP TABLE tables.{table}{OLD_SUFFIX}")
+
+    # Ключи и индексы строятся после загрузки данных: один проход по таблице вместо обновления на каждую строку.
+    op.execute(create_keys)
+    for name in ("foreign_keys", "indexes", "triggers", "row_security", "policies", "grants"):
+        for command in saved[name]:
+            op.execute(command)
+
+
+def upgrade() -> None:
+    # Таблицы дерева проверки секционируются по месяцам даты проверки (inspection_date). Дата копируется
+    # в результаты направлений и поднаправлений: ключ секционирования должен входить в первичный ключ,
+    # а внешние ключи между таблицами дерева становятся составными (id, inspection_date), поэтому результаты
+    # проверки лежат в секциях одного месяца и архивируются вместе с ней.
+    saved = capture()
+
+    def copy_data():
+        inspection_columns = columns(f"inspection_result{OLD_SUFFIX}")
+        inspection_values = [
+            "coalesce(inspection_date, created_date)" if column == "inspection_date" else column
+            for column in inspection_columns
+        ]
+        op.execute(
+            f"""
+            INSERT INTO tables.inspection_result ({", ".join(inspection_columns)})
+            SELECT {", ".join(inspection_values)} FROM tables.inspection_result{OLD_SUFFIX};
+            """
+        )
+        # Результаты, не привязанные к проверке (inspection_result_id/direction_result_id IS NULL), не переносятся:
+        # без даты проверки для них нет секции, а в API они недоступны.
+        direction_columns = columns(f"direction_result{OLD_SUFFIX}")
+        direction_values = [f"direction.{column}" for column in direction_columns]
+        op.execute(
+            f"""
+            INSERT INTO tables.direction_result ({", ".join(direction_columns)}, inspection_date)
+            SELECT {", ".join(direction_values)}, coalesce(inspection.inspection_date, inspection.created_date)
+            FROM tables.direction_result{OLD_SUFFIX} direction
+                JOIN tables.inspection_result{OLD_SUFFIX} inspection ON inspection.id = direction.inspection_result_id;
+            """
+        )
+        topic_columns = columns(f"topic_result{OLD_SUFFIX}")
+        topic_values = [f"topic.{column}" for column in topic_columns]
+        op.execute(
+            f"""
+            INSERT INTO tables.topic_result ({", ".join(topic_columns)}, inspection_date)
+            SELECT {", ".join(topic_values)}, coalesce(inspection.inspection_date, inspection.created_date)
+            FROM tables.topic_result{OLD_SUFFIX} topic
+                JOIN tables.direction_result{OLD_SUFFIX} direction ON direction.id = topic.direction_result_id
+                JOIN tables.inspection_result{OLD_SUFFIX} inspection ON inspection.id = direction.inspection_result_id;
+            """
+        )
+
+    rebuild(
+        f"""
+        CREATE TABLE tables.inspection_result (
+            LIKE tables.inspection_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        ) PARTITION BY RANGE (inspection_date);
+        ALTER TABLE tables.inspection_result ALTER COLUMN inspection_date SET NOT NULL;
+
+        CREATE TABLE tables.direction_result (
+            LIKE tables.direction_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            inspection_date timestamp without time zone NOT NULL
+        ) PARTITION BY RANGE (inspection_date);
+
+        CREATE TABLE tables.topic_result (
+            LIKE tables.topic_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            inspection_date timestamp without time zone NOT NULL
+        ) PARTITION BY RANGE (inspection_date);
+
+        {CREATE_PARTITIONS_FUNCTION}
+
+        SELECT tables.create_inspection_partitions(
+            coalesce(
+                (SELECT min(coalesce(inspection_date, created_date)) FROM tables.inspection_result{OLD_SUFFIX}),
+                localtimestamp
+            ),
+            localtimestamp + interval '{MONTHS_AHEAD} months'
+        );
+        """,
+        copy_data,
+        """
+        ALTER TABLE tables.inspection_result
+            ADD CONSTRAINT inspection_result_pkey PRIMARY KEY (id, inspection_date);
+        ALTER TABLE tables.direction_result
+            ADD CONSTRAINT direction_result_pkey PRIMARY KEY (id, inspection_date),
+            ADD CONSTRAINT direction_result_inspection_result_id_fkey
+                FOREIGN KEY (inspection_result_id, inspection_date) REFERENCES tables.inspection_result (id, inspection_date) ON UPDATE CASCADE ON DELETE CASCADE;
+        ALTER TABLE tables.topic_result
+            ADD CONSTRAINT topic_result_pkey PRIMARY KEY (id, inspection_date),
+            ADD CONSTRAINT topic_result_direction_result_id_fkey
+                FOREIGN KEY (direction_result_id, inspection_date) REFERENCES tables.direction_result (id, inspection_date) ON UPDATE CASCADE ON DELETE CASCADE;
+        """,
+        saved,
+    )
+    op.execute(DETACH_PARTITIONS_FUNCTION)
+
+
+def downgrade() -> None:
+    # Архивные секции (схема archive) в обычные таблицы не возвращаются: схема удаляется, только если она пуста.
+    saved = capture()
+
+    def copy_data():
+        for table in TABLES:
+            table_columns = [
+                column
+                for column in columns(f"{table}{OLD_SUFFIX}")
+                if table == "inspection_result" or column != "inspection_date"
+            ]
+            op.execute(
+                f"""
+                INSERT INTO tables.{table} ({", ".join(table_columns)})
+                SELECT {", ".join(table_columns)} FROM tables.{table}{OLD_SUFFIX};
+                """
+            )
+
+    rebuild(
+        f"""
+        CREATE TABLE tables.inspection_result (
+            LIKE tables.inspection_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        );
+        ALTER TABLE tables.inspection_result ALTER COLUMN inspection_date DROP NOT NULL;
+
+        CREATE TABLE tables.direction_result (
+            LIKE tables.direction_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        );
+        ALTER TABLE tables.direction_result DROP COLUMN inspection_date;
+
+        CREATE TABLE tables.topic_result (
+            LIKE tables.topic_result{OLD_SUFFIX} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        );
+        ALTER TABLE tables.topic_result DROP COLUMN inspection_date;
+        """,
+        copy_data,
+        """
+        ALTER TABLE tables.inspection_result ADD CONSTRAINT inspection_result_pkey PRIMARY KEY (id);
+        ALTER TABLE tables.direction_result
+            ADD CONSTRAINT direction_result_pkey PRIMARY KEY (id),
+            ADD CONSTRAINT direction_result_inspection_result_id_fkey FOREIGN KEY (inspection_result_id)
+                REFERENCES tables.inspection_result (id) ON DELETE CASCADE;
+        ALTER TABLE tables.topic_result
+            ADD CONSTRAINT topic_result_pkey PRIMARY KEY (id),
+            ADD CONSTRAINT topic_result_direction_result_id_fkey FOREIGN KEY (direction_result_id)
+                REFERENCES tables.direction_result (id) ON DELETE CASCADE;
+        """,
+        saved,
+    )
+    op.execute(
+        """
+        DROP FUNCTION IF EXISTS tables.detach_inspection_partitions(timestamp);
+        DROP FUNCTION IF EXISTS tables.create_inspection_partitions(timestamp, timestamp);
+        DROP SCHEMA IF EXISTS archive;
+        """
+    )
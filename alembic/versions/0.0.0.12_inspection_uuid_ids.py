@@ -0,0 +1,135 @@
+"""0.0.0.12_inspection_uuid_ids
+
+Revision ID: 0.0.0.12
+Revises: 0.0.0.11
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.12"
+down_revision: Union[str, None] = "0.0.0.11"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Столбцы идентификаторов записей дерева проверки (и их копии в модели чтения), переводимые в uuid
+COLUMNS = {
+    "inspection_result": ["id"],
+    "direction_result": ["id", "inspection_result_id"],
+    "topic_result": ["id", "direction_result_id"],
+    "latest_topic_result": ["topic_result_id", "inspection_result_id"],
+}
+# Первичные ключи со значением по умолчанию (до миграции - public.uuid_generate_v4())
+PRIMARY_KEYS = ["inspection_result", "direction_result", "topic_result"]
+
+FOREIGN_KEYS = {
+    "direction_result": (
+        "direction_result_inspection_result_id_fkey",
+        "FOREIGN KEY (inspection_result_id, inspection_date) REFERENCES tables.inspection_result (id, inspection_date) "
+        "ON UPDATE CASCADE ON DELETE CASCADE",
+    ),
+    "topic_result": (
+        "topic_result_direction_result_id_fkey",
+        "FOREIGN KEY (direction_result_id, inspection_date) REFERENCES tables.direction_result (id, inspection_date) "
+        "ON UPDATE CASCADE ON DELETE CASCADE",
+    ),
+}
+
+# Тип столбца нельзя изменить, пока он используется в условиях триггеров (WHEN) и политик RLS:
+# они пересоздаются по сохраненным определениям.
+CAPTURE_QUERIES = [
+    """
+    SELECT format('DROP TRIGGER %I ON %s', tgname, tgrelid::regclass), pg_get_triggerdef(oid)
+    FROM pg_trigger
+    WHERE tgrelid = ANY (CAST(:tables AS regclass[])) AND NOT tgisinternal AND tgparentid = 0
+    """,
+    """
+    SELECT
+        format('DROP POLICY %I ON %I.%I', policyname, schemaname, tablename),
+        format(
+            'CREATE POLICY %I ON %I.%I AS %s FOR %s TO %s%s%s',
+            policyname,
+            schemaname,
+            tablename,
+            permissive,
+            cmd,
+            (
+                SELECT string_agg(CASE WHEN role = 'public' THEN 'PUBLIC' ELSE quote_ident(role) END, ', ')
+                FROM unnest(roles) role
+            ),
+            ' USING (' || qual || ')',
+            ' WITH CHECK (' || with_check || ')'
+        )
+    FROM pg_policies
+    WHERE format('%I.%I', schemaname, tablename)::regclass = ANY (CAST(:tables AS regclass[]))
+    """,
+]
+
+# Существующие идентификаторы в формате UUID переносятся как есть, прочие (например, '1' в тестовых данных)
+# заменяются детерминированным UUID из MD5 исходного значения.
+LEGACY_UUID_FUNCTION = """
+    CREATE FUNCTION pg_temp.legacy_uuid(value text)
+    RETURNS uuid
+    LANGUAGE sql
+    IMMUTABLE
+    AS $$
+        SELECT CASE
+            WHEN value ~* '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$' THEN value::uuid
+            ELSE md5(value)::uuid
+        END;
+    $$;
+"""
+
+
+def change_type(column_type: str, using: str, default: str):
+    """
+    Изменить тип столбцов идентификаторов.
+
+    :param column_type: Новый тип
+    :param using: Выражение преобразования значения ({column} - имя столбца)
+    :param default: Значение по умолчанию первичных ключей (None - без значения по умолчанию)
+    """
+    conn = op.get_bind()
+    tables = [f"tables.{table}" for table in COLUMNS]
+    saved: List = []
+    for query in CAPTURE_QUERIES:
+        saved += conn.execute(sa.text(query), {"tables": tables}).all()
+    for drop, _ in saved:
+        op.execute(drop)
+    for table, (name, _) in FOREIGN_KEYS.items():
+        op.execute(f"ALTER TABLE tables.{table} DROP CONSTRAINT {name}")
+
+    # Секционированные таблицы: изменение распространяется на все секции (таблицы перезаписываются).
+    for table, columns in COLUMNS.items():
+        changes = [
+            f"ALTER COLUMN {column} TYPE {column_type} USING {using.format(column=column)}" for column in columns
+        ]
+        if table in PRIMARY_KEYS:
+            changes.insert(0, "ALTER COLUMN id DROP DEFAULT")
+            if default is not None:
+                changes.append(f"ALTER COLUMN id SET DEFAULT {default}")
+        op.execute(f"ALTER TABLE tables.{table} {', '.join(changes)}")
+
+    for table, (name, definition) in FOREIGN_KEYS.items():
+        op.execute(f"ALTER TABLE tables.{table} ADD CONSTRAINT {name} {definition}")
+    for _, create in saved:
+        op.execute(create)
+
+
+def upgrade() -> None:
+    # Идентификаторы создаются приложением (UUIDv7, app/common/ids.py), значения по умолчанию в БД нет:
+    # запись без идентификатора - ошибка. uuid хранится в 16 байтах вместо 37 у текста.
+    op.execute(LEGACY_UUID_FUNCTION)
+    change_type("uuid", "pg_temp.legacy_uuid({column})", None)
+    op.execute("DROP FUNCTION pg_temp.legacy_uuid(text)")
+
+
+def downgrade() -> None:
+    # Исходные значения идентификаторов, замененных при миграции на UUID из MD5, не восстанавливаются.
+    change_type("text", "{column}::text", "public.uuid_generate_v4()")
@@ -0,0 +1,376 @@
+"""0.0.0.13_grade_rollup
+
+Revision ID: 0.0.0.13
+Revises: 0.0.0.12
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.13"
+down_revision: Union[str, None] = "0.0.0.12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Видимость агрегатов повторяет видимость проверок (политики RLS tables.inspection_result, миграция 0.0.0.8).
+OWN_POLICY = "(inspection_organ_id = ANY ((SELECT tables.current_user_organ_ids())::text[]))"
+CHILDREN_POLICY = "(inspection_organ_id = ANY ((SELECT tables.current_user_visible_organ_ids())::text[]))"
+POLICIES = [
+    ("rls_crud_own_io", OWN_POLICY),
+    ("rls_select_children_io", CHILDREN_POLICY),
+    ("rls_select_own_io", OWN_POLICY),
+]
+
+
+def fill_rollup(condition: str) -> str:
+    """
+    SQL заполнения агрегатов по базовым таблицам: общие оценки проверок и оценки по направлениям.
+
+    :param condition: Условие отбора проверок ({table} - псевдоним таблицы с датой проверки: ir или dr).
+        Условие на дату задается для обеих таблиц: диапазон не переносится через соединение по дате,
+        без него секции direction_result не отсекаются.
+    :return: Операторы INSERT
+    """
+    return f"""
+        INSERT INTO tables.grade_rollup
+            (month, inspection_organ_id, inspection_target_type_id, direction_id, grade, result_count, grade_sum)
+        SELECT
+            date_trunc('month', ir.inspection_date)::date,
+            ir.inspection_organ_id,
+            target.type_id,
+            NULL,
+            floor(ir.grade + 0.5),
+            count(*),
+            sum(ir.grade)
+        FROM tables.inspection_result ir
+            LEFT JOIN tables.inspection_target target ON target.id = ir.inspection_target_id
+        WHERE ir.grade IS NOT NULL AND ir.inspection_organ_id IS NOT NULL AND {condition.format(table="ir")}
+        GROUP BY 1, 2, 3, 5;
+
+        INSERT INTO tables.grade_rollup
+            (month, inspection_organ_id, inspection_target_type_id, direction_id, grade, result_count, grade_sum)
+        SELECT
+            date_trunc('month', dr.inspection_date)::date,
+            ir.inspection_organ_id,
+            target.type_id,
+            dr.direction_id,
+            floor(dr.grade + 0.5),
+            count(*),
+            sum(dr.grade)
+        FROM tables.direction_result dr
+            JOIN tables.inspection_result ir
+                ON ir.id = dr.inspection_result_id AND ir.inspection_date = dr.inspection_date
+            LEFT JOIN tables.inspection_target target ON target.id = ir.inspection_target_id
+        WHERE dr.grade IS NOT NULL
+            AND dr.direction_id IS NOT NULL
+            AND ir.inspection_organ_id IS NOT NULL
+            AND {condition.format(table="ir")}
+            AND {condition.format(table="dr")}
+        GROUP BY 1, 2, 3, 4, 5;
+    """
+
+
+# Группа (месяц, орган) из очереди и полное перестроение, начиная с месяца month_from
+GROUP_CONDITION = (
+    "ir.inspection_organ_id = dirty.inspection_organ_id"
+    " AND {table}.inspection_date >= dirty.month"
+    " AND {table}.inspection_date < dirty.month + interval '1 month'"
+)
+REBUILD_CONDITION = "{table}.inspection_date >= month_from"
+
+
+def upgrade() -> None:
+    # Агрегаты оценок: количество и сумма оценок по месяцу проверки, проверяющему органу, типу проверяемого субъекта,
+    # направлению (NULL - общая оценка проверки) и оценке, округленной до целого (значения шкал).
+    # Строки хранятся по органам, поддеревья иерархии суммируются при чтении по inspection_organ_closure.
+    op.create_table(
+        "grade_rollup",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("inspection_organ_id", sa.Text(), nullable=False),
+        sa.Column("inspection_target_type_id", sa.Text(), nullable=True),
+        sa.Column("direction_id", sa.Text(), nullable=True),
+        sa.Column("grade", sa.Float(), nullable=False),
+        sa.Column("result_count", sa.BigInteger(), nullable=False),
+        sa.Column("grade_sum", sa.Float(), nullable=False),
+        schema="tables",
+    )
+    op.create_index(
+        "ix_grade_rollup_inspection_organ_id_month", "grade_rollup", ["inspection_organ_id", "month"], schema="tables"
+    )
+
+    # Очередь групп (месяц, орган), агрегаты которых нужно пересчитать. Только вставка из триггеров,
+    # без ограничений уникальности: параллельные записи проверок не ждут друг друга.
+    op.create_table(
+        "grade_rollup_queue",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("inspection_organ_id", sa.Text(), nullable=False),
+        schema="tables",
+    )
+
+    # Пересчет групп из очереди. Группа пересчитывается целиком по базовым таблицам (секции одного месяца,
+    # индекс по органу), поэтому агрегаты не накапливают расхождений. Строки очереди, добавленные после
+    # ее чтения, остаются до следующего пересчета.
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION tables.refresh_grade_rollup()
+        RETURNS bigint
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            refreshed bigint;
+            dirty record;
+        BEGIN
+            -- Пересчеты из нескольких процессов выполняются по очереди.
+            PERFORM pg_advisory_xact_lock(hashtext('tables.grade_rollup'));
+
+            CREATE TEMPORARY TABLE grade_rollup_dirty ON COMMIT DROP AS
+            WITH taken AS (
+                DELETE FROM tables.grade_rollup_queue RETURNING month, inspection_organ_id
+            )
+            SELECT DISTINCT month, inspection_organ_id FROM taken;
+            GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+            -- По одной группе: условия на орган и месяц - значения, а не соединение с очередью,
+            -- поэтому секции других месяцев отсекаются, проверки органа читаются по индексу.
+            FOR dirty IN SELECT month, inspection_organ_id FROM grade_rollup_dirty LOOP
+                DELETE FROM tables.grade_rollup
+                WHERE month = dirty.month AND inspection_organ_id = dirty.inspection_organ_id;
+
+                {fill_rollup(GROUP_CONDITION)}
+            END LOOP;
+
+            DROP TABLE grade_rollup_dirty;
+            RETURN refreshed;
+        END;
+        $$;
+        """
+    )
+
+    # Полное перестроение (первичное заполнение и восстановление). Агрегаты месяцев до p_from сохраняются:
+    # секции архивированных месяцев (detach_inspection_partitions) в пересчет не попадают.
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION tables.rebuild_grade_rollup(p_from date DEFAULT NULL)
+        RETURNS bigint
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            rollup_rows bigint;
+            month_from date := date_trunc('month', coalesce(p_from, '-infinity'::date));
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('tables.grade_rollup'));
+            DELETE FROM tables.grade_rollup_queue;
+            DELETE FROM tables.grade_rollup WHERE month >= month_from;
+
+            {fill_rollup(REBUILD_CONDITION)}
+
+            SELECT count(*) INTO rollup_rows FROM tables.grade_rollup;
+            RETURN rollup_rows;
+        END;
+        $$;
+        """
+    )
+
+    # Триггеры уровня оператора с таблицами переходов: одна вставка в очередь на оператор,
+    # в том числе для пакетной записи и пересчета оценок.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.grade_rollup_on_inspection_result()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', inspection_date)::date, inspection_organ_id
+                FROM new_rows
+                WHERE inspection_organ_id IS NOT NULL;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', inspection_date)::date, inspection_organ_id
+                FROM old_rows
+                WHERE inspection_organ_id IS NOT NULL;
+            ELSE
+                -- Изменения оценки, органа, субъекта или даты проверки: старая и новая группы.
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', changed.inspection_date)::date, changed.inspection_organ_id
+                FROM old_rows
+                    JOIN new_rows ON new_rows.id = old_rows.id
+                    CROSS JOIN LATERAL (
+                        VALUES
+                            (old_rows.inspection_date, old_rows.inspection_organ_id),
+                            (new_rows.inspection_date, new_rows.inspection_organ_id)
+                    ) changed (inspection_date, inspection_organ_id)
+                WHERE (
+                        old_rows.grade,
+                        old_rows.inspection_organ_id,
+                        old_rows.inspection_target_id,
+                        old_rows.inspection_date
+                    ) IS DISTINCT FROM (
+                        new_rows.grade,
+                        new_rows.inspection_organ_id,
+                        new_rows.inspection_target_id,
+                        new_rows.inspection_date
+                    )
+                    AND changed.inspection_organ_id IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION tables.grade_rollup_on_direction_result()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        BEGIN
+            -- Группа определяется по проверке. При каскадном удалении проверка уже не видна,
+            -- группу ставит в очередь триггер inspection_result.
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', ir.inspection_date)::date, ir.inspection_organ_id
+                FROM new_rows
+                    JOIN tables.inspection_result ir
+                        ON ir.id = new_rows.inspection_result_id AND ir.inspection_date = new_rows.inspection_date
+                WHERE new_rows.grade IS NOT NULL AND ir.inspection_organ_id IS NOT NULL;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', ir.inspection_date)::date, ir.inspection_organ_id
+                FROM old_rows
+                    JOIN tables.inspection_result ir
+                        ON ir.id = old_rows.inspection_result_id AND ir.inspection_date = old_rows.inspection_date
+                WHERE old_rows.grade IS NOT NULL AND ir.inspection_organ_id IS NOT NULL;
+            ELSE
+                INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+                SELECT DISTINCT date_trunc('month', ir.inspection_date)::date, ir.inspection_organ_id
+                FROM old_rows
+                    JOIN new_rows ON new_rows.id = old_rows.id
+                    CROSS JOIN LATERAL (
+                        VALUES
+                            (old_rows.inspection_result_id, old_rows.inspection_date),
+                            (new_rows.inspection_result_id, new_rows.inspection_date)
+                    ) changed (inspection_result_id, inspection_date)
+                    JOIN tables.inspection_result ir
+                        ON ir.id = changed.inspection_result_id AND ir.inspection_date = changed.inspection_date
+                WHERE (old_rows.grade, old_rows.direction_id, old_rows.inspection_result_id, old_rows.inspection_date)
+                    IS DISTINCT FROM
+                    (new_rows.grade, new_rows.direction_id, new_rows.inspection_result_id, new_rows.inspection_date)
+                    AND ir.inspection_organ_id IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION tables.grade_rollup_on_inspection_target()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        BEGIN
+            -- Смена типа субъекта: все группы с его проверками.
+            INSERT INTO tables.grade_rollup_queue (month, inspection_organ_id)
+            SELECT DISTINCT date_trunc('month', ir.inspection_date)::date, ir.inspection_organ_id
+            FROM old_rows
+                JOIN new_rows ON new_rows.id = old_rows.id
+                JOIN tables.inspection_result ir ON ir.inspection_target_id = new_rows.id
+            WHERE old_rows.type_id IS DISTINCT FROM new_rows.type_id AND ir.inspection_organ_id IS NOT NULL;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER grade_rollup_insert
+        AFTER INSERT ON tables.inspection_result
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_inspection_result();
+
+        CREATE TRIGGER grade_rollup_update
+        AFTER UPDATE ON tables.inspection_result
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_inspection_result();
+
+        CREATE TRIGGER grade_rollup_delete
+        AFTER DELETE ON tables.inspection_result
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_inspection_result();
+
+        CREATE TRIGGER grade_rollup_insert
+        AFTER INSERT ON tables.direction_result
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_direction_result();
+
+        CREATE TRIGGER grade_rollup_update
+        AFTER UPDATE ON tables.direction_result
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_direction_result();
+
+        CREATE TRIGGER grade_rollup_delete
+        AFTER DELETE ON tables.direction_result
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_direction_result();
+
+        CREATE TRIGGER grade_rollup_update
+        AFTER UPDATE ON tables.inspection_target
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION tables.grade_rollup_on_inspection_target();
+        """
+    )
+
+    op.execute("ALTER TABLE tables.grade_rollup ENABLE ROW LEVEL SECURITY;")
+    for role, using in POLICIES:
+        op.execute(
+            f"""
+            CREATE POLICY {role}
+            ON tables.grade_rollup
+            AS PERMISSIVE
+            FOR SELECT
+            TO {role}
+            USING {using};
+            """
+        )
+    op.execute(
+        """
+        GRANT SELECT ON tables.grade_rollup TO perm_inspection_result_crud;
+        GRANT SELECT ON tables.grade_rollup TO perm_inspection_result_select;
+        -- Пересчет очереди доступен всем (фоновый поток выполняет его от имени логина пула),
+        -- полное перестроение - только владельцу.
+        REVOKE ALL ON FUNCTION tables.rebuild_grade_rollup(date) FROM PUBLIC;
+        """
+    )
+
+    op.execute("SELECT tables.rebuild_grade_rollup();")
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP TRIGGER IF EXISTS grade_rollup_insert ON tables.inspection_result;
+        DROP TRIGGER IF EXISTS grade_rollup_update ON tables.inspection_result;
+        DROP TRIGGER IF EXISTS grade_rollup_delete ON tables.inspection_result;
+        DROP TRIGGER IF EXISTS grade_rollup_insert ON tables.direction_result;
+        DROP TRIGGER IF EXISTS grade_rollup_update ON tables.direction_result;
+        DROP TRIGGER IF EXISTS grade_rollup_delete ON tables.direction_result;
+        DROP TRIGGER IF EXISTS grade_rollup_update ON tables.inspection_target;
+
+        DROP FUNCTION IF EXISTS tables.grade_rollup_on_inspection_result();
+        DROP FUNCTION IF EXISTS tables.grade_rollup_on_direction_result();
+        DROP FUNCTION IF EXISTS tables.grade_rollup_on_inspection_target();
+        DROP FUNCTION IF EXISTS tables.rebuild_grade_rollup(date);
+        DROP FUNCTION IF EXISTS tables.refresh_grade_rollup();
+                """
+    )
+    op.drop_table("grade_rollup_queue", schema="tables")
+    op.drop_table("grade_rollup", schema="tables")
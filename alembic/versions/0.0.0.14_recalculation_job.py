@@ -0,0 +1,64 @@
+"""0.0.0.14_recalculation_job
+
+Revision ID: 0.0.0.14
+Revises: 0.0.0.13
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.14"
+down_revision: Union[str, None] = "0.0.0.13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Задания пересчета оценок сохраненных проверок (команда recalculate-grades и POST /api/inspections/recalculate/).
+    # Ход выполнения записывается после каждой пачки в той же транзакции, что и оценки пачки, поэтому он виден
+    # из любого рабочего процесса и совпадает с записанными оценками.
+    op.create_table(
+        "recalculation_job",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("strategy", sa.Text(), nullable=True),
+        sa.Column("inspection_target_type_id", sa.Text(), nullable=True),
+        sa.Column("status", sa.Text(), server_default="queued", nullable=False),
+        sa.Column("processed", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("changed", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("failed", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_by", sa.Text(), server_default=sa.text("current_user"), nullable=False),
+        sa.Column("created_date", sa.DateTime(), server_default=sa.text("localtimestamp"), nullable=False),
+        sa.Column("updated_date", sa.DateTime(), server_default=sa.text("localtimestamp"), nullable=False),
+        sa.CheckConstraint("status IN ('queued', 'running', 'done', 'failed')", name="ck_recalculation_job_status"),
+        sa.PrimaryKeyConstraint("id"),
+        schema="tables",
+    )
+
+    # Пересчет изменяет оценки всех доступных пользователю проверок, поэтому задания создают и просматривают
+    # только члены отдельной роли. Права на сами проверки роль не дает (perm_inspection_result_crud и RLS),
+    # проверяемые субъекты читаются для отбора проверок по типу субъекта.
+    op.execute(
+        """
+        CREATE ROLE perm_grade_recalculation;
+        GRANT SELECT, INSERT, UPDATE ON tables.recalculation_job TO perm_grade_recalculation;
+        GRANT SELECT ON tables.inspection_target TO perm_grade_recalculation;
+        GRANT perm_grade_recalculation TO role_super_operator;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("recalculation_job", schema="tables")
+    op.execute(
+        """
+        REVOKE SELECT ON tables.inspection_target FROM perm_grade_recalculation;
+        DROP ROLE perm_grade_recalculation;
+        """
+    )
@@ -0,0 +1,29 @@
+"""0.0.0.15_inspection_files_index
+
+Revision ID: 0.0.0.15
+Revises: 0.0.0.14
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.15"
+down_revision: Union[str, None] = "0.0.0.14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Поиск проверок, ссылающихся на файл вложения (files::jsonb @> '["<ключ>"]'), при его скачивании.
+    op.execute(
+        "CREATE INDEX ix_inspection_result_files ON tables.inspection_result USING gin ((files::jsonb) jsonb_path_ops);"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS tables.ix_inspection_result_files;")
@@ -0,0 +1,67 @@
+"""0.0.0.3_refs_change_notify
+
+Revision ID: 0.0.0.3
+Revises: 0.0.0.2
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.config import REFS_CACHE_CHANNEL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.3"
+down_revision: Union[str, None] = "0.0.0.2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблицы, изменение которых должно сбрасывать кэш справочников приложения.
+NOTIFY_TABLES = [
+    "refs.scale",
+    "refs.grade",
+    "refs.direction",
+    "refs.topic",
+    "refs.inspection_target_type",
+    "refs.inspection_target_type_direction_rel",
+    "refs.inspection_target_type_topic_rel",
+    "refs.grade_criteria_direction",
+    "refs.grade_criteria_topic",
+    "tables.inspection_target",
+]
+
+
+def upgrade() -> None:
+    # Канал уведомлений - аргумент триггеров, он совпадает с REFS_CACHE_CHANNEL приложения на момент миграции.
+    # При изменении REFS_CACHE_CHANNEL триггеры нужно пересоздать, расхождение слушатель кэша пишет в лог.
+    channel = REFS_CACHE_CHANNEL.replace("'", "''")
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION refs.notify_refs_changed()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            PERFORM pg_notify(TG_ARGV[0], TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+    for table in NOTIFY_TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER notify_refs_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION refs.notify_refs_changed('{channel}');
+            """
+        )
+
+
+def downgrade() -> None:
+    for table in NOTIFY_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS notify_refs_changed ON {table};")
+    op.execute("DROP FUNCTION IF EXISTS refs.notify_refs_changed();")
@@ -0,0 +1,33 @@
+"""0.0.0.4_inspection_result_keyset_index
+
+Revision ID: 0.0.0.4
+Revises: 0.0.0.3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.4"
+down_revision: Union[str, None] = "0.0.0.3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс для постраничного вывода по курсору (created_date, id) в порядке убывания.
+    op.create_index(
+        "ix_inspection_result_created_date_id",
+        "inspection_result",
+        [sa.text("created_date DESC"), sa.text("id DESC")],
+        schema="tables",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inspection_result_created_date_id", table_name="inspection_result", schema="tables")
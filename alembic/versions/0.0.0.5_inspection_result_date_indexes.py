@@ -0,0 +1,32 @@
+"""0.0.0.5_inspection_result_date_indexes
+
+Revision ID: 0.0.0.5
+Revises: 0.0.0.4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.5"
+down_revision: Union[str, None] = "0.0.0.4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Диапазоны по created_date обслуживает ix_inspection_result_created_date_id (0.0.0.4).
+    op.create_index(
+        "ix_inspection_result_inspection_date",
+        "inspection_result",
+        ["inspection_date"],
+        schema="tables",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inspection_result_inspection_date", table_name="inspection_result", schema="tables")
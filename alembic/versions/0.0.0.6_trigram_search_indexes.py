@@ -0,0 +1,37 @@
+"""0.0.0.6_trigram_search_indexes
+
+Revision ID: 0.0.0.6
+Revises: 0.0.0.5
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.6"
+down_revision: Union[str, None] = "0.0.0.5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, столбец) - триграммные индексы для ILIKE '%...%' и similarity()
+TRGM_INDEXES = [
+    ("ix_inspection_result_name_trgm", "inspection_result", "name"),
+    ("ix_inspection_result_description_trgm", "inspection_result", "description"),
+    ("ix_direction_result_description_trgm", "direction_result", "description"),
+    ("ix_topic_result_description_trgm", "topic_result", "description"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;")
+    for index_name, table, column in TRGM_INDEXES:
+        op.execute(f"CREATE INDEX {index_name} ON tables.{table} USING gin ({column} public.gin_trgm_ops);")
+
+
+def downgrade() -> None:
+    for index_name, _, _ in TRGM_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS tables.{index_name};")
@@ -0,0 +1,346 @@
+"""0.0.0.7_latest_topic_result
+
+Revision ID: 0.0.0.7
+Revises: 0.0.0.6
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.7"
+down_revision: Union[str, None] = "0.0.0.6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Модель чтения: последний результат по каждому поднаправлению для каждого проверяемого субъекта
+    # в разрезе проверяющих органов. Видимость проверок (RLS) определяется органом, поэтому последний видимый
+    # пользователю результат - самый поздний из записей видимых ему органов (см. InspectionDB).
+    op.create_table(
+        "latest_topic_result",
+        sa.Column("inspection_target_id", sa.Text(), nullable=False),
+        sa.Column("topic_id", sa.Text(), nullable=False),
+        sa.Column("inspection_organ_id", sa.Text(), nullable=True),
+        sa.Column("topic_result_id", sa.Text(), nullable=False),
+        sa.Column("inspection_result_id", sa.Text(), nullable=False),
+        sa.Column("grade", sa.Float(), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("created_date", sa.DateTime(), nullable=False),
+        schema="tables",
+    )
+    # Проверки без органа - отдельная группа: ключ уникален с учетом NULL.
+    op.create_index(
+        "ux_latest_topic_result_key",
+        "latest_topic_result",
+        ["inspection_target_id", "topic_id", "inspection_organ_id"],
+        unique=True,
+        schema="tables",
+        postgresql_nulls_not_distinct=True,
+    )
+    op.create_index(
+        "ix_latest_topic_result_topic_result_id", "latest_topic_result", ["topic_result_id"], schema="tables"
+    )
+    op.create_index(
+        "ix_latest_topic_result_inspection_result_id", "latest_topic_result", ["inspection_result_id"], schema="tables"
+    )
+
+    # Пересчет одной записи модели чтения по базовым таблицам. Существующая запись блокируется до пересчета:
+    # параллельная вставка результата (триггер ниже) ждет ее, а пересчет видит все зафиксированные до блокировки
+    # результаты. Новая запись вставляется через ON CONFLICT: параллельно вставленная более поздняя не заменяется.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.refresh_latest_topic_result(
+            p_inspection_target_id text, p_topic_id text, p_inspection_organ_id text
+        )
+        RETURNS void
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            locked boolean;
+            latest record;
+        BEGIN
+            PERFORM 1 FROM tables.latest_topic_result
+            WHERE inspection_target_id = p_inspection_target_id
+                AND topic_id = p_topic_id
+                AND inspection_organ_id IS NOT DISTINCT FROM p_inspection_organ_id
+            FOR UPDATE;
+            locked := FOUND;
+
+            SELECT tr.id AS topic_result_id, ir.id AS inspection_result_id, tr.grade, tr.description, ir.created_date
+            INTO latest
+            FROM tables.topic_result tr
+                JOIN tables.direction_result dr ON dr.id = tr.direction_result_id
+                JOIN tables.inspection_result ir ON ir.id = dr.inspection_result_id
+            WHERE ir.inspection_target_id = p_inspection_target_id
+                AND tr.topic_id = p_topic_id
+                AND ir.inspection_organ_id IS NOT DISTINCT FROM p_inspection_organ_id
+            ORDER BY ir.created_date DESC, tr.id DESC
+            LIMIT 1;
+
+            IF NOT FOUND THEN
+                DELETE FROM tables.latest_topic_result
+                WHERE inspection_target_id = p_inspection_target_id
+                    AND topic_id = p_topic_id
+                    AND inspection_organ_id IS NOT DISTINCT FROM p_inspection_organ_id;
+                RETURN;
+            END IF;
+
+            INSERT INTO tables.latest_topic_result AS stored
+                (
+                    inspection_target_id, topic_id, inspection_organ_id,
+                    topic_result_id, inspection_result_id, grade, description, created_date
+                )
+            VALUES (
+                p_inspection_target_id, p_topic_id, p_inspection_organ_id,
+                latest.topic_result_id, latest.inspection_result_id,
+                latest.grade, latest.description, latest.created_date
+            )
+            ON CONFLICT (inspection_target_id, topic_id, inspection_organ_id) DO UPDATE
+            SET topic_result_id = EXCLUDED.topic_result_id,
+                inspection_result_id = EXCLUDED.inspection_result_id,
+                grade = EXCLUDED.grade,
+                description = EXCLUDED.description,
+                created_date = EXCLUDED.created_date
+            WHERE locked
+                OR (EXCLUDED.created_date, EXCLUDED.topic_result_id) >= (stored.created_date, stored.topic_result_id);
+        END;
+        $$;
+        """
+    )
+
+    # Полное перестроение (первичное заполнение и восстановление)
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.rebuild_latest_topic_result()
+        RETURNS bigint
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            inserted bigint;
+        BEGIN
+            LOCK TABLE tables.latest_topic_result IN EXCLUSIVE MODE;
+            DELETE FROM tables.latest_topic_result;
+
+            INSERT INTO tables.latest_topic_result
+                (
+                    inspection_target_id, topic_id, inspection_organ_id,
+                    topic_result_id, inspection_result_id, grade, description, created_date
+                )
+            SELECT DISTINCT ON (ir.inspection_target_id, tr.topic_id, ir.inspection_organ_id)
+                ir.inspection_target_id, tr.topic_id, ir.inspection_organ_id,
+                tr.id, ir.id, tr.grade, tr.description, ir.created_date
+            FROM tables.topic_result tr
+                JOIN tables.direction_result dr ON dr.id = tr.direction_result_id
+                JOIN tables.inspection_result ir ON ir.id = dr.inspection_result_id
+            WHERE ir.inspection_target_id IS NOT NULL AND tr.topic_id IS NOT NULL
+            ORDER BY ir.inspection_target_id, tr.topic_id, ir.inspection_organ_id, ir.created_date DESC, tr.id DESC;
+
+            GET DIAGNOSTICS inserted = ROW_COUNT;
+            RETURN inserted;
+        END;
+        $$;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.latest_topic_result_on_topic_result()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            key record;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                -- Новый результат заменяет текущий, только если он более поздний.
+                INSERT INTO tables.latest_topic_result AS latest
+                    (
+                        inspection_target_id, topic_id, inspection_organ_id,
+                        topic_result_id, inspection_result_id, grade, description, created_date
+                    )
+                SELECT ir.inspection_target_id, NEW.topic_id, ir.inspection_organ_id,
+                    NEW.id, ir.id, NEW.grade, NEW.description, ir.created_date
+                FROM tables.direction_result dr
+                    JOIN tables.inspection_result ir ON ir.id = dr.inspection_result_id
+                WHERE dr.id = NEW.direction_result_id
+                    AND ir.inspection_target_id IS NOT NULL
+                    AND NEW.topic_id IS NOT NULL
+                ON CONFLICT (inspection_target_id, topic_id, inspection_organ_id) DO UPDATE
+                SET topic_result_id = EXCLUDED.topic_result_id,
+                    inspection_result_id = EXCLUDED.inspection_result_id,
+                    grade = EXCLUDED.grade,
+                    description = EXCLUDED.description,
+                    created_date = EXCLUDED.created_date
+                WHERE (EXCLUDED.created_date, EXCLUDED.topic_result_id) > (latest.created_date, latest.topic_result_id);
+                RETURN NULL;
+            END IF;
+
+            -- UPDATE и DELETE: пересчитать запись, которая ссылалась на старую версию строки.
+            -- Родительские строки при каскадном удалении уже не видны, поэтому ключ берется из модели чтения.
+            FOR key IN
+                SELECT inspection_target_id, topic_id, inspection_organ_id
+                FROM tables.latest_topic_result
+                WHERE topic_result_id = OLD.id
+            LOOP
+                PERFORM tables.refresh_latest_topic_result(
+                    key.inspection_target_id, key.topic_id, key.inspection_organ_id
+                );
+            END LOOP;
+
+            IF TG_OP = 'UPDATE' AND NEW.topic_id IS NOT NULL THEN
+                FOR key IN
+                    SELECT ir.inspection_target_id, ir.inspection_organ_id
+                    FROM tables.direction_result dr
+                        JOIN tables.inspection_result ir ON ir.id = dr.inspection_result_id
+                    WHERE dr.id = NEW.direction_result_id AND ir.inspection_target_id IS NOT NULL
+                LOOP
+                    PERFORM tables.refresh_latest_topic_result(
+                        key.inspection_target_id, NEW.topic_id, key.inspection_organ_id
+                    );
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.latest_topic_result_on_direction_result()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            key record;
+        BEGIN
+            -- Перенос результата направления в другую проверку
+            FOR key IN
+                SELECT latest.inspection_target_id, latest.topic_id, latest.inspection_organ_id
+                FROM tables.latest_topic_result latest
+                    JOIN tables.topic_result tr ON tr.id = latest.topic_result_id
+                WHERE tr.direction_result_id = NEW.id
+                UNION
+                SELECT ir.inspection_target_id, tr.topic_id, ir.inspection_organ_id
+                FROM tables.topic_result tr
+                    JOIN tables.inspection_result ir ON ir.id = NEW.inspection_result_id
+                WHERE tr.direction_result_id = NEW.id
+                    AND ir.inspection_target_id IS NOT NULL
+                    AND tr.topic_id IS NOT NULL
+            LOOP
+                PERFORM tables.refresh_latest_topic_result(
+                    key.inspection_target_id, key.topic_id, key.inspection_organ_id
+                );
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.latest_topic_result_on_inspection_result()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        DECLARE
+            key record;
+        BEGIN
+            -- Изменение проверяемого субъекта, проверяющего органа или даты проверки
+            FOR key IN
+                SELECT latest.inspection_target_id, latest.topic_id, latest.inspection_organ_id
+                FROM tables.latest_topic_result latest
+                WHERE latest.inspection_result_id = NEW.id
+                UNION
+                SELECT NEW.inspection_target_id, tr.topic_id, NEW.inspection_organ_id
+                FROM tables.direction_result dr
+                    JOIN tables.topic_result tr ON tr.direction_result_id = dr.id
+                WHERE dr.inspection_result_id = NEW.id
+                    AND NEW.inspection_target_id IS NOT NULL
+                    AND tr.topic_id IS NOT NULL
+            LOOP
+                PERFORM tables.refresh_latest_topic_result(
+                    key.inspection_target_id, key.topic_id, key.inspection_organ_id
+                );
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER latest_topic_result
+        AFTER INSERT OR UPDATE OR DELETE ON tables.topic_result
+        FOR EACH ROW EXECUTE FUNCTION tables.latest_topic_result_on_topic_result();
+
+        CREATE TRIGGER latest_topic_result
+        AFTER UPDATE OF inspection_result_id ON tables.direction_result
+        FOR EACH ROW WHEN (OLD.inspection_result_id IS DISTINCT FROM NEW.inspection_result_id)
+        EXECUTE FUNCTION tables.latest_topic_result_on_direction_result();
+
+        CREATE TRIGGER latest_topic_result
+        AFTER UPDATE OF inspection_target_id, inspection_organ_id, created_date ON tables.inspection_result
+        FOR EACH ROW WHEN (
+            OLD.inspection_target_id IS DISTINCT FROM NEW.inspection_target_id
+            OR OLD.inspection_organ_id IS DISTINCT FROM NEW.inspection_organ_id
+            OR OLD.created_date IS DISTINCT FROM NEW.created_date
+        )
+        EXECUTE FUNCTION tables.latest_topic_result_on_inspection_result();
+        """
+    )
+
+    # Видимость записей модели чтения повторяет видимость проверок (RLS tables.inspection_result):
+    # запись видна, если видна проверка ее результата, т.е. проверки ее органа.
+    op.execute(
+        """
+        ALTER TABLE tables.latest_topic_result ENABLE ROW LEVEL SECURITY;
+
+        CREATE POLICY latest_topic_result_visible_io
+        ON tables.latest_topic_result
+        AS PERMISSIVE
+        FOR SELECT
+        USING (EXISTS (SELECT 1 FROM tables.inspection_result ir WHERE ir.id = inspection_result_id));
+
+        GRANT SELECT ON tables.latest_topic_result TO perm_inspection_result_crud;
+        GRANT SELECT ON tables.latest_topic_result TO perm_inspection_result_select;
+        """
+    )
+
+    op.execute("SELECT tables.rebuild_latest_topic_result();")
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP TRIGGER IF EXISTS latest_topic_result ON tables.topic_result;
+        DROP TRIGGER IF EXISTS latest_topic_result ON tables.direction_result;
+        DROP TRIGGER IF EXISTS latest_topic_result ON tables.inspection_result;
+
+        DROP FUNCTION IF EXISTS tables.latest_topic_result_on_topic_result();
+        DROP FUNCTION IF EXISTS tables.latest_topic_result_on_direction_result();
+        DROP FUNCTION IF EXISTS tables.latest_topic_result_on_inspection_result();
+        DROP FUNCTION IF EXISTS tables.rebuild_latest_topic_result();
+        DROP FUNCTION IF EXISTS tables.refresh_latest_topic_result(text, text, text);
+        """
+    )
+    op.drop_table("latest_topic_result", schema="tables")
@@ -0,0 +1,218 @@
+"""0.0.0.8_inspection_organ_closure
+
+Revision ID: 0.0.0.8
+Revises: 0.0.0.7
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.8"
+down_revision: Union[str, None] = "0.0.0.7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Проверяющий орган текущего пользователя: орган, path которого совпадает с именем роли-субъекта (член is_subject),
+# в которую непосредственно входит CURRENT_USER. Условие перенесено из исходных политик без изменений.
+CURRENT_USER_SUBJECT = """
+    SELECT pg_roles.rolname
+    FROM (pg_auth_members mem
+        JOIN pg_roles ON ((pg_roles.oid = mem.member)))
+    WHERE ((mem.member IN ( SELECT pg_auth_members.roleid
+            FROM pg_auth_members
+            WHERE (pg_auth_members.member = ( SELECT pg_roles_1.oid
+                FROM pg_roles pg_roles_1
+                WHERE (pg_roles_1.rolname = CURRENT_USER))))) AND (mem.roleid = ( SELECT pg_roles_1.oid
+            FROM pg_roles pg_roles_1
+            WHERE (pg_roles_1.rolname = 'is_subject'::name))))
+"""
+
+OLD_OWN_POLICY = f"""
+    (inspection_organ_id IN ( WITH curr_user_subj_id AS (
+         SELECT inspection_organ.id
+           FROM tables.inspection_organ
+          WHERE (inspection_organ.path = ({CURRENT_USER_SUBJECT}))
+        )
+    SELECT curr_user_subj_id.id
+    FROM curr_user_subj_id))
+"""
+
+OLD_CHILDREN_POLICY = f"""
+    (inspection_organ_id IN ( WITH RECURSIVE subj AS (
+         SELECT inspection_organ.id,
+            inspection_organ.parent_id
+           FROM tables.inspection_organ
+          WHERE (inspection_organ.path = ({CURRENT_USER_SUBJECT}))
+        UNION
+         SELECT inspection_organ.id,
+            inspection_organ.parent_id
+           FROM (tables.inspection_organ
+             JOIN subj subj_1 ON ((inspection_organ.parent_id = subj_1.id)))
+        )
+    SELECT subj.id
+    FROM subj))
+"""
+
+# Скалярный подзапрос (SELECT f()) планируется как InitPlan и вычисляется один раз на запрос.
+# Приведение к text[] нужно, чтобы ANY сравнивал с элементами массива, а не со строками подзапроса.
+NEW_OWN_POLICY = "(inspection_organ_id = ANY ((SELECT tables.current_user_organ_ids())::text[]))"
+NEW_CHILDREN_POLICY = "(inspection_organ_id = ANY ((SELECT tables.current_user_visible_organ_ids())::text[]))"
+
+
+def recreate_policies(own_policy: str, children_policy: str):
+    for name, role, using in (
+        ("rls_crud_own_io", "rls_crud_own_io", own_policy),
+        ("rls_select_children_io", "rls_select_children_io", children_policy),
+        ("rls_select_own_io", "rls_select_own_io", own_policy),
+    ):
+        op.execute(f"DROP POLICY IF EXISTS {name} ON tables.inspection_result;")
+        op.execute(
+            f"""
+            CREATE POLICY {name}
+            ON tables.inspection_result
+            AS PERMISSIVE
+            FOR ALL
+            TO {role}
+            USING {using};
+            """
+        )
+
+
+def upgrade() -> None:
+    # Таблица замыкания иерархии проверяющих органов: все пары (предок, потомок), включая (орган, орган).
+    op.create_table(
+        "inspection_organ_closure",
+        sa.Column("ancestor_id", sa.Text(), nullable=False),
+        sa.Column("descendant_id", sa.Text(), nullable=False),
+        sa.Column("depth", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["ancestor_id"], ["tables.inspection_organ.id"], ondelete="CASCADE", onupdate="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(
+            ["descendant_id"], ["tables.inspection_organ.id"], ondelete="CASCADE", onupdate="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+        schema="tables",
+    )
+    op.create_index(
+        "ix_inspection_organ_closure_descendant_id", "inspection_organ_closure", ["descendant_id"], schema="tables"
+    )
+    op.execute(
+        """
+        INSERT INTO tables.inspection_organ_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE closure AS (
+            SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+            FROM tables.inspection_organ
+            UNION
+            SELECT closure.ancestor_id, organ.id, closure.depth + 1
+            FROM tables.inspection_organ organ
+                JOIN closure ON organ.parent_id = closure.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, min(depth) FROM closure GROUP BY ancestor_id, descendant_id;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tables.inspection_organ_closure_maintain()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        SECURITY DEFINER
+        SET search_path = tables, pg_temp
+        AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO tables.inspection_organ_closure (ancestor_id, descendant_id, depth)
+                VALUES (NEW.id, NEW.id, 0);
+                INSERT INTO tables.inspection_organ_closure (ancestor_id, descendant_id, depth)
+                SELECT parent.ancestor_id, NEW.id, parent.depth + 1
+                FROM tables.inspection_organ_closure parent
+                WHERE parent.descendant_id = NEW.parent_id;
+                RETURN NULL;
+            END IF;
+
+            -- UPDATE parent_id: перенос поддерева. Старые предки определяются по самой таблице замыкания,
+            -- поэтому порядок срабатывания относительно ON DELETE SET NULL у родителя не важен.
+            IF NEW.parent_id IS NOT NULL AND EXISTS (
+                SELECT 1 FROM tables.inspection_organ_closure
+                WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+            ) THEN
+                RAISE EXCEPTION 'Цикл в иерархии проверяющих органов: % -> %', NEW.id, NEW.parent_id;
+            END IF;
+
+            DELETE FROM tables.inspection_organ_closure link
+            USING tables.inspection_organ_closure subtree, tables.inspection_organ_closure ancestor
+            WHERE subtree.ancestor_id = NEW.id
+                AND ancestor.descendant_id = NEW.id
+                AND ancestor.ancestor_id <> NEW.id
+                AND link.ancestor_id = ancestor.ancestor_id
+                AND link.descendant_id = subtree.descendant_id;
+
+            INSERT INTO tables.inspection_organ_closure (ancestor_id, descendant_id, depth)
+            SELECT parent.ancestor_id, subtree.descendant_id, parent.depth + subtree.depth + 1
+            FROM tables.inspection_organ_closure parent, tables.inspection_organ_closure subtree
+            WHERE parent.descendant_id = NEW.parent_id AND subtree.ancestor_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER inspection_organ_closure
+        AFTER INSERT ON tables.inspection_organ
+        FOR EACH ROW EXECUTE FUNCTION tables.inspection_organ_closure_maintain();
+
+        CREATE TRIGGER inspection_organ_closure_move
+        AFTER UPDATE OF parent_id ON tables.inspection_organ
+        FOR EACH ROW WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+        EXECUTE FUNCTION tables.inspection_organ_closure_maintain();
+        """
+    )
+
+    # Функции выполняются с правами вызывающего (SECURITY INVOKER), иначе CURRENT_USER был бы владельцем функции.
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION tables.current_user_organ_ids()
+        RETURNS text[]
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT coalesce(array_agg(inspection_organ.id), '{{}}')
+            FROM tables.inspection_organ
+            WHERE inspection_organ.path = ({CURRENT_USER_SUBJECT});
+        $$;
+
+        CREATE OR REPLACE FUNCTION tables.current_user_visible_organ_ids()
+        RETURNS text[]
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT coalesce(array_agg(DISTINCT closure.descendant_id), '{{}}')
+            FROM tables.inspection_organ_closure closure
+            WHERE closure.ancestor_id = ANY (tables.current_user_organ_ids());
+        $$;
+
+        GRANT SELECT ON tables.inspection_organ_closure TO perm_inspection_result_crud;
+        GRANT SELECT ON tables.inspection_organ_closure TO perm_inspection_result_select;
+        """
+    )
+
+    recreate_policies(NEW_OWN_POLICY, NEW_CHILDREN_POLICY)
+
+
+def downgrade() -> None:
+    recreate_policies(OLD_OWN_POLICY, OLD_CHILDREN_POLICY)
+    op.execute(
+        """
+        DROP FUNCTION IF EXISTS tables.current_user_visible_organ_ids();
+        DROP FUNCTION IF EXISTS tables.current_user_organ_ids();
+        DROP TRIGGER IF EXISTS inspection_organ_closure ON tables.inspection_organ;
+        DROP TRIGGER IF EXISTS inspection_organ_closure_move ON tables.inspection_organ;
+        DROP FUNCTION IF EXISTS tables.inspection_organ_closure_maintain();
+        """
+    )
+    op.drop_table("inspection_organ_closure", schema="tables")
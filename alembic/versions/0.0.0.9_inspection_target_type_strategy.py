@@ -0,0 +1,40 @@
+"""0.0.0.9_inspection_target_type_strategy
+
+Revision ID: 0.0.0.9
+Revises: 0.0.0.8
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0.0.0.9"
+down_revision: Union[str, None] = "0.0.0.8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Стратегия расчета оценок задается для типа проверяемого субъекта. Изменение справочника уже оповещает
+    # кэш справочников (триггер refs_changed, миграция 0.0.0.3), поэтому при расчете запросов к БД нет.
+    op.add_column(
+        "inspection_target_type",
+        sa.Column("strategy", sa.Text(), nullable=False, server_default="criteria"),
+        schema="refs",
+    )
+    op.create_check_constraint(
+        "ck_inspection_target_type_strategy",
+        "inspection_target_type",
+        "strategy IN ('criteria', 'weights', 'avg')",
+        schema="refs",
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("ck_inspection_target_type_strategy", "inspection_target_type", schema="refs")
+    op.drop_column("inspection_target_type", "strategy", schema="refs")
@@ -2,4 +2,18 @@
 
 alembic upgrade head
 
+# Секции результатов проверок создаются заранее, а не при записи проверок (присоединение секции блокирует запись):
+# при старте и далее с интервалом PARTITION_MAINTENANCE_INTERVAL секунд (по умолчанию раз в сутки).
+flask --app app.debug maintain-partitions
+(
+    while sleep "${PARTITION_MAINTENANCE_INTERVAL:-86400}"; do
+        flask --app app.debug maintain-partitions
+    done
+) &
+
+# SERVER=gunicorn - несколько рабочих процессов (gunicorn.conf.py), по умолчанию - waitress (один процесс).
+if [ "${SERVER:-waitress}" = "gunicorn" ]; then
+    exec gunicorn -c gunicorn.conf.py "app.app_factory:get_app()"
+fi
+
 waitress-serve --call app:app_factory.get_app
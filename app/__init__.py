@@ -3,6 +3,8 @@ from pathlib import Path
 
 from flask_restx import Api
 
+from app.api.analytics.routes import analytics_api
+from app.api.files.routes import files_api
 from app.api.inspection.routes import inspection_api, inspections_api
 
 from app.app_factory import get_app
@@ -14,3 +16,5 @@ api = Api(
 
 api.add_namespace(inspection_api, path="/api")
 api.add_namespace(inspections_api, path="/api")
+api.add_namespace(files_api, path="/api")
+api.add_namespace(analytics_api, path="/api")
@@ -0,0 +1,116 @@
+from datetime import date
+from typing import List, Optional, Sequence
+
+from sqlalchemy import BigInteger, Row, cast, func, or_, select
+from sqlalchemy.orm import aliased
+
+from app.common.models import GradeRollup, InspectionOrgan, InspectionOrganClosure
+from app.session import session_scope
+
+
+# Измерения группировки агрегатов (помимо проверяющего органа), в строках результата - под именами столбцов
+GROUP_COLUMNS = {
+    "month": GradeRollup.month,
+    "inspection_target_type": GradeRollup.inspection_target_type_id,
+    "direction": GradeRollup.direction_id,
+}
+
+
+class GradeRollupDB:
+    """
+    Класс для работы с агрегатами оценок.
+
+    tables.grade_rollup хранит количество и сумму оценок по (месяц, орган, тип субъекта, направление, оценка).
+    Триггеры результатов проверок ставят измененные группы (месяц, орган) в очередь, группы пересчитываются
+    фоновым потоком или командой refresh-grade-rollup (миграция 0.0.0.13).
+    """
+
+    @staticmethod
+    def get_grades(
+        inspection_organ_id: Optional[str],
+        month_from: Optional[date],
+        month_to: Optional[date],
+        inspection_target_type_id: Optional[str],
+        direction_id: Optional[str],
+        directions: bool,
+        group_by: Sequence[str],
+    ) -> List[Row]:
+        """
+        Получение распределения оценок по поддеревьям проверяющих органов.
+
+        Поддерево органа - сам орган и все его потомки (inspection_organ_closure), агрегаты потомков суммируются.
+
+        :param inspection_organ_id: Орган: строки по его поддереву и поддеревьям его дочерних органов.
+            None - по поддеревьям корневых органов
+        :param month_from: Первый месяц периода (включительно)
+        :param month_to: Последний месяц периода (включительно)
+        :param inspection_target_type_id: Тип проверяемого субъекта
+        :param direction_id: Направление (только для оценок по направлениям)
+        :param directions: True - оценки по направлениям, False - общие оценки проверок
+        :param group_by: Дополнительные измерения группировки (ключи GROUP_COLUMNS)
+        :return: Строки (орган, измерения группировки, оценка, количество, сумма оценок)
+        """
+
+        node = aliased(InspectionOrgan)
+        dimensions = [GROUP_COLUMNS[name] for name in group_by]
+        query = (
+            select(
+                node.id.label("inspection_organ_id"),
+                node.parent_id,
+                node.path,
+                node.short_name,
+                *dimensions,
+                GradeRollup.grade,
+                # sum(bigint) - numeric
+                cast(func.sum(GradeRollup.result_count), BigInteger).label("result_count"),
+                func.sum(GradeRollup.grade_sum).label("grade_sum"),
+            )
+            .join(InspectionOrganClosure, InspectionOrganClosure.ancestor_id == node.id)
+            .join(GradeRollup, GradeRollup.inspection_organ_id == InspectionOrganClosure.descendant_id)
+            .group_by(node.id, *dimensions, GradeRollup.grade)
+            .order_by(node.path, node.id, *dimensions, GradeRollup.grade)
+        )
+        if inspection_organ_id is None:
+            query = query.where(node.parent_id.is_(None))
+        else:
+            query = query.where(or_(node.id == inspection_organ_id, node.parent_id == inspection_organ_id))
+        if directions:
+            query = query.where(GradeRollup.direction_id.is_not(None))
+        else:
+            query = query.where(GradeRollup.direction_id.is_(None))
+        if month_from is not None:
+            query = query.where(GradeRollup.month >= month_from)
+        if month_to is not None:
+            query = query.where(GradeRollup.month <= month_to)
+        if inspection_target_type_id is not None:
+            query = query.where(GradeRollup.inspection_target_type_id == inspection_target_type_id)
+        if direction_id is not None:
+            query = query.where(GradeRollup.direction_id == direction_id)
+
+        with session_scope() as session:
+            return session.execute(query).all()
+
+    @staticmethod
+    def refresh() -> int:
+        """
+        Пересчитать агрегаты групп из очереди изменений.
+
+        :return: Количество пересчитанных групп (месяц, орган)
+        """
+
+        with session_scope() as session:
+            return session.execute(select(func.tables.refresh_grade_rollup())).scalar_one()
+
+    @staticmethod
+    def rebuild(month_from: Optional[date] = None) -> int:
+        """
+        Полностью перестроить агрегаты по базовым таблицам.
+
+        Агрегаты месяцев до month_from сохраняются: данные архивированных секций в перестроение не попадают.
+
+        :param month_from: Первый перестраиваемый месяц (None - все)
+        :return: Количество строк агрегатов
+        """
+
+        with session_scope() as session:
+            return session.execute(select(func.tables.rebuild_grade_rollup(month_from))).scalar_one()
@@ -0,0 +1,42 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from app.api.analytics.db import GradeRollupDB
+from app.config import GRADE_ROLLUP_REFRESH_INTERVAL
+
+
+logger = logging.getLogger(__name__)
+
+
+class GradeRollupRefresher:
+    """
+    Фоновый пересчет агрегатов оценок.
+
+    Триггеры результатов проверок только ставят измененные группы (месяц, орган) в очередь, запись проверок
+    не ждет пересчета. Поток раз в interval секунд пересчитывает группы из очереди. Пересчеты из нескольких
+    процессов выполняются в БД по очереди (advisory-блокировка), уже пересчитанные группы повторно не считаются.
+    """
+
+    def __init__(self, interval: float = GRADE_ROLLUP_REFRESH_INTERVAL):
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Запустить фоновый поток пересчета (при interval <= 0 не запускается)."""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name="grade-rollup-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                GradeRollupDB.refresh()
+            except Exception:
+                logger.exception("Ошибка пересчета агрегатов оценок")
+
+
+grade_rollup_refresher = GradeRollupRefresher()
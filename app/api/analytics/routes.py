@@ -0,0 +1,68 @@
+from flask_restx import Namespace, Resource, reqparse
+
+from app.api.analytics.schemas import grade_analytics_schema_out, grade_distribution_schema_out
+from app.api.analytics.service import LEVELS, GradeAnalyticsService
+from app.api.inspection.serializers import json_response
+from app.session import transactional
+
+
+analytics_api = Namespace("Аналитика оценок")
+
+analytics_api.models[grade_distribution_schema_out.name] = grade_distribution_schema_out
+analytics_api.models[grade_analytics_schema_out.name] = grade_analytics_schema_out
+
+
+@analytics_api.route("/analytics/grades/")
+class GradeAnalyticsRoute(Resource):
+    """Средние оценки и распределение оценок по иерархии проверяющих органов."""
+
+    method_decorators = [transactional]
+
+    @analytics_api.param(
+        "inspection_organ_id",
+        "Проверяющий орган: строки по его поддереву и поддеревьям дочерних органов (по умолчанию - корневые органы)",
+    )
+    @analytics_api.param("start_month", "Первый месяц периода, ГГГГ-ММ")
+    @analytics_api.param("end_month", "Последний месяц периода, ГГГГ-ММ")
+    @analytics_api.param("inspection_target_type_id", "Тип проверяемого субъекта")
+    @analytics_api.param("direction_id", "Направление (для level=direction)")
+    @analytics_api.param(
+        "level", "Оценки: inspection - общие оценки проверок, direction - по направлениям", enum=list(LEVELS)
+    )
+    @analytics_api.param(
+        "group_by", "Измерения группировки через запятую: month, inspection_target_type, direction", type=str
+    )
+    @analytics_api.response(200, "Успешно", [grade_analytics_schema_out])
+    @analytics_api.response(400, "Некорректные параметры")
+    def get(self):
+        """
+        Средняя оценка и распределение оценок по поддеревьям проверяющих органов.
+
+        Ответ строится по агрегатам tables.grade_rollup, а не по результатам проверок: время ответа не зависит
+        от их количества. Агрегаты пересчитываются в фоне, последние изменения могут учитываться с задержкой
+        (GRADE_ROLLUP_REFRESH_INTERVAL). Для перехода вниз по иерархии передается inspection_organ_id дочернего органа.
+        """
+
+        parser = reqparse.RequestParser()
+        parser.add_argument("inspection_organ_id", type=str)
+        parser.add_argument("start_month", type=str)
+        parser.add_argument("end_month", type=str)
+        parser.add_argument("inspection_target_type_id", type=str)
+        parser.add_argument("direction_id", type=str)
+        parser.add_argument("level", type=str, choices=LEVELS, default="inspection")
+        parser.add_argument("group_by", type=str)
+        args = parser.parse_args()
+        group_by = [name.strip() for name in (args["group_by"] or "").split(",") if name.strip()]
+        try:
+            result = GradeAnalyticsService.get_grades(
+                args["inspection_organ_id"],
+                args["start_month"],
+                args["end_month"],
+                args["inspection_target_type_id"],
+                args["direction_id"],
+                args["level"],
+                group_by,
+            )
+        except ValueError as e:
+            analytics_api.abort(400, str(e))
+        return json_response(result)
@@ -0,0 +1,28 @@
+from flask_restx import Model, fields
+
+
+grade_distribution_schema_out = Model(
+    "GradeDistributionOut",
+    {
+        "grade": fields.Float(description="Оценка, округленная до целого."),
+        "count": fields.Integer(description="Количество оценок."),
+    },
+)
+
+grade_analytics_schema_out = Model(
+    "GradeAnalyticsOut",
+    {
+        "inspection_organ_id": fields.String(description="Проверяющий орган (строка - по всему его поддереву)."),
+        "parent_id": fields.String(description="Вышестоящий орган."),
+        "path": fields.String(description="Путь органа в иерархии."),
+        "short_name": fields.String(description="Краткое название органа."),
+        "month": fields.String(description="Месяц проверки, ГГГГ-ММ (при группировке по месяцу)."),
+        "inspection_target_type_id": fields.String(
+            description="Тип проверяемого субъекта (при группировке по типу)."
+        ),
+        "direction_id": fields.String(description="Направление (при группировке по направлению)."),
+        "count": fields.Integer(description="Количество оценок."),
+        "avg_grade": fields.Float(description="Средняя оценка."),
+        "distribution": fields.List(fields.Nested(grade_distribution_schema_out)),
+    },
+)
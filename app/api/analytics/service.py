@@ -0,0 +1,98 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+
+from app.api.analytics.db import GROUP_COLUMNS, GradeRollupDB
+
+
+LEVELS = ("inspection", "direction")
+
+
+def parse_month(value: Optional[str]) -> Optional[date]:
+    """
+    Разбор месяца в формате ГГГГ-ММ.
+
+    :param value: Строка месяца или None
+    :return: Первое число месяца или None
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise ValueError(f"Некорректный месяц (ожидается ГГГГ-ММ): {value}")
+
+
+class GradeAnalyticsService:
+    """Аналитика оценок по агрегатам tables.grade_rollup."""
+
+    @staticmethod
+    def get_grades(
+        inspection_organ_id: Optional[str] = None,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None,
+        inspection_target_type_id: Optional[str] = None,
+        direction_id: Optional[str] = None,
+        level: str = "inspection",
+        group_by: Sequence[str] = (),
+    ) -> List[Dict]:
+        """
+        Средняя оценка и распределение оценок по поддеревьям проверяющих органов.
+
+        Возвращается строка по поддереву органа inspection_organ_id и по поддереву каждого его дочернего органа
+        (без органа - по поддеревьям корневых органов), с разбивкой по измерениям group_by.
+
+        :param inspection_organ_id: ID проверяющего органа
+        :param start_month: Первый месяц периода, ГГГГ-ММ
+        :param end_month: Последний месяц периода, ГГГГ-ММ
+        :param inspection_target_type_id: ID типа проверяемого субъекта
+        :param direction_id: ID направления (только для level=direction)
+        :param level: inspection - общие оценки проверок, direction - оценки по направлениям
+        :param group_by: Измерения группировки: month, inspection_target_type, direction
+        :return: Список строк с количеством, средней оценкой и распределением оценок
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Неизвестный уровень оценок: {level}")
+        unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Неизвестные измерения группировки: {', '.join(unknown)}")
+        if level != "direction" and (direction_id is not None or "direction" in group_by):
+            raise ValueError("Фильтр и группировка по направлению доступны только для level=direction")
+        month_from, month_to = parse_month(start_month), parse_month(end_month)
+        group_by = list(dict.fromkeys(group_by))
+        columns = [GROUP_COLUMNS[name].key for name in group_by]
+
+        rows = GradeRollupDB.get_grades(
+            inspection_organ_id,
+            month_from,
+            month_to,
+            inspection_target_type_id,
+            direction_id,
+            level == "direction",
+            group_by,
+        )
+
+        # Строки отсортированы по органу и измерениям, оценки одной группы идут подряд.
+        result = []
+        key = None
+        for row in rows:
+            row_key = (row.inspection_organ_id, *(getattr(row, column) for column in columns))
+            if row_key != key:
+                key = row_key
+                item = {
+                    "inspection_organ_id": row.inspection_organ_id,
+                    "parent_id": row.parent_id,
+                    "path": row.path,
+                    "short_name": row.short_name,
+                }
+                for column in columns:
+                    value = getattr(row, column)
+                    item[column] = value.strftime("%Y-%m") if column == "month" else value
+                item.update(count=0, grade_sum=0.0, distribution=[])
+                result.append(item)
+            item["count"] += row.result_count
+            item["grade_sum"] += row.grade_sum
+            item["distribution"].append({"grade": row.grade, "count": row.result_count})
+
+        for item in result:
+            item["avg_grade"] = item.pop("grade_sum") / item["count"]
+        return result
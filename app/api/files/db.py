@@ -0,0 +1,21 @@
+from sqlalchemy import cast, exists, select
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.common.models import InspectionResult
+from app.session import session_scope
+
+
+class FilesDB:
+    """Класс для проверки доступа к файлам вложений."""
+
+    @staticmethod
+    def is_attached(key: str) -> bool:
+        """
+        Проверить, что файл указан во вложениях хотя бы одной проверки, видимой пользователю (с учетом RLS).
+
+        :param key: Ключ файла
+        :return: True, если файл доступен пользователю
+        """
+
+        with session_scope() as session:
+            return session.scalar(select(exists().where(cast(InspectionResult.files, JSONB).contains([key]))))
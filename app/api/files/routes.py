@@ -0,0 +1,55 @@
+from flask import request, send_file
+from flask_restx import Model, Namespace, Resource, fields
+
+from app.api.files.db import FilesDB
+from app.common.storage import storage
+
+
+files_api = Namespace("Файлы вложений")
+
+file_schema_out = Model(
+    "FileOut",
+    {
+        "key": fields.String(description="Ключ файла, указывается в поле files проверки."),
+    },
+)
+files_api.models[file_schema_out.name] = file_schema_out
+
+
+@files_api.route("/files/")
+class FilesRoute(Resource):
+    """Загрузка файлов вложений."""
+
+    @files_api.param("name", "Исходное имя файла", type=str)
+    @files_api.response(201, "Успешно", file_schema_out)
+    @files_api.response(413, "Файл слишком большой")
+    def post(self):
+        """
+        Загрузка файла. Тело запроса - содержимое файла (application/octet-stream).
+
+        Тело читается потоком частями, файл целиком в память не загружается. Одинаковые файлы хранятся один раз.
+        Размер файла ограничен FILE_MAX_SIZE.
+        """
+
+        if (request.content_length or 0) > storage.max_size:
+            files_api.abort(413, f"Размер файла превышает {storage.max_size} байт")
+        try:
+            key = storage.save(request.stream, request.args.get("name", ""))
+        except ValueError as e:
+            files_api.abort(413, str(e))
+        return {"key": key}, 201
+
+
+@files_api.route("/files/<path:key>")
+@files_api.param("key", "Ключ файла")
+class FileRoute(Resource):
+    """Получение файлов вложений."""
+
+    @files_api.response(404, "Не найдено")
+    def get(self, key: str):
+        """Скачивание файла. Доступны только файлы проверок, видимых пользователю."""
+
+        # Файл, не указанный в видимых пользователю проверках, не отличается от отсутствующего.
+        if not storage.exists(key) or not FilesDB.is_attached(key):
+            files_api.abort(404, "Файл не найден")
+        return send_file(storage.open(key), download_name=key.rsplit("/", 1)[-1])
@@ -0,0 +1,107 @@
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import CRITERIA_GRADE_STEP
+
+
+class CriteriaTable:
+    """
+    Скомпилированная таблица критериев оценки.
+
+    Для каждого направления (поднаправления) хранится плотный массив результирующих оценок,
+    индексированный квантованной оценкой: index = round(grade / step) - offset.
+    Отсутствующие в таблице критериев оценки хранятся как NaN.
+    """
+
+    def __init__(self, criteria: Iterable[Tuple[str, float, float]], step: float = CRITERIA_GRADE_STEP):
+        """
+        :param criteria: Тройки (ID направления/поднаправления, оценка, результирующая оценка)
+        :param step: Шаг квантования оценок
+        """
+        self.step = step
+        grouped: Dict[str, List[Tuple[int, float]]] = {}
+        for item_id, grade, result_grade in criteria:
+            grouped.setdefault(item_id, []).append((self.quantize(grade), result_grade))
+
+        # Массивы - array("d") либо memoryview формата "d" (таблицы в общей памяти, см. shared_refs)
+        self._tables: Dict[str, Tuple[int, Sequence[float]]] = {}
+        for item_id, values in grouped.items():
+            offset = min(quantized for quantized, _ in values)
+            table = array("d", [math.nan]) * (max(quantized for quantized, _ in values) - offset + 1)
+            for quantized, result_grade in values:
+                table[quantized - offset] = result_grade
+            self._tables[item_id] = (offset, table)
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, Tuple[int, Sequence[float]]], step: float) -> "CriteriaTable":
+        """
+        Таблица из уже скомпилированных массивов без копирования.
+
+        :param tables: ID направления/поднаправления -> (смещение квантованной оценки, массив результирующих оценок)
+        :param step: Шаг квантования оценок
+        """
+        table = cls([], step)
+        table._tables = dict(tables)
+        return table
+
+    @property
+    def tables(self) -> Dict[str, Tuple[int, Sequence[float]]]:
+        return self._tables
+
+    def quantize(self, grade: float) -> int:
+        return round(grade / self.step)
+
+    def lookup(self, item_id: str, grade: Optional[float]) -> Optional[float]:
+        """
+        Получить результирующую оценку.
+
+        :param item_id: ID направления/поднаправления
+        :param grade: Оценка по направлению/поднаправлению
+        :return: Результирующая оценка или None, если оценка не указана или нет подходящего критерия
+        """
+        if grade is None:
+            return None
+        compiled = self._tables.get(item_id)
+        if compiled is None:
+            return None
+        offset, table = compiled
+        index = self.quantize(grade) - offset
+        if index < 0 or index >= len(table):
+            return None
+        result_grade = table[index]
+        if math.isnan(result_grade):
+            return None
+        return result_grade
+
+    def lookup_many(self, item_ids: Sequence[str], grades: np.ndarray) -> np.ndarray:
+        """
+        Получить результирующие оценки для массива оценок (векторный аналог lookup).
+
+        :param item_ids: ID направлений/поднаправлений
+        :param grades: Оценки (NaN - оценка не указана)
+        :return: Результирующие оценки, NaN - если оценка не указана или нет подходящего критерия
+        """
+        result = np.full(len(grades), np.nan)
+        positions: Dict[str, List[int]] = {}
+        for position, item_id in enumerate(item_ids):
+            positions.setdefault(item_id, []).append(position)
+        for item_id, item_positions in positions.items():
+            compiled = self._tables.get(item_id)
+            if compiled is None:
+                continue
+            offset, table = compiled
+            item_positions = np.asarray(item_positions)
+            item_grades = grades[item_positions]
+            known = ~np.isnan(item_grades)
+            item_positions, item_grades = item_positions[known], item_grades[known]
+            # np.rint, как и round, округляет половины к четному.
+            index = np.rint(item_grades / self.step).astype(np.int64) - offset
+            inside = (index >= 0) & (index < len(table))
+            result[item_positions[inside]] = np.frombuffer(table, dtype=np.float64)[index[inside]]
+        return result
+
+    def __len__(self):
+        return len(self._tables)
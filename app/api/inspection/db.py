@@ -1,11 +1,16 @@
-from datetime import datetime
-from typing import Dict, List
-
-from sqlalchemy import delete, func, select
-from sqlalchemy.orm import joinedload
-
-from app.api.inspection.schemas import GradeSchema, InspectionResultSchema, TopicResultSchema
-from app.common.common_data import save_file
+import uuid
+from datetime import datetime, time, timedelta
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from psycopg2 import errorcodes
+from sqlalchemy import delete, func, insert, or_, select, text, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
+
+from app.common.common_data import decode_cursor, encode_cursor, escape_like
+from app.common.ids import uuid7
+from app.config import PARTITION_CHECK_TTL
 from app.common.models import (
     DirectionResult,
     Grade,
@@ -16,12 +21,12 @@ from app.common.models import (
     InspectionTargetType,
     InspectionTargetTypeDirectionRel,
     InspectionTargetTypeTopicRel,
+    LatestTopicResult,
+    RecalculationJob,
     Scale,
-    Topic,
     TopicResult,
 )
-from app.session import session_scope
-from sqlalchemy.dialects.postgresql import array
+from app.session import session_maker, session_scope
 
 
 class InspectionDB:
@@ -40,10 +45,23 @@ class InspectionDB:
         end_date_unix_filter: int,
         direction_id_filter: str,
         description_filter: str,
-    ) -> List[Dict]:
+        cursor: str = None,
+        date_field: str = "created_date",
+        search: str = None,
+        search_children: bool = False,
+    ) -> Tuple[List[InspectionResult], Optional[str]]:
         """
         Получение инспекторских проверок.
 
+        Поддерживается два режима постраничного вывода: по смещению (offset) и по курсору (cursor).
+        Курсор - непрозрачная строка, указывающая на последнюю запись предыдущей страницы (created_date, id);
+        выборка по нему использует индекс ix_inspection_result_created_date_id, поэтому стоимость страницы
+        не зависит от ее номера. При указании курсора смещение не применяется.
+
+        Поиск (search) выполняется по названию и описанию проверки, а при search_children - и по описаниям
+        результатов направлений и поднаправлений. Выборка использует триграммные GIN-индексы (pg_trgm),
+        результаты упорядочены по релевантности. Постраничный вывод при поиске - только по смещению.
+
         :param limit: Количество записей
         :param offset: Смещение
         :param name_filter: Параметр для поиска по названию
@@ -55,89 +73,169 @@ class InspectionDB:
         :param end_date_unix_filter: Параметр для поиска по диапазону до выбранной даты
         :param direction_id_filter: Параметр для поиска по направлению проверки
         :param description_filter: Параметр для поиска по описанию проверки
-        :return: Информация об инспекторских проверках в формате List[Dict]
+        :param cursor: Курсор, полученный вместе с предыдущей страницей
+        :param date_field: Столбец для фильтров по дате: created_date или inspection_date
+        :param search: Строка для поиска
+        :param search_children: Искать также по описаниям результатов направлений и поднаправлений
+        :return: Инспекторские проверки и курсор следующей страницы
         """
 
         with session_scope() as session:
-            query = (
-                select(InspectionResult)
-                .limit(limit)
-                .offset(offset)
-                .filter(InspectionResult.name.ilike(f"%{name_filter}%" if name_filter is not None else "%"))
-                .filter(
-                    InspectionResult.description.ilike(
-                        f"%{description_filter}%" if description_filter is not None else "%"
-                    )
-                )
-                .filter(InspectionResult.grade == grade_filter if grade_filter is not None else True)
-                .filter(
-                    InspectionResult.inspection_organ_id == inspection_organ_id_filter
-                    if inspection_organ_id_filter is not None
-                    else True
-                )
-                .filter(
-                    InspectionResult.inspection_target_id == inspection_target_id_filter
-                    if inspection_target_id_filter is not None
-                    else True
-                )
-                .options(
-                    joinedload(InspectionResult.direction_results)
-                    .joinedload(DirectionResult.topic_results)
-                    .joinedload(TopicResult.topic)
-                )
-                .order_by(InspectionResult.created_date.desc())
+            # Этап 1: только ID и ключ сортировки страницы проверок.
+            query = select(InspectionResult.id, InspectionResult.inspection_date, InspectionResult.created_date).limit(
+                limit
             )
+            if name_filter is not None:
+                query = query.filter(InspectionResult.name.ilike(f"%{name_filter}%"))
+            if description_filter is not None:
+                query = query.filter(InspectionResult.description.ilike(f"%{description_filter}%"))
+            if grade_filter is not None:
+                query = query.filter(InspectionResult.grade == grade_filter)
+            if inspection_organ_id_filter is not None:
+                query = query.filter(InspectionResult.inspection_organ_id == inspection_organ_id_filter)
+            if inspection_target_id_filter is not None:
+                query = query.filter(InspectionResult.inspection_target_id == inspection_target_id_filter)
+
+            if search:
+                if cursor:
+                    raise ValueError("Курсор не поддерживается при полнотекстовом поиске")
+                query = InspectionDB._apply_search(query, search, search_children)
+            else:
+                query = query.order_by(InspectionResult.created_date.desc(), InspectionResult.id.desc())
+            if cursor:
+                cursor_created_date, cursor_id = decode_cursor(cursor)
+                query = query.filter(
+                    tuple_(InspectionResult.created_date, InspectionResult.id) < tuple_(cursor_created_date, cursor_id)
+                )
+            else:
+                query = query.offset(offset)
             if direction_id_filter:
                 query = query.filter(
                     InspectionResult.direction_results.any(DirectionResult.direction_id == direction_id_filter)
                 )
+            # Фильтры по дате - полуоткрытые диапазоны по самому столбцу, чтобы использовались индексы
+            date_column = {
+                "created_date": InspectionResult.created_date,
+                "inspection_date": InspectionResult.inspection_date,
+            }[date_field]
             if date_unix_filter:
-                date_filter = datetime.utcfromtimestamp(date_unix_filter).date()
-                query = query.filter(func.date(InspectionResult.created_date) == date_filter)
-            if start_date_unix_filter and end_date_unix_filter:
-                start_date_filter = datetime.utcfromtimestamp(start_date_unix_filter).date()
-                end_date_filter = datetime.utcfromtimestamp(end_date_unix_filter).date()
-                query = query.filter(
-                    func.date(InspectionResult.created_date).between(start_date_filter, end_date_filter)
-                )
-            elif start_date_unix_filter:
-                start_date_filter = datetime.utcfromtimestamp(start_date_unix_filter).date()
-                query = query.filter(func.date(InspectionResult.created_date) >= start_date_filter)
-            elif end_date_unix_filter:
-                end_date_filter = datetime.utcfromtimestamp(end_date_unix_filter).date()
-                query = query.filter(func.date(InspectionResult.created_date) <= end_date_filter)
-            result = session.execute(query).unique().scalars().all()
-            return InspectionResultSchema(many=True).dump(result)
+                date_filter = InspectionDB._day_start(date_unix_filter)
+                query = query.filter(date_column >= date_filter, date_column < date_filter + timedelta(days=1))
+            if start_date_unix_filter:
+                query = query.filter(date_column >= InspectionDB._day_start(start_date_unix_filter))
+            if end_date_unix_filter:
+                query = query.filter(date_column < InspectionDB._day_start(end_date_unix_filter) + timedelta(days=1))
+            page = session.execute(query).all()
+            next_cursor = None
+            if limit and len(page) == limit and not search:
+                next_cursor = encode_cursor(page[-1].created_date, page[-1].id)
+
+            # Этап 2: проверки страницы и их дочерние записи.
+            result = InspectionDB._load_inspections(
+                session, [row.id for row in page], [row.inspection_date for row in page]
+            )
+            return result, next_cursor
 
     @staticmethod
-    def get_by_id(inspection_id: str) -> InspectionResult:
+    def _load_inspections(
+        session,
+        inspection_ids: List[uuid.UUID],
+        inspection_dates: Optional[List[datetime]] = None,
+        populate_existing: bool = False,
+    ) -> List[InspectionResult]:
+        """
+        Загрузка проверок с результатами по направлениям и поднаправлениям.
+
+        Вместо JOIN всего дерева (строк на каждую пару направление x поднаправление) выполняется ровно
+        4 запроса независимо от размера страницы (до 500 проверок): проверки, результаты направлений
+        (с направлением через JOIN), результаты поднаправлений и поднаправления. Каждая строка передается один раз.
+
+        Результаты направлений и поднаправлений выбираются по первичному ключу родителя (id, inspection_date),
+        поэтому читаются только секции месяцев проверок страницы.
+
+        :param session: Сессия
+        :param inspection_ids: ID проверок
+        :param inspection_dates: Даты проверок (если известны - читаются только секции их месяцев)
+        :param populate_existing: Перечитать объекты, уже загруженные в сессию
+        :return: Проверки в порядке inspection_ids
+        """
+        if not inspection_ids:
+            return []
+        if inspection_dates is None:
+            condition = InspectionResult.id.in_(inspection_ids)
+        else:
+            condition = tuple_(InspectionResult.id, InspectionResult.inspection_date).in_(
+                list(zip(inspection_ids, inspection_dates))
+            )
+        inspections = session.execute(
+            select(InspectionResult)
+            .where(condition)
+            .options(
+                selectinload(InspectionResult.direction_results)
+                .selectinload(DirectionResult.topic_results)
+                .selectinload(TopicResult.topic)
+            )
+            .execution_options(populate_existing=populate_existing)
+        ).scalars()
+        inspections = {inspection.id: inspection for inspection in inspections}
+        return [inspections[inspection_id] for inspection_id in inspection_ids if inspection_id in inspections]
+
+    @staticmethod
+    def _apply_search(query, search: str, search_children: bool):
+        """Добавить к запросу условие поиска подстроки и упорядочивание по релевантности."""
+        pattern = f"%{escape_like(search)}%"
+        conditions = [
+            InspectionResult.name.ilike(pattern, escape="/"),
+            InspectionResult.description.ilike(pattern, escape="/"),
+        ]
+        if search_children:
+            conditions += [
+                InspectionResult.direction_results.any(DirectionResult.description.ilike(pattern, escape="/")),
+                InspectionResult.direction_results.any(
+                    DirectionResult.topic_results.any(TopicResult.description.ilike(pattern, escape="/"))
+                ),
+            ]
+        rank = func.greatest(
+            func.similarity(InspectionResult.name, search),
+            func.similarity(func.coalesce(InspectionResult.description, ""), search),
+        )
+        return query.filter(or_(*conditions)).order_by(
+            rank.desc(), InspectionResult.created_date.desc(), InspectionResult.id.desc()
+        )
+
+    @staticmethod
+    def _day_start(date_unix: int) -> datetime:
+        """Начало (UTC) дня, в который попадает unix-время."""
+        return datetime.combine(datetime.utcfromtimestamp(date_unix).date(), time.min)
+
+    @staticmethod
+    def get_by_id(inspection_id: uuid.UUID) -> InspectionResult:
         """
         Получение информации об инспекторской проверке по ID.
 
         :param inspection_id: ID инспекторской проверки
-        :return: Информация об инспекторской проверке в формате Dict
+        :return: Инспекторская проверка или None
         """
 
         with session_scope() as session:
-            query = (
-                (
-                    session.execute(
-                        select(InspectionResult)
-                        .filter_by(id=inspection_id)
-                        .options(
-                            joinedload(InspectionResult.direction_results)
-                            .joinedload(DirectionResult.topic_results)
-                            .joinedload(TopicResult.topic)
-                        )
-                    )
-                )
-                .unique()
-                .scalar_one_or_none()
-            )
-            return InspectionResultSchema(many=False).dump(query)
+            return next(iter(InspectionDB._load_inspections(session, [inspection_id])), None)
 
     @staticmethod
-    def delete_inspection_by_id(inspection_id: str) -> InspectionResult:
+    def get_inspection_target_id(inspection_id: uuid.UUID) -> Optional[str]:
+        """
+        Получение ID проверяемого субъекта инспекторской проверки.
+
+        :param inspection_id: ID инспекторской проверки
+        :return: ID проверяемого субъекта или None
+        """
+
+        with session_scope() as session:
+            return session.execute(
+                select(InspectionResult.inspection_target_id).where(InspectionResult.id == inspection_id)
+            ).scalar()
+
+    @staticmethod
+    def delete_inspection_by_id(inspection_id: uuid.UUID) -> InspectionResult:
         """
         Удаление сущности из БД по ID.
 
@@ -171,9 +269,8 @@ class InspectionDB:
                 inspection_target_id=payload.inspection_target_id,
                 inspection_date=payload.inspection_date,
                 operator_id=payload.operator_id,
+                files=payload.files,
             )
-            if payload.files:
-                new_inspection.files = [save_file(file) for file in payload.files]
             session.add(new_inspection)
             for direction_data in payload.direction_results:
                 direction = DirectionResult(
@@ -191,101 +288,406 @@ class InspectionDB:
                     )
                     session.add(topic)
                 session.add(direction)
+            try:
+                session.flush()
+            except DBAPIError as e:
+                if PartitionDB.is_missing_partition(e):
+                    PartitionDB.forget(payload.inspection_date)
+                    raise ValueError(PartitionDB.missing_message(payload.inspection_date)) from e
+                raise
         return new_inspection
 
     @staticmethod
-    def update_inspection_in_db(inspection_id: str, payload: Dict) -> InspectionResult:
+    def write_inspections_into_db(payloads: List) -> List[Tuple[Optional[uuid.UUID], Optional[str]]]:
         """
-        Обновление записи об инспекторской проверке в БД по ID.
+        Пакетное добавление записей об инспекторских проверках в БД.
 
-        :param inspection_id: ID инспекторской проверки
-        :param payload: Обновленные данные об инспекторской проверке
-        :return: Обновленная информация об инспекторской проверке
+        Идентификаторы записей создаются приложением, поэтому каждая из таблиц inspection_result, direction_result
+        и topic_result заполняется многострочным INSERT без RETURNING (один запрос на таблицу).
+        Если пакет не удалось записать целиком, проверки записываются по одной,
+        чтобы определить, какие из них ошибочны.
+
+        :param payloads: Данные об инспекторских проверках
+        :return: Список пар (ID добавленной проверки, текст ошибки) в порядке payloads
         """
 
         with session_scope() as session:
-            inspection = session.query(InspectionResult).filter_by(id=inspection_id).first()
-            inspection.name = payload.get("name", inspection.name)
-            inspection.grade = payload.get("grade", inspection.grade)
-            inspection.description = payload.get("description", inspection.description)
-            inspection.inspection_organ_id = payload.get("inspection_organ_id", inspection.inspection_organ_id)
-            inspection.inspection_target_id = payload.get("inspection_target_id", inspection.inspection_target_id)
-            inspection.operator_id = payload.get("operator_id", inspection.operator_id)
-
-            new_dir_results = payload.get("direction_results", [])
-            for dir_result in inspection.direction_results:
-                session.delete(dir_result)
-
-            for new_dir in new_dir_results:
-                dir_result = DirectionResult(
-                    grade=new_dir.get("grade"),
-                    description=new_dir.get("description"),
-                    direction_id=new_dir.get("direction_id"),
-                    inspection_result=inspection,
+            try:
+                with session.begin_nested():
+                    return [
+                        (inspection_id, None)
+                        for inspection_id in InspectionDB._insert_inspections(session, payloads)
+                    ]
+            except DBAPIError:
+                pass
+
+            results = []
+            for payload in payloads:
+                try:
+                    with session.begin_nested():
+                        results.append((InspectionDB._insert_inspections(session, [payload])[0], None))
+                except DBAPIError as e:
+                    if PartitionDB.is_missing_partition(e):
+                        PartitionDB.forget(payload.inspection_date)
+                        results.append((None, PartitionDB.missing_message(payload.inspection_date)))
+                    else:
+                        results.append((None, str(e.orig)))
+            return results
+
+    @staticmethod
+    def _insert_inspections(session, payloads: List) -> List[uuid.UUID]:
+        # Идентификаторы создаются заранее: каждая таблица заполняется одним многострочным INSERT без RETURNING.
+        inspection_rows, direction_rows, topic_rows = [], [], []
+        for payload in payloads:
+            inspection_id = uuid7()
+            inspection_rows.append(
+                {
+                    "id": inspection_id,
+                    "name": payload.name,
+                    "grade": payload.grade,
+                    "description": payload.description,
+                    "inspection_organ_id": payload.inspection_organ_id,
+                    "inspection_target_id": payload.inspection_target_id,
+                    "inspection_date": payload.inspection_date,
+                    "operator_id": payload.operator_id,
+                    "files": payload.files,
+                }
+            )
+            for direction_data in payload.direction_results:
+                direction_id = uuid7()
+                direction_rows.append(
+                    {
+                        "id": direction_id,
+                        "grade": direction_data.grade,
+                        "description": direction_data.description,
+                        "direction_id": direction_data.id,
+                        "inspection_result_id": inspection_id,
+                        "inspection_date": payload.inspection_date,
+                    }
                 )
+                topic_rows.extend(
+                    {
+                        "id": uuid7(),
+                        "grade": topic_data.grade,
+                        "description": topic_data.description,
+                        "topic_id": topic_data.id,
+                        "direction_result_id": direction_id,
+                        "inspection_date": payload.inspection_date,
+                    }
+                    for topic_data in direction_data.topic_results
+                )
+
+        for model, rows in (
+            (InspectionResult, inspection_rows),
+            (DirectionResult, direction_rows),
+            (TopicResult, topic_rows),
+        ):
+            if rows:
+                session.execute(insert(model), rows)
+        return [row["id"] for row in inspection_rows]
+
+    @staticmethod
+    def update_inspection_in_db(
+        inspection_id: uuid.UUID, payload: Dict, calculate_grade: Callable[[Dict], float] = None
+    ) -> Optional[InspectionResult]:
+        """
+        Обновление записи об инспекторской проверке в БД по ID.
 
-                for new_topic in new_dir.get("topic_results", []):
-                    topic_result = TopicResult(
-                        grade=new_topic.get("grade"),
-                        description=new_topic.get("description"),
-                        topic_id=new_topic.get("topic_id"),
-                        direction_result=dir_result,
+        Результаты направлений и поднаправлений сопоставляются с сохраненными по direction_id/topic_id
+        (при повторах - по порядку). Изменяются только отличающиеся строки: пакетные UPDATE по первичному ключу,
+        INSERT для новых результатов и DELETE ... WHERE id IN (...) для отсутствующих в запросе.
+        Строка проверки обновляется одним UPDATE вместе с пересчитанной общей оценкой.
+
+        :param inspection_id: ID инспекторской проверки
+        :param payload: Обновленные данные об инспекторской проверке
+        :param calculate_grade: Расчет общей оценки по данным проверки в формате входной модели. Вызывается, если
+            оценка не указана в запросе и изменились данные, от которых она зависит (оценки, состав результатов,
+            проверяемый субъект)
+        :return: Обновленная информация об инспекторской проверке или None, если она не найдена
+        """
+
+        with session_scope() as session:
+            inspections = InspectionDB._load_inspections(session, [inspection_id])
+            if not inspections:
+                return None
+            inspection = inspections[0]
+            grades_changed = inspection.inspection_target_id != payload.get(
+                "inspection_target_id", inspection.inspection_target_id
+            )
+
+            direction_updates, topic_updates = [], []
+            new_directions, new_direction_topics, new_topics = [], [], []
+            deleted_directions, deleted_topics = [], []
+
+            current_directions = InspectionDB._group_by(inspection.direction_results, "direction_id")
+            for direction_data in payload.get("direction_results", []):
+                matched = current_directions.get(direction_data.get("direction_id"))
+                if not matched:
+                    grades_changed = True
+                    new_directions.append(
+                        {
+                            "id": uuid7(),
+                            "grade": direction_data.get("grade"),
+                            "description": direction_data.get("description"),
+                            "direction_id": direction_data.get("direction_id"),
+                            "inspection_result_id": inspection.id,
+                            "inspection_date": inspection.inspection_date,
+                        }
+                    )
+                    new_direction_topics.append(direction_data.get("topic_results", []))
+                    continue
+
+                direction = matched.pop(0)
+                if direction.grade != direction_data.get("grade"):
+                    grades_changed = True
+                if (direction.grade, direction.description) != (
+                    direction_data.get("grade"),
+                    direction_data.get("description"),
+                ):
+                    direction_updates.append(
+                        {
+                            "id": direction.id,
+                            "inspection_date": direction.inspection_date,
+                            "grade": direction_data.get("grade"),
+                            "description": direction_data.get("description"),
+                        }
                     )
-                    dir_result.topic_results.add(topic_result)
-                inspection.direction_results.add(dir_result)
-            inspection.updated_date = datetime.now()
-            return inspection
+
+                current_topics = InspectionDB._group_by(direction.topic_results, "topic_id")
+                for topic_data in direction_data.get("topic_results", []):
+                    matched_topics = current_topics.get(topic_data.get("topic_id"))
+                    if not matched_topics:
+                        grades_changed = True
+                        new_topics.append(InspectionDB._topic_row(topic_data, direction.id, inspection.inspection_date))
+                        continue
+                    topic = matched_topics.pop(0)
+                    if topic.grade != topic_data.get("grade"):
+                        grades_changed = True
+                    if (topic.grade, topic.description) != (topic_data.get("grade"), topic_data.get("description")):
+                        topic_updates.append(
+                            {
+                                "id": topic.id,
+                                "inspection_date": topic.inspection_date,
+                                "grade": topic_data.get("grade"),
+                                "description": topic_data.get("description"),
+                            }
+                        )
+                deleted_topics.extend(topic.id for topics in current_topics.values() for topic in topics)
+            deleted_directions.extend(
+                direction.id for directions in current_directions.values() for direction in directions
+            )
+            if deleted_directions or deleted_topics:
+                grades_changed = True
+
+            # Результаты поднаправлений удаляемых направлений удаляются каскадно (ON DELETE CASCADE).
+            if deleted_topics:
+                session.execute(delete(TopicResult).where(TopicResult.id.in_(deleted_topics)))
+            if deleted_directions:
+                session.execute(delete(DirectionResult).where(DirectionResult.id.in_(deleted_directions)))
+            if direction_updates:
+                session.execute(update(DirectionResult), direction_updates)
+            if topic_updates:
+                session.execute(update(TopicResult), topic_updates)
+            if new_directions:
+                session.execute(insert(DirectionResult), new_directions)
+                new_topics.extend(
+                    InspectionDB._topic_row(topic_data, direction["id"], inspection.inspection_date)
+                    for direction, topics in zip(new_directions, new_direction_topics)
+                    for topic_data in topics
+                )
+            if new_topics:
+                session.execute(insert(TopicResult), new_topics)
+
+            for field in ("name", "description", "inspection_organ_id", "inspection_target_id", "operator_id"):
+                if field in payload and getattr(inspection, field) != payload[field]:
+                    setattr(inspection, field, payload[field])
+            # Явно указанная общая оценка сохраняется как есть, иначе она пересчитывается по данным запроса:
+            # после обновления результаты проверки совпадают с ними.
+            grade = payload.get("grade")
+            if grade is None and grades_changed and calculate_grade is not None:
+                grade = calculate_grade(
+                    {
+                        "inspection_target_id": inspection.inspection_target_id,
+                        "direction_results": [
+                            {**direction_data, "topic_results": direction_data.get("topic_results") or []}
+                            for direction_data in payload.get("direction_results", [])
+                        ],
+                    }
+                )
+            if grade is not None and inspection.grade != grade:
+                inspection.grade = grade
+            if session.is_modified(inspection) or grades_changed or direction_updates or topic_updates:
+                inspection.updated_date = datetime.now()
+            session.flush()
+            return InspectionDB._load_inspections(
+                session, [inspection_id], [inspection.inspection_date], populate_existing=True
+            )[0]
 
     @staticmethod
-    def get_overall_results_by_inspection_target_id(inspection_target_id: str):
+    def _group_by(items, key: str) -> Dict[str, List]:
+        """Сгруппировать сохраненные результаты по ID направления/поднаправления (в порядке ID записей)."""
+        grouped = {}
+        for item in sorted(items, key=lambda item: item.id):
+            grouped.setdefault(getattr(item, key), []).append(item)
+        return grouped
+
+    @staticmethod
+    def _topic_row(topic_data: Dict, direction_result_id: uuid.UUID, inspection_date: datetime) -> Dict:
+        return {
+            "id": uuid7(),
+            "grade": topic_data.get("grade"),
+            "description": topic_data.get("description"),
+            "topic_id": topic_data.get("topic_id"),
+            "direction_result_id": direction_result_id,
+            "inspection_date": inspection_date,
+        }
+
+    @staticmethod
+    def get_overall_results_by_inspection_target_id(inspection_target_id: str) -> List[LatestTopicResult]:
         """
         Получить последний результат по каждому поднаправлению для inspection_target.
 
+        Данные берутся из модели чтения tables.latest_topic_result (поиск по индексу ключа), которая поддерживается
+        триггерами при изменении результатов проверок. Модель хранит последний результат по каждому проверяющему
+        органу: RLS оставляет записи видимых пользователю органов, из них выбирается самая поздняя.
+
         :param inspection_target_id: ID inspection_target
         :return: Список результатов
         """
 
         with session_scope() as session:
-            # Эта часть на случай если нужно будет возвращать все поднаправления (даже без оценки)
-            inspection_target_type = (
-                select(InspectionTargetType)
-                .join(InspectionTarget)
-                .where(InspectionTarget.id == inspection_target_id)
-                .cte("inspection_target_type")
-            )
-            topics_for_target_type = (
-                select(Topic)
-                .join(InspectionTargetTypeTopicRel)
-                .join(inspection_target_type)
-                .cte("topics_for_target_type")
-            )
-            # Основные запросы
-            topic_results_with_date = (
-                select(TopicResult, InspectionResult.created_date)
-                .join(DirectionResult, TopicResult.direction_result)
-                .join(InspectionResult)
-                # .join(topics_for_target_type)
-                .cte("topic_results_with_date")
-            )
-            latest_result_dates = (
-                select(
-                    topic_results_with_date.c.topic_id,
-                    func.max(topic_results_with_date.c.created_date).label("created_date"),
-                )
-                .group_by(topic_results_with_date.c.topic_id)
-                .cte("latest_result_dates")
-            )
-            latest_results = (
-                select(TopicResult)
-                .join(topic_results_with_date, TopicResult.id == topic_results_with_date.c.id)
-                .join(
-                    latest_result_dates,
-                    (latest_result_dates.c.topic_id == topic_results_with_date.c.topic_id)
-                    & (latest_result_dates.c.created_date == topic_results_with_date.c.created_date),
+            query = (
+                select(LatestTopicResult)
+                .where(LatestTopicResult.inspection_target_id == inspection_target_id)
+                .distinct(LatestTopicResult.topic_id)
+                .order_by(
+                    LatestTopicResult.topic_id,
+                    LatestTopicResult.created_date.desc(),
+                    LatestTopicResult.topic_result_id.desc(),
                 )
             )
-            res = session.execute(latest_results).scalars().all()
-            return TopicResultSchema(many=True).dump(res)
+            return session.execute(query).scalars().all()
+
+    @staticmethod
+    def rebuild_latest_topic_results() -> int:
+        """
+        Полностью перестроить модель чтения последних результатов по поднаправлениям.
+
+        :return: Количество записей модели чтения
+        """
+
+        with session_scope() as session:
+            return session.execute(select(func.tables.rebuild_latest_topic_result())).scalar_one()
+
+
+class PartitionDB:
+    """
+    Класс для обслуживания секций таблиц результатов проверок.
+
+    inspection_result, direction_result и topic_result секционированы по месяцам даты проверки
+    (секции <таблица>_pYYYYMM, миграция 0.0.0.11). Секции создаются заранее командой maintain-partitions
+    (app.sh запускает ее при старте и далее раз в сутки), а не при записи проверок: присоединение секции
+    клонирует внешние ключи дерева проверки и блокирует запись в родительские таблицы.
+    """
+
+    # Месяцы, секции которых уже есть, и время проверки (monotonic): проверка в БД выполняется не чаще раза
+    # в PARTITION_CHECK_TTL на месяц. Секции отсоединяются командой в другом процессе, поэтому кэш устаревает.
+    _months: Dict[datetime, float] = {}
+
+    @staticmethod
+    def create_partitions(date_from: datetime, date_to: datetime) -> int:
+        """
+        Создать недостающие секции для месяцев периода (команда maintain-partitions).
+
+        Выполняется отдельной транзакцией. Пока секции присоединяются, запись в таблицы дерева проверки ждет,
+        поэтому блокировки ожидаются не дольше lock_timeout: при их недоступности команда завершается ошибкой
+        и повторяется при следующем запуске.
+
+        :param date_from: Начало периода (месяц этой даты)
+        :param date_to: Конец периода (включая месяц этой даты)
+        :return: Количество созданных секций
+        """
+
+        with session_maker() as session, session.begin():
+            # Присоединение секций конфликтует с записью в таблицы дерева: не ждать долго и не задерживать запись.
+            session.execute(text("SET LOCAL lock_timeout = '5s'"))
+            return session.execute(
+                select(func.tables.create_inspection_partitions(date_from, date_to))
+            ).scalar_one()
+
+    @staticmethod
+    def check_partitions(dates: Iterable[datetime]):
+        """
+        Проверить наличие секций для дат проверок (перед записью, секции при записи не создаются).
+
+        :param dates: Даты проверок
+        :raises ValueError: Если для месяца даты нет секции
+        """
+        now = monotonic()
+        months = {
+            month
+            for month in map(PartitionDB._month, dates)
+            if now - PartitionDB._months.get(month, -PARTITION_CHECK_TTL) >= PARTITION_CHECK_TTL
+        }
+        if not months:
+            return
+        names = {f"inspection_result_p{month:%Y%m}": month for month in months}
+        with session_scope() as session:
+            existing = {
+                names[name]
+                for name in session.execute(
+                    text(
+                        "SELECT name FROM unnest(CAST(:names AS text[])) name"
+                        " WHERE to_regclass('tables.' || name) IS NOT NULL"
+                    ),
+                    {"names": list(names)},
+                ).scalars()
+            }
+        for month in months:
+            if month in existing:
+                PartitionDB._months[month] = now
+            else:
+                PartitionDB._months.pop(month, None)
+        missing = sorted(months - existing)
+        if missing:
+            raise ValueError(PartitionDB.missing_message(missing[0]))
+
+    @staticmethod
+    def forget(date: datetime):
+        """Забыть о секции месяца даты (запись не нашла секцию: она отсоединена после проверки)."""
+        PartitionDB._months.pop(PartitionDB._month(date), None)
+
+    @staticmethod
+    def is_missing_partition(error: DBAPIError) -> bool:
+        """Ошибка записи в секционированную таблицу: нет секции для значения ключа секционирования."""
+        # Нарушение CHECK-ограничения всегда указывает его имя, отсутствие секции - нет (не зависит от lc_messages).
+        orig = error.orig
+        return getattr(orig, "pgcode", None) == errorcodes.CHECK_VIOLATION and orig.diag.constraint_name is None
+
+    @staticmethod
+    def missing_message(date: datetime) -> str:
+        return (
+            f"Нет секции результатов проверок для месяца {date:%Y-%m}"
+            " (секции создает команда maintain-partitions)"
+        )
+
+    @staticmethod
+    def detach_partitions(before: datetime) -> int:
+        """
+        Отсоединить секции месяцев, закончившихся до даты, и перенести их в схему archive.
+
+        Архивные таблицы не видны в запросах к рабочим таблицам, их можно выгрузить (pg_dump -t) и удалить.
+
+        :param before: Граница: отсоединяются месяцы, целиком предшествующие ей
+        :return: Количество отсоединенных месяцев
+        """
+
+        with session_scope() as session:
+            return session.execute(select(func.tables.detach_inspection_partitions(before))).scalar_one()
+
+    @staticmethod
+    def _month(date: datetime) -> datetime:
+        return datetime(date.year, date.month, 1)
 
 
 class InspectionTargetsDB:
@@ -318,6 +720,7 @@ class InspectionTargetsDB:
         with session_scope() as session:
             new_inspection_target = InspectionTarget(name=payload.get("name"))
             session.add(new_inspection_target)
+            session.flush()
         return new_inspection_target
 
     @staticmethod
@@ -336,95 +739,188 @@ class InspectionTargetsDB:
                 return query
 
 
-class DirectionsDB:
-    """Класс для работы с направлениями и поднаправлениями проверок."""
+class RecalculationDB:
+    """Класс для чтения и записи данных пересчета оценок сохраненных проверок."""
 
     @staticmethod
-    def get_criteria_result_directions(direction_grades, inspection_target_id):
-        direction_grades = [direction_grade for direction_grade in direction_grades if direction_grade[1] is not None]
-        if not direction_grades:
-            return []
+    def stream_inspections(
+        inspection_target_type_id: Optional[str], batch_size: int
+    ) -> Iterator[Tuple[object, List]]:
+        """
+        Потоковое чтение проверок пачками через серверный курсор (в порядке первичного ключа, без сортировки).
+
+        Чтение выполняется в отдельной сессии, которая остается открытой, пока читается поток;
+        с той же сессией выполняются запросы результатов направлений и поднаправлений пачки.
+
+        :param inspection_target_type_id: Только проверки субъектов этого типа (None - все)
+        :param batch_size: Размер пачки
+        :return: Пары (сессия чтения, строки пачки (id, inspection_date, inspection_target_id, grade))
+        """
+        query = select(
+            InspectionResult.id,
+            InspectionResult.inspection_date,
+            InspectionResult.inspection_target_id,
+            InspectionResult.grade,
+        ).order_by(InspectionResult.id)
+        if inspection_target_type_id is not None:
+            query = query.join(InspectionTarget, InspectionTarget.id == InspectionResult.inspection_target_id).where(
+                InspectionTarget.type_id == inspection_target_type_id
+            )
+        with session_maker() as session:
+            result = session.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+            for partition in result.partitions():
+                yield session, partition
+
+    @staticmethod
+    def get_direction_results(session, inspection_ids: List[uuid.UUID]) -> List:
+        return session.execute(
+            select(
+                DirectionResult.inspection_result_id,
+                DirectionResult.id,
+                DirectionResult.direction_id,
+                DirectionResult.grade,
+            )
+            .where(DirectionResult.inspection_result_id.in_(inspection_ids))
+            .order_by(DirectionResult.inspection_result_id, DirectionResult.id)
+        ).all()
+
+    @staticmethod
+    def get_topic_results(session, inspection_ids: List[uuid.UUID]) -> List:
+        return session.execute(
+            select(TopicResult.direction_result_id, TopicResult.topic_id, TopicResult.grade)
+            .join(DirectionResult, DirectionResult.id == TopicResult.direction_result_id)
+            .where(DirectionResult.inspection_result_id.in_(inspection_ids))
+            .order_by(TopicResult.direction_result_id, TopicResult.id)
+        ).all()
+
+    @staticmethod
+    def update_grades(grades: List[Dict]):
+        """
+        Пакетное обновление общих оценок проверок по первичному ключу (отдельной транзакцией).
+
+        :param grades: Словари {"id": ..., "inspection_date": ..., "grade": ...}
+        """
+        if not grades:
+            return
         with session_scope() as session:
+            session.execute(update(InspectionResult), grades)
 
-            subq = session.query(
-                func.unnest(array([grade[0] for grade in direction_grades])).label("direction_id"),
-                func.unnest(array([grade[1] for grade in direction_grades])).label("direction_grade"),
-            ).subquery("arr")
 
-            query = (
-                select(GradeCriteriaDirection.direction_id, GradeCriteriaDirection.result_grade)
-                .join(InspectionTargetTypeDirectionRel)
-                .join(InspectionTargetType)
-                .join(InspectionTarget)
-                .join(
-                    subq,
-                    (subq.c.direction_id == GradeCriteriaDirection.direction_id)
-                    & (subq.c.direction_grade == GradeCriteriaDirection.direction_grade),
-                )
-                .where((InspectionTarget.id == inspection_target_id))
+class RecalculationJobDB:
+    """Класс для работы с заданиями пересчета оценок."""
+
+    @staticmethod
+    def create_job(strategy: Optional[str], inspection_target_type_id: Optional[str]) -> RecalculationJob:
+        """
+        Создать задание пересчета (от имени текущего пользователя).
+
+        :param strategy: Имя стратегии расчета (None - заданная для типа проверяемого субъекта)
+        :param inspection_target_type_id: Пересчитывать только проверки субъектов этого типа (None - все)
+        :return: Задание
+        """
+
+        with session_scope() as session:
+            job = RecalculationJob(strategy=strategy, inspection_target_type_id=inspection_target_type_id)
+            session.add(job)
+            session.flush()
+            session.refresh(job)
+            return job
+
+    @staticmethod
+    def get_job(job_id: uuid.UUID) -> Optional[RecalculationJob]:
+        with session_scope() as session:
+            return session.get(RecalculationJob, job_id)
+
+    @staticmethod
+    def update_job(job_id: uuid.UUID, **values):
+        """
+        Обновить состояние задания (в транзакции текущей сессии, если она открыта).
+
+        :param job_id: ID задания
+        :param values: Новые значения полей (status, processed, changed, failed, error)
+        """
+
+        with session_scope() as session:
+            session.execute(
+                update(RecalculationJob)
+                .where(RecalculationJob.id == job_id)
+                .values(updated_date=func.localtimestamp(), **values)
             )
-            res = session.execute(query).all()
-            return res
+
+
+class RefsDB:
+    """Класс для чтения справочников (схема refs), используемых при расчете оценок."""
 
     @staticmethod
-    def get_criteria_result_topics(topic_grades, inspection_target_id):
-        topic_grades = [topic_grade for topic_grade in topic_grades if topic_grade[1] is not None]
-        if not topic_grades:
-            return []
+    def get_inspection_target_types():
+        with session_scope() as session:
+            return session.execute(
+                select(InspectionTargetType.id, InspectionTargetType.scale_id, InspectionTargetType.strategy)
+            ).all()
+
+    @staticmethod
+    def get_inspection_target_type_ids():
         with session_scope() as session:
+            return session.execute(select(InspectionTarget.id, InspectionTarget.type_id)).all()
 
-            subq = session.query(
-                func.unnest(array([grade[0] for grade in topic_grades])).label("topic_id"),
-                func.unnest(array([grade[1] for grade in topic_grades])).label("topic_grade"),
-            ).subquery("arr")
+    @staticmethod
+    def get_direction_rels():
+        with session_scope() as session:
+            return session.execute(
+                select(
+                    InspectionTargetTypeDirectionRel.inspection_target_type_id,
+                    InspectionTargetTypeDirectionRel.direction_id,
+                    InspectionTargetTypeDirectionRel.is_critical,
+                    InspectionTargetTypeDirectionRel.weight,
+                    InspectionTargetTypeDirectionRel.is_ignored,
+                    InspectionTargetTypeDirectionRel.scale_id,
+                )
+            ).all()
 
-            query = (
-                select(GradeCriteriaTopic.topic_id, GradeCriteriaTopic.result_grade)
-                .join(InspectionTargetTypeTopicRel)
-                .join(InspectionTargetType)
-                .join(InspectionTarget)
-                .join(
-                    subq,
-                    (subq.c.topic_id == GradeCriteriaTopic.topic_id)
-                    & (subq.c.topic_grade == GradeCriteriaTopic.topic_grade),
+    @staticmethod
+    def get_topic_rels():
+        with session_scope() as session:
+            return session.execute(
+                select(
+                    InspectionTargetTypeTopicRel.inspection_target_type_id,
+                    InspectionTargetTypeTopicRel.topic_id,
+                    InspectionTargetTypeTopicRel.is_critical,
+                    InspectionTargetTypeTopicRel.weight,
+                    InspectionTargetTypeTopicRel.is_ignored,
+                    InspectionTargetTypeTopicRel.scale_id,
                 )
-                .where((InspectionTarget.id == inspection_target_id))
-            )
-            res = session.execute(query).all()
-            return res
+            ).all()
 
     @staticmethod
-    def get_topic_info_by_ids(topic_ids, inspection_target_id):
+    def get_criteria_directions():
+        with session_scope() as session:
+            return session.execute(
+                select(
+                    GradeCriteriaDirection.inspection_target_type_id,
+                    GradeCriteriaDirection.direction_id,
+                    GradeCriteriaDirection.direction_grade,
+                    GradeCriteriaDirection.result_grade,
+                )
+            ).all()
 
+    @staticmethod
+    def get_criteria_topics():
         with session_scope() as session:
-            inspection_target_type = (
-                select(InspectionTargetType)
-                .join(InspectionTarget)
-                .where(InspectionTarget.id == inspection_target_id)
-                .cte()
-            )
-            query = select(InspectionTargetTypeTopicRel).join(
-                inspection_target_type,
-                (InspectionTargetTypeTopicRel.inspection_target_type_id == inspection_target_type.c.id)
-                & (InspectionTargetTypeTopicRel.topic_id.in_(topic_ids)),
-            )
-            res = session.execute(query).scalars().all()
-            return res
+            return session.execute(
+                select(
+                    GradeCriteriaTopic.inspection_target_type_id,
+                    GradeCriteriaTopic.topic_id,
+                    GradeCriteriaTopic.topic_grade,
+                    GradeCriteriaTopic.result_grade,
+                )
+            ).all()
 
     @staticmethod
-    def get_direction_info_by_ids(direction_ids, inspection_target_id):
+    def get_scales():
+        with session_scope() as session:
+            return session.execute(select(Scale.id, Scale.max_value)).all()
 
+    @staticmethod
+    def get_grades():
         with session_scope() as session:
-            inspection_target_type = (
-                select(InspectionTargetType)
-                .join(InspectionTarget)
-                .where(InspectionTarget.id == inspection_target_id)
-                .cte()
-            )
-            query = select(InspectionTargetTypeDirectionRel).join(
-                inspection_target_type,
-                (InspectionTargetTypeDirectionRel.inspection_target_type_id == inspection_target_type.c.id)
-                & (InspectionTargetTypeDirectionRel.direction_id.in_(direction_ids)),
-            )
-            res = session.execute(query).scalars().all()
-            return res
+            return session.execute(select(Grade.scale_id, Grade.value, Grade.name)).all()
@@ -0,0 +1,278 @@
+import contextvars
+import logging
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from app.api.inspection.db import RecalculationDB, RecalculationJobDB
+from app.api.inspection.refs_cache import RefsSnapshot, RelInfo, TargetTypeRefs, refs_cache
+from app.api.inspection.service import CalculatableBatch, GradeCalculationStrategy, get_strategy, resolve_strategy
+from app.common.models import RecalculationJob
+from app.config import RECALCULATION_BATCH_SIZE
+from app.session import current_session, session_scope
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecalculationProgress:
+    """Ход пересчета: обработано проверок, изменено оценок, проверок, оценку которых рассчитать нельзя."""
+
+    processed: int = 0
+    changed: int = 0
+    failed: int = 0
+
+
+def _floats(values: Sequence) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _batch(
+    owner: Sequence[int], size: int, grades: np.ndarray, infos: Sequence[Optional[RelInfo]] = None, matched=None
+) -> CalculatableBatch:
+    """Сгруппировать элементы по владельцу (с сохранением порядка внутри группы)."""
+    owner = np.asarray(owner, dtype=np.int64)
+    order = np.argsort(owner, kind="stable")
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=size), out=offsets[1:])
+    batch = CalculatableBatch(offsets=offsets, grades=grades[order])
+    if infos is not None:
+        infos = [infos[index] for index in order]
+        batch.is_critical = np.array([info is not None and bool(info.is_critical) for info in infos], dtype=bool)
+        batch.weights = _floats([None if info is None else info.weight for info in infos])
+        batch.is_ignored = np.array([info is not None and bool(info.is_ignored) for info in infos], dtype=bool)
+    if matched is not None:
+        batch.matched_result_grades = matched[order]
+    return batch
+
+
+class GradeRecalculation:
+    """
+    Пересчет общих оценок сохраненных проверок после изменения справочников (критериев, весов, критичности).
+
+    Проверки читаются потоком пачками, оценки пачки рассчитываются векторно (NumPy) с той же семантикой,
+    что и InspectionResultService, в БД пакетно записываются только изменившиеся оценки (каждая пачка -
+    отдельной транзакцией). Оценки направлений считаются входными данными и не пересчитываются,
+    кроме отсутствующих: они, как и при сохранении проверки, рассчитываются по поднаправлениям.
+    """
+
+    def __init__(
+        self,
+        calculation_strategy: GradeCalculationStrategy = None,
+        inspection_target_type_id: Optional[str] = None,
+        batch_size: int = RECALCULATION_BATCH_SIZE,
+        refs_snapshot: RefsSnapshot = None,
+        on_progress: Callable[[RecalculationProgress], None] = None,
+        job_id: Optional[uuid.UUID] = None,
+    ):
+        """
+        :param calculation_strategy: Стратегия расчета оценок (None - заданная для типа проверяемого субъекта)
+        :param inspection_target_type_id: Пересчитывать только проверки субъектов этого типа (None - все)
+        :param batch_size: Размер пачки
+        :param refs_snapshot: Снимок справочников (по умолчанию - актуальный из кэша)
+        :param on_progress: Вызывается после каждой пачки
+        :param job_id: Задание (tables.recalculation_job), в которое записывается ход пересчета
+        """
+        self.calculation_strategy = calculation_strategy
+        self.inspection_target_type_id = inspection_target_type_id
+        self.batch_size = batch_size
+        self.refs = refs_snapshot or refs_cache.get()
+        self.on_progress = on_progress
+        self.job_id = job_id
+
+    def run(self) -> RecalculationProgress:
+        """
+        Пересчитать оценки.
+
+        Если указано задание, его состояние обновляется при запуске, после каждой пачки (в транзакции оценок пачки)
+        и по завершении, в том числе с ошибкой.
+        """
+        self._update_job(status="running")
+        try:
+            progress = self._run()
+        except Exception as e:
+            self._update_job(status="failed", error=repr(e))
+            raise
+        self._update_job(status="done")
+        return progress
+
+    def _run(self) -> RecalculationProgress:
+        progress = RecalculationProgress()
+        for session, rows in RecalculationDB.stream_inspections(self.inspection_target_type_id, self.batch_size):
+            inspection_ids = [row.id for row in rows]
+            grades = self.calculate(
+                inspection_ids,
+                [self.refs.for_inspection_target(row.inspection_target_id) for row in rows],
+                RecalculationDB.get_direction_results(session, inspection_ids),
+                RecalculationDB.get_topic_results(session, inspection_ids),
+            )
+            current = _floats([row.grade for row in rows])
+            failed = np.isnan(grades)
+            changed = np.flatnonzero(~failed & ((grades != current) | np.isnan(current)))
+
+            progress.processed += len(rows)
+            progress.changed += len(changed)
+            progress.failed += int(failed.sum())
+            with session_scope():
+                RecalculationDB.update_grades(
+                    [
+                        {"id": rows[i].id, "inspection_date": rows[i].inspection_date, "grade": float(grades[i])}
+                        for i in changed
+                    ]
+                )
+                self._update_job(processed=progress.processed, changed=progress.changed, failed=progress.failed)
+            logger.info(
+                "Пересчет оценок: обработано %s, изменено %s, ошибок %s",
+                progress.processed,
+                progress.changed,
+                progress.failed,
+            )
+            if self.on_progress is not None:
+                self.on_progress(progress)
+        return progress
+
+    def _update_job(self, **values):
+        if self.job_id is not None:
+            RecalculationJobDB.update_job(self.job_id, **values)
+
+    def calculate(
+        self,
+        inspection_ids: List[str],
+        refs: List[Optional[TargetTypeRefs]],
+        direction_rows: Sequence,
+        topic_rows: Sequence,
+    ) -> np.ndarray:
+        """
+        Рассчитать общие оценки пачки проверок.
+
+        :param inspection_ids: ID проверок
+        :param refs: Справочная информация типа субъекта каждой проверки
+        :param direction_rows: Результаты направлений (inspection_result_id, id, direction_id, grade)
+        :param topic_rows: Результаты поднаправлений (direction_result_id, topic_id, grade)
+        :return: Оценки; NaN - оценку рассчитать нельзя (расчет в сервисе завершился бы исключением)
+        """
+        # Проверки группируются по стратегиям расчета, каждая группа рассчитывается отдельной пачкой.
+        by_strategy = {}
+        for index, item_refs in enumerate(refs):
+            strategy = self.calculation_strategy or resolve_strategy(item_refs)
+            by_strategy.setdefault(strategy, []).append(index)
+        if len(by_strategy) <= 1:
+            strategy = next(iter(by_strategy), self.calculation_strategy or resolve_strategy(None))
+            return self._calculate(strategy, inspection_ids, refs, direction_rows, topic_rows)
+
+        result = np.full(len(inspection_ids), np.nan)
+        for strategy, indexes in by_strategy.items():
+            selected = {inspection_ids[index] for index in indexes}
+            group_directions = [row for row in direction_rows if row.inspection_result_id in selected]
+            direction_ids = {row.id for row in group_directions}
+            result[indexes] = self._calculate(
+                strategy,
+                [inspection_ids[index] for index in indexes],
+                [refs[index] for index in indexes],
+                group_directions,
+                [row for row in topic_rows if row.direction_result_id in direction_ids],
+            )
+        return result
+
+    def _calculate(
+        self,
+        strategy: GradeCalculationStrategy,
+        inspection_ids: List[str],
+        refs: List[Optional[TargetTypeRefs]],
+        direction_rows: Sequence,
+        topic_rows: Sequence,
+    ) -> np.ndarray:
+        """Рассчитать общие оценки пачки проверок одной стратегией."""
+        size = len(inspection_ids)
+        owners = {inspection_id: index for index, inspection_id in enumerate(inspection_ids)}
+        direction_owner = [owners[row.inspection_result_id] for row in direction_rows]
+        direction_index = {row.id: index for index, row in enumerate(direction_rows)}
+        topic_owner = [direction_index[row.direction_result_id] for row in topic_rows]
+
+        direction_refs = [refs[owner] for owner in direction_owner]
+        topic_refs = [direction_refs[owner] for owner in topic_owner]
+        direction_ids = [row.direction_id for row in direction_rows]
+        topic_ids = [row.topic_id for row in topic_rows]
+        direction_grades = _floats([row.grade for row in direction_rows])
+        topic_grades = _floats([row.grade for row in topic_rows])
+
+        if strategy.uses_criteria:
+            matched = np.concatenate(
+                [
+                    self._lookup(direction_refs, direction_ids, direction_grades, "direction_criteria"),
+                    self._lookup(topic_refs, topic_ids, topic_grades, "topic_criteria"),
+                ]
+            )
+            owner = direction_owner + [direction_owner[owner] for owner in topic_owner]
+            return strategy.calculate_batch(_batch(owner, size, np.full(len(owner), np.nan), matched=matched))
+
+        failed = np.zeros(size, dtype=bool)
+        # Отсутствующие оценки направлений рассчитываются по поднаправлениям.
+        missing = np.isnan(direction_grades)
+        if missing.any():
+            topic_infos = [
+                None if refs is None else refs.topics.get(topic_id) for refs, topic_id in zip(topic_refs, topic_ids)
+            ]
+            topic_result = strategy.calculate_batch(_batch(topic_owner, len(direction_rows), topic_grades, topic_infos))
+            direction_grades[missing] = topic_result[missing]
+            # Ошибка расчета направления - ошибка всей проверки, даже если направление игнорируется.
+            failed[np.asarray(direction_owner, dtype=np.int64)[missing & np.isnan(topic_result)]] = True
+
+        direction_infos = [
+            None if refs is None else refs.directions.get(direction_id)
+            for refs, direction_id in zip(direction_refs, direction_ids)
+        ]
+        result = strategy.calculate_batch(_batch(direction_owner, size, direction_grades, direction_infos))
+        result[failed] = np.nan
+        return result
+
+    @staticmethod
+    def _lookup(refs: List[Optional[TargetTypeRefs]], item_ids: List[str], grades: np.ndarray, table: str):
+        """Результирующие оценки по таблицам критериев, сгруппированно по типам проверяемых субъектов."""
+        result = np.full(len(item_ids), np.nan)
+        positions = {}
+        for position, item_refs in enumerate(refs):
+            if item_refs is not None:
+                positions.setdefault(item_refs.id, (item_refs, []))[1].append(position)
+        for item_refs, item_positions in positions.values():
+            item_positions = np.asarray(item_positions)
+            result[item_positions] = getattr(item_refs, table).lookup_many(
+                [item_ids[position] for position in item_positions], grades[item_positions]
+            )
+        return result
+
+
+def start_recalculation_job(strategy: Optional[str], inspection_target_type_id: Optional[str]) -> RecalculationJob:
+    """
+    Создать задание пересчета и выполнить его в фоновом потоке.
+
+    Поток выполняет пересчет от имени пользователя, создавшего задание (роль запроса копируется в контекст потока),
+    поэтому пересчитываются только доступные ему проверки. Ход выполнения читается из tables.recalculation_job.
+    Вызывается вне транзакции запроса: поток должен видеть созданное задание.
+
+    :param strategy: Имя стратегии расчета (None - заданная для типа проверяемого субъекта)
+    :param inspection_target_type_id: Пересчитывать только проверки субъектов этого типа (None - все)
+    :return: Созданное задание
+    """
+    job = RecalculationJobDB.create_job(strategy, inspection_target_type_id)
+    recalculation = GradeRecalculation(
+        get_strategy(strategy) if strategy else None, inspection_target_type_id, job_id=job.id
+    )
+    context = contextvars.copy_context()
+    threading.Thread(
+        target=context.run, args=(_run_job, recalculation), name=f"grade-recalculation-{job.id}", daemon=True
+    ).start()
+    return job
+
+
+def _run_job(recalculation: GradeRecalculation):
+    # Пачки пересчета - отдельные транзакции, не связанные с сессией запроса.
+    current_session.set(None)
+    try:
+        recalculation.run()
+    except Exception:
+        logger.exception("Ошибка задания пересчета оценок %s", recalculation.job_id)
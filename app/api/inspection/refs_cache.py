@@ -0,0 +1,256 @@
+import logging
+import select as select_module
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional
+
+from psycopg2 import sql
+
+from app.api.inspection.criteria import CriteriaTable
+from app.api.inspection.db import RefsDB
+from app.api.inspection.shared_refs import share_criteria_tables
+from app.config import DEFAULT_CALCULATION_STRATEGY, REFS_CACHE_CHANNEL, REFS_CACHE_TTL, REFS_SHARED_DIR
+from app.session import engine, login_session_scope
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RelInfo:
+    """Вес, критичность и игнорирование направления/поднаправления для типа проверяемого субъекта."""
+
+    is_critical: bool
+    weight: float
+    is_ignored: bool
+    scale_id: str
+
+
+@dataclass(frozen=True)
+class TargetTypeRefs:
+    """Справочная информация для расчета оценок одного типа проверяемого субъекта."""
+
+    id: str
+    scale_id: str
+    directions: Dict[str, RelInfo] = field(default_factory=dict)
+    topics: Dict[str, RelInfo] = field(default_factory=dict)
+    direction_criteria: CriteriaTable = field(default_factory=lambda: CriteriaTable([]))
+    topic_criteria: CriteriaTable = field(default_factory=lambda: CriteriaTable([]))
+    strategy: str = DEFAULT_CALCULATION_STRATEGY
+
+
+@dataclass(frozen=True)
+class RefsSnapshot:
+    """Неизменяемый снимок справочников, версия увеличивается при каждой перезагрузке."""
+
+    version: int
+    loaded_at: float
+    target_types: Dict[str, TargetTypeRefs]
+    target_type_ids: Dict[str, str]
+    scales: Dict[str, Optional[float]]
+    grades: Dict[str, Dict[float, str]]
+
+    def for_inspection_target(self, inspection_target_id: str) -> Optional[TargetTypeRefs]:
+        """
+        Получить справочную информацию по ID проверяемого субъекта.
+
+        :param inspection_target_id: ID проверяемого субъекта
+        :return: Справочная информация его типа или None, если тип неизвестен
+        """
+        return self.target_types.get(self.target_type_ids.get(inspection_target_id))
+
+
+def load_refs_snapshot(version: int) -> RefsSnapshot:
+    """
+    Загрузить справочники из БД одной транзакцией.
+
+    Снимок общий для всех запросов процесса, поэтому загружается в отдельном соединении от имени логина пула
+    (при DB_SET_ROLE роль пользователя запроса может не иметь доступа к справочникам).
+
+    :param version: Версия нового снимка
+    :return: Снимок справочников
+    """
+    with login_session_scope():
+        target_types = RefsDB.get_inspection_target_types()
+        target_type_ids = RefsDB.get_inspection_target_type_ids()
+        direction_rels = RefsDB.get_direction_rels()
+        topic_rels = RefsDB.get_topic_rels()
+        criteria_directions = RefsDB.get_criteria_directions()
+        criteria_topics = RefsDB.get_criteria_topics()
+        scales = RefsDB.get_scales()
+        grades = RefsDB.get_grades()
+
+    directions = {}
+    for rel in direction_rels:
+        directions.setdefault(rel.inspection_target_type_id, {})[rel.direction_id] = RelInfo(
+            rel.is_critical, rel.weight, rel.is_ignored, rel.scale_id
+        )
+    topics = {}
+    for rel in topic_rels:
+        topics.setdefault(rel.inspection_target_type_id, {})[rel.topic_id] = RelInfo(
+            rel.is_critical, rel.weight, rel.is_ignored, rel.scale_id
+        )
+    direction_criteria = {}
+    for criteria in criteria_directions:
+        direction_criteria.setdefault(criteria.inspection_target_type_id, []).append(
+            (criteria.direction_id, criteria.direction_grade, criteria.result_grade)
+        )
+    topic_criteria = {}
+    for criteria in criteria_topics:
+        topic_criteria.setdefault(criteria.inspection_target_type_id, []).append(
+            (criteria.topic_id, criteria.topic_grade, criteria.result_grade)
+        )
+
+    # Таблицы критериев компилируются при каждой загрузке снимка, т.е. при каждом изменении справочников.
+    by_type = {
+        target_type.id: TargetTypeRefs(
+            id=target_type.id,
+            scale_id=target_type.scale_id,
+            directions=directions.get(target_type.id, {}),
+            topics=topics.get(target_type.id, {}),
+            direction_criteria=CriteriaTable(direction_criteria.get(target_type.id, [])),
+            topic_criteria=CriteriaTable(topic_criteria.get(target_type.id, [])),
+            strategy=target_type.strategy,
+        )
+        for target_type in target_types
+    }
+
+    grades_by_scale = {}
+    for grade in grades:
+        grades_by_scale.setdefault(grade.scale_id, {})[grade.value] = grade.name
+
+    return RefsSnapshot(
+        version=version,
+        loaded_at=time.monotonic(),
+        target_types=by_type,
+        target_type_ids={target.id: target.type_id for target in target_type_ids},
+        scales={scale.id: scale.max_value for scale in scales},
+        grades=grades_by_scale,
+    )
+
+
+def share_snapshot(snapshot: RefsSnapshot, directory: str) -> RefsSnapshot:
+    """
+    Перенести таблицы критериев снимка в общую память процессов (см. shared_refs).
+
+    :param snapshot: Снимок справочников
+    :param directory: Каталог файлов таблиц
+    :return: Снимок с теми же данными
+    """
+    target_types = list(snapshot.target_types.items())
+    tables = share_criteria_tables(
+        [table for _, refs in target_types for table in (refs.direction_criteria, refs.topic_criteria)], directory
+    )
+    return replace(
+        snapshot,
+        target_types={
+            type_id: replace(refs, direction_criteria=tables[2 * index], topic_criteria=tables[2 * index + 1])
+            for index, (type_id, refs) in enumerate(target_types)
+        },
+    )
+
+
+class RefsCache:
+    """
+    Внутрипроцессный кэш справочников.
+
+    Снимок перезагружается целиком при получении уведомления об изменении справочников
+    (LISTEN/NOTIFY, см. миграцию 0.0.0.3) или по истечении TTL, если уведомление было потеряно.
+    Если задан каталог shared_dir, таблицы критериев хранятся в общей памяти рабочих процессов.
+    """
+
+    def __init__(
+        self,
+        ttl: float = REFS_CACHE_TTL,
+        channel: str = REFS_CACHE_CHANNEL,
+        shared_dir: Optional[str] = REFS_SHARED_DIR,
+    ):
+        self.ttl = ttl
+        self.channel = channel
+        self.shared_dir = shared_dir
+        self._snapshot: Optional[RefsSnapshot] = None
+        self._version = 0
+        self._stale = True
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def get(self) -> RefsSnapshot:
+        """Получить актуальный снимок справочников, при необходимости перезагрузив его."""
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or self._stale or time.monotonic() - snapshot.loaded_at >= self.ttl:
+                self._stale = False
+                self._version += 1
+                try:
+                    snapshot = load_refs_snapshot(self._version)
+                except Exception:
+                    self._stale = True
+                    raise
+                if self.shared_dir:
+                    try:
+                        snapshot = share_snapshot(snapshot, self.shared_dir)
+                    except OSError:
+                        logger.exception("Не удалось разместить таблицы критериев в общей памяти")
+                self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        """Пометить снимок устаревшим, он будет перезагружен при следующем обращении."""
+        self._stale = True
+
+    def start_listener(self):
+        """Запустить фоновый поток, слушающий уведомления об изменении справочников."""
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(target=self._listen, name="refs-cache-listener", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = engine.raw_connection()
+                # Соединение слушателя не возвращается в пул.
+                connection.detach()
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    self._check_trigger_channels(cursor)
+                # Изменения, пропущенные до подписки, не должны остаться в кэше.
+                self.invalidate()
+                while True:
+                    if select_module.select([dbapi_connection], [], [], self.ttl) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    if dbapi_connection.notifies:
+                        dbapi_connection.notifies.clear()
+                        self.invalidate()
+            except Exception:
+                logger.exception("Ошибка слушателя изменений справочников, переподключение")
+                self.invalidate()
+                if connection is not None:
+                    connection.dbapi_connection.close()
+                time.sleep(5)
+
+    def _check_trigger_channels(self, cursor):
+        """Проверить, что триггеры справочников уведомляют в канал кэша (аргумент триггеров, миграция 0.0.0.3)."""
+        cursor.execute(
+            "SELECT DISTINCT split_part(encode(tgargs, 'escape'), '\\000', 1)"
+            " FROM pg_trigger WHERE tgname = 'notify_refs_changed'"
+        )
+        channels = {row[0] for row in cursor.fetchall()}
+        if channels != {self.channel}:
+            logger.error(
+                "Триггеры справочников уведомляют в каналы %s, кэш слушает %s: изменения справочников"
+                " учитываются только по истечении TTL",
+                sorted(channels),
+                self.channel,
+            )
+
+
+refs_cache = RefsCache()
@@ -1,17 +1,37 @@
-from flask_restx import Namespace, Resource, reqparse
+import json
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import request
+from flask_restx import Namespace, Resource, inputs, reqparse
+from psycopg2 import errorcodes
+from sqlalchemy.exc import DBAPIError
 
 from app.api.inspection.schemas import (
     direction_result_schema_in,
     direction_result_schema_out,
     grade_schema_in,
     grade_schema_out,
+    inspection_bulk_result_schema_out,
     inspection_result_schema_in,
     inspection_result_schema_out,
+    recalculation_job_schema_out,
+    simulation_direction_schema_out,
+    simulation_schema_out,
     topic_result_schema_in,
     topic_result_schema_out,
     user_schema_in,
 )
-from app.api.inspection.service import InspectionResultService, StrategyCriteria
+from app.api.inspection.serializers import (
+    inspection_results_response,
+    json_response,
+    serialize_inspection_result,
+)
+from app.api.inspection.db import RecalculationJobDB
+from app.api.inspection.recalculation import start_recalculation_job
+from app.api.inspection.service import STRATEGIES, GradeCalculationStrategy, InspectionResultService, get_strategy
+from app.session import transactional
 
 inspection_api = Namespace("Результаты инспекционных проверок")
 inspections_api = Namespace("Результаты инспекционных проверок")
@@ -25,34 +45,54 @@ inspection_api.models[direction_result_schema_out.name] = direction_result_schem
 inspection_api.models[topic_result_schema_out.name] = topic_result_schema_out
 inspection_api.models[grade_schema_out.name] = grade_schema_out
 inspection_api.models[grade_schema_in.name] = grade_schema_in
+inspection_api.models[inspection_bulk_result_schema_out.name] = inspection_bulk_result_schema_out
+inspection_api.models[recalculation_job_schema_out.name] = recalculation_job_schema_out
+inspection_api.models[simulation_direction_schema_out.name] = simulation_direction_schema_out
+inspection_api.models[simulation_schema_out.name] = simulation_schema_out
+
+STRATEGY_PARAM = "Стратегия расчета: criteria, weights или avg (по умолчанию - заданная для типа проверяемого субъекта)"
 
 
-@inspection_api.route("/inspections/<inspection_id>/")
+def requested_strategy() -> Optional[GradeCalculationStrategy]:
+    """Стратегия расчета из параметра strategy запроса или None, если она не указана."""
+    name = request.args.get("strategy")
+    if not name:
+        return None
+    try:
+        return get_strategy(name)
+    except ValueError as e:
+        inspections_api.abort(400, str(e))
+
+
+@inspection_api.route("/inspections/<uuid:inspection_id>/")
 @inspection_api.param("inspection_id", "ID инспекторской проверки")
 @inspection_api.response(500, "Не найдено")
 class InspectionResultRoute(Resource):
     """Класс для работы с результатами инспекционных проверок по ID."""
 
-    @inspection_api.marshal_with(inspection_result_schema_out)
-    def get(self, inspection_id: str):
+    method_decorators = [transactional]
+
+    @inspection_api.response(200, "Успешно", inspection_result_schema_out)
+    def get(self, inspection_id: uuid.UUID):
         """Получение информации об инспекторской проверке по ID."""
 
         result = InspectionResultService.get_info(inspection_id)
-        return result
+        return json_response(serialize_inspection_result(result))
 
     @inspections_api.marshal_with(inspection_result_schema_out)
-    def delete(self, inspection_id: str):
+    def delete(self, inspection_id: uuid.UUID):
         """Удаление информации об инспекторской проверке из БД по ID."""
 
         result = InspectionResultService.delete_from_db(inspection_id)
         return result
 
+    @inspection_api.param("strategy", STRATEGY_PARAM)
     @inspection_api.expect(inspection_result_schema_in)
     @inspection_api.marshal_with(inspection_result_schema_out)
-    def put(self, inspection_id: str):
+    def put(self, inspection_id: uuid.UUID):
         """Обновление информации об инспекторской проверке в БД по ID."""
 
-        result = InspectionResultService.update_in_db(inspection_id, inspection_api.payload)
+        result = InspectionResultService.update_in_db(inspection_id, inspection_api.payload, requested_strategy())
         return result
 
 
@@ -61,35 +101,54 @@ class InspectionResultRoute(Resource):
 class InspectionsResultRoute(Resource):
     """Класс для работы с результатами инспекционных проверок."""
 
+    method_decorators = [transactional]
+
+    @inspections_api.param("strategy", STRATEGY_PARAM)
     @inspections_api.expect(inspection_result_schema_in)
     @inspections_api.marshal_with(inspection_result_schema_out)
     def post(self):
         """Сохранение информации об инспекторской проверке в БД."""
 
-        # Плейсхолдер для логики определения стратегии (взять информацию из запроса/из бд).
-        strategy = StrategyCriteria()
-
-        result = InspectionResultService(inspections_api.payload, strategy).write_to_db()
+        try:
+            inspection = InspectionResultService(inspections_api.payload, requested_strategy())
+            result = inspection.write_to_db()
+        except ValueError as e:
+            inspections_api.abort(400, str(e))
         return result
 
     @inspections_api.param("limit", "Количество записей", default=10, type=int)
     @inspections_api.param("offset", "Смещение", default=0, type=int)
+    @inspections_api.param(
+        "cursor", "Курсор следующей страницы из заголовка X-Next-Cursor предыдущего ответа (смещение не применяется)"
+    )
     @inspections_api.param("name", "Поиск на названию проверки", type=str)
     @inspections_api.param("grade", "Поиск по оценке", type=str)
     @inspections_api.param("date", "Поиск по дате проверки", type=int)
     @inspections_api.param("start_date", "Поиск по диапазону от введенной даты включительно", type=int)
     @inspections_api.param("end_date", "Поиск по диапазону до введенной даты включительно", type=int)
+    @inspections_api.param(
+        "date_field",
+        "Дата, по которой применяются фильтры date, start_date и end_date",
+        enum=["created_date", "inspection_date"],
+        default="created_date",
+    )
     @inspections_api.param("inspection_organ_id", "Поиск по органу проверки", type=str)
     @inspections_api.param("inspection_target_id", "Поиск по объекту проверки", type=str)
     @inspections_api.param("direction_id", "Поиск по направлению проверки", type=str)
     @inspections_api.param("description", "Поиск по описанию проверки", type=str)
-    @inspections_api.marshal_with(inspection_result_schema_out)
+    @inspections_api.param("search", "Поиск по названию и описанию с упорядочиванием по релевантности", type=str)
+    @inspections_api.param(
+        "search_children", "Искать также по описаниям результатов направлений и поднаправлений", type=bool
+    )
+    @inspections_api.header("X-Next-Cursor", "Курсор следующей страницы, если она может существовать")
+    @inspections_api.response(200, "Успешно", [inspection_result_schema_out])
     def get(self):
         """Получение информации об инспекторских проверках."""
 
         parser = reqparse.RequestParser()
         parser.add_argument("limit", required=False, type=int)
         parser.add_argument("offset", required=False, type=int)
+        parser.add_argument("cursor", required=False, type=str)
         parser.add_argument("name", required=False, type=str)
         parser.add_argument("grade", required=False, type=str)
         parser.add_argument("inspection_organ_id", required=False, type=str)
@@ -97,10 +156,16 @@ class InspectionsResultRoute(Resource):
         parser.add_argument("date", required=False, type=int)
         parser.add_argument("start_date", required=False, type=int)
         parser.add_argument("end_date", required=False, type=int)
+        parser.add_argument(
+            "date_field", required=False, type=str, choices=("created_date", "inspection_date"), default="created_date"
+        )
         parser.add_argument("direction_id", required=False, type=str)
         parser.add_argument("description", required=False, type=str)
+        parser.add_argument("search", required=False, type=str)
+        parser.add_argument("search_children", required=False, type=inputs.boolean, default=False)
         limit = parser.parse_args().get("limit")
         offset = parser.parse_args().get("offset")
+        cursor = parser.parse_args().get("cursor")
         name_filter = parser.parse_args().get("name")
         grade_filter = parser.parse_args().get("grade")
         inspection_organ_id_filter = parser.parse_args().get("inspection_organ_id")
@@ -108,27 +173,152 @@ class InspectionsResultRoute(Resource):
         date_filter = parser.parse_args().get("date")
         start_date_filter = parser.parse_args().get("start_date")
         end_date_filter = parser.parse_args().get("end_date")
+        date_field = parser.parse_args().get("date_field")
         direction_id_filter = parser.parse_args().get("direction_id")
         description_filter = parser.parse_args().get("description")
-        result = InspectionResultService.get_inspections(
-            limit,
-            offset,
-            name_filter,
-            grade_filter,
-            inspection_organ_id_filter,
-            inspection_target_id_filter,
-            date_filter,
-            start_date_filter,
-            end_date_filter,
-            direction_id_filter,
-            description_filter,
-        )
-        return result, 200 if result or result == [] else inspections_api.abort(500)
+        search = parser.parse_args().get("search")
+        search_children = parser.parse_args().get("search_children")
+        try:
+            result, next_cursor = InspectionResultService.get_inspections(
+                limit,
+                offset,
+                name_filter,
+                grade_filter,
+                inspection_organ_id_filter,
+                inspection_target_id_filter,
+                date_filter,
+                start_date_filter,
+                end_date_filter,
+                direction_id_filter,
+                description_filter,
+                cursor,
+                date_field,
+                search,
+                search_children,
+            )
+        except ValueError as e:
+            inspections_api.abort(400, str(e))
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return inspection_results_response(result, headers)
+
+
+@inspections_api.route("/inspections/bulk/")
+@inspections_api.response(400, "Некорректный формат пакета")
+class InspectionsBulkRoute(Resource):
+    """Класс для пакетной загрузки результатов инспекционных проверок."""
+
+    method_decorators = [transactional]
+
+    @inspections_api.expect([inspection_result_schema_in])
+    @inspections_api.marshal_with(inspection_bulk_result_schema_out)
+    def post(self):
+        """
+        Пакетное сохранение информации об инспекторских проверках в БД.
+
+        Тело запроса - JSON-массив проверок либо NDJSON (Content-Type: application/x-ndjson), по одной проверке в строке.
+        """
+
+        try:
+            if request.mimetype == "application/x-ndjson":
+                payloads = [json.loads(line) for line in request.stream if line.strip()]
+            else:
+                payloads = request.get_json()
+        except ValueError:
+            inspections_api.abort(400, "Некорректный JSON")
+        if not isinstance(payloads, list):
+            inspections_api.abort(400, "Ожидается массив проверок")
+
+        result = InspectionResultService.write_many_to_db(payloads, requested_strategy())
+        return result
+
+
+@inspections_api.route("/inspections/simulate/")
+class SimulationRoute(Resource):
+    """Предварительный расчет оценок без сохранения."""
+
+    @inspections_api.param("strategy", f"{STRATEGY_PARAM}. all - всеми стратегиями")
+    @inspections_api.expect([inspection_result_schema_in])
+    @inspections_api.response(200, "Успешно", [simulation_schema_out])
+    def post(self):
+        """
+        Рассчитать оценки одной или нескольких проверок, не сохраняя их.
+
+        Тело запроса - проверка или JSON-массив проверок. При strategy=all оценки рассчитываются всеми стратегиями,
+        по одному результату на пару (проверка, стратегия). Используются только справочники из кэша.
+        """
+
+        strategy = request.args.get("strategy") or None
+        if strategy not in (None, "all", *STRATEGIES):
+            inspections_api.abort(400, f"Неизвестная стратегия расчета: {strategy}")
+        payloads = request.get_json(silent=True)
+        if isinstance(payloads, dict):
+            payloads = [payloads]
+        if not isinstance(payloads, list):
+            inspections_api.abort(400, "Ожидается проверка или массив проверок")
+
+        strategy_names = list(STRATEGIES) if strategy == "all" else [strategy]
+        return json_response(InspectionResultService.simulate(payloads, strategy_names))
+
+
+@contextmanager
+def recalculation_permission():
+    """Задания пересчета доступны только членам роли perm_grade_recalculation: отказ в доступе к таблице - 403."""
+    try:
+        yield
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) != errorcodes.INSUFFICIENT_PRIVILEGE:
+            raise
+        inspections_api.abort(403, "Нет прав на пересчет оценок")
+
+
+@inspections_api.route("/inspections/recalculate/")
+@inspections_api.response(403, "Нет прав на пересчет оценок")
+class RecalculationRoute(Resource):
+    """Пересчет оценок сохраненных проверок."""
+
+    @inspections_api.param("strategy", STRATEGY_PARAM)
+    @inspections_api.param("inspection_target_type_id", "Только проверки субъектов этого типа")
+    @inspections_api.marshal_with(recalculation_job_schema_out, code=202)
+    def post(self):
+        """
+        Запустить пересчет общих оценок сохраненных проверок по актуальным справочникам (критериям, весам, критичности).
+
+        Пересчет выполняется в фоне от имени пользователя (только доступные ему проверки), изменившиеся оценки
+        записываются пачками. Ответ - созданное задание, ход выполнения - GET /inspections/recalculate/<ID задания>/.
+        """
+
+        parser = reqparse.RequestParser()
+        parser.add_argument("strategy", type=str, choices=tuple(STRATEGIES))
+        parser.add_argument("inspection_target_type_id", type=str)
+        args = parser.parse_args()
+        with recalculation_permission():
+            job = start_recalculation_job(args["strategy"], args["inspection_target_type_id"])
+        return job, 202
+
+
+@inspections_api.route("/inspections/recalculate/<uuid:job_id>/")
+@inspections_api.param("job_id", "ID задания пересчета")
+@inspections_api.response(403, "Нет прав на пересчет оценок")
+@inspections_api.response(404, "Задание не найдено")
+class RecalculationJobRoute(Resource):
+    """Ход выполнения задания пересчета оценок."""
+
+    @inspections_api.marshal_with(recalculation_job_schema_out)
+    def get(self, job_id: uuid.UUID):
+        """Состояние задания пересчета: обработано проверок, изменено оценок, ошибки."""
+
+        with recalculation_permission():
+            job = RecalculationJobDB.get_job(job_id)
+        if job is None:
+            inspections_api.abort(404, "Задание не найдено")
+        return job
 
 
 @inspections_api.route("/inspections/all/")
 @inspections_api.response(500, "Не найдено")
 class LatestResultRoute(Resource):
+    method_decorators = [transactional]
+
     @inspections_api.param("inspection_target_id", "Поиск по объекту проверки")
     @inspections_api.marshal_with(topic_result_schema_in)
     def get(self):
@@ -48,7 +48,9 @@ inspection_result_schema_in = Model(
         "inspection_date": TimeFormat(
             required=True, description="Дата и время проведения проверки.", default="2024-03-31T19:25:41.110084"
         ),
-        "files": fields.List(fields.String, description="Список путей к файлам.", default="[]"),
+        "files": fields.List(
+            fields.String, description="Ключи файлов, загруженных через POST /api/files/.", default="[]"
+        ),
     },
 )
 
@@ -95,6 +97,52 @@ inspection_result_schema_out = Model(
     },
 )
 
+inspection_bulk_result_schema_out = Model(
+    "InspectionBulkResultOut",
+    {
+        "index": fields.Integer(description="Порядковый номер проверки в пакете."),
+        "id": fields.String(description="ID сохраненной проверки."),
+        "grade": fields.Float(description="Оценка по проверке."),
+        "error": fields.String(description="Ошибка сохранения проверки."),
+    },
+)
+
+simulation_direction_schema_out = Model(
+    "SimulationDirectionOut",
+    {
+        "direction_id": fields.String(description="ID направления."),
+        "grade": fields.Float(description="Оценка по направлению."),
+    },
+)
+
+simulation_schema_out = Model(
+    "SimulationOut",
+    {
+        "index": fields.Integer(description="Порядковый номер проверки в запросе."),
+        "strategy": fields.String(description="Стратегия расчета."),
+        "grade": fields.Float(description="Общая оценка."),
+        "direction_results": fields.List(fields.Nested(simulation_direction_schema_out)),
+        "error": fields.String(description="Ошибка расчета."),
+    },
+)
+
+recalculation_job_schema_out = Model(
+    "RecalculationJobOut",
+    {
+        "id": fields.String(description="ID задания."),
+        "strategy": fields.String(description="Стратегия расчета (пусто - заданная для типа проверяемого субъекта)."),
+        "inspection_target_type_id": fields.String(description="Тип проверяемого субъекта (пусто - все)."),
+        "status": fields.String(description="Состояние: queued, running, done или failed."),
+        "processed": fields.Integer(description="Обработано проверок."),
+        "changed": fields.Integer(description="Изменено оценок."),
+        "failed": fields.Integer(description="Проверок, оценку которых рассчитать нельзя."),
+        "error": fields.String(description="Ошибка выполнения."),
+        "created_by": fields.String(description="Пользователь, создавший задание."),
+        "created_date": fields.DateTime(description="Дата создания."),
+        "updated_date": fields.DateTime(description="Дата последнего изменения состояния."),
+    },
+)
+
 grade_schema_out = Model(
     "GradeSchemaOut",
     {
@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import orjson
+from flask import Response
+from flask_restx import Model, fields
+
+from app.api.inspection.schemas import inspection_result_schema_out
+from app.common.common_data import TimeFormat
+
+
+# Источники полей выходных моделей, не совпадающие с именем поля (аналог attribute в автосхемах marshmallow).
+ATTRIBUTES = {
+    "DirectionResultOut": {"direction_name": "direction.name"},
+    "TopicResultOut": {"topic_name": "topic.name"},
+}
+
+
+def _getter(path: str) -> Callable[[Any], Any]:
+    keys = path.split(".")
+
+    def get(obj):
+        for key in keys:
+            if obj is None:
+                return None
+            obj = obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+        return obj
+
+    return get
+
+
+def _time_format(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y/%m/%d %H:%M")
+    return TimeFormat().format(value)
+
+
+def _formatter(field: fields.Raw) -> Callable[[Any], Any]:
+    """Функция форматирования непустого значения, повторяющая field.format."""
+    if isinstance(field, TimeFormat):
+        return _time_format
+    if isinstance(field, fields.Float):
+        return float
+    if isinstance(field, fields.Integer):
+        return int
+    if isinstance(field, fields.Boolean):
+        return bool
+    if isinstance(field, fields.String):
+        return str
+    if isinstance(field, fields.Nested):
+        return compile_model(field.nested)
+    if isinstance(field, fields.List):
+        container = _with_default(field.container, _formatter(field.container))
+        return lambda value: [container(item) for item in value]
+    return field.format
+
+
+def _with_default(field: fields.Raw, format_value: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Обработка None так же, как в Raw.output/Nested.output/List.output flask-restx."""
+    if isinstance(field, fields.Nested):
+        if field.allow_null:
+            return lambda value: None if value is None else format_value(value)
+        if field.default is not None:
+            return lambda value: field.default if value is None else format_value(value)
+        return format_value
+    default = field.default() if callable(field.default) else field.default
+    if isinstance(field, fields.List):
+        return lambda value: default if value is None else format_value(value)
+    default = format_value(default) if default else default
+    return lambda value: default if value is None else format_value(value)
+
+
+def compile_model(model: Model) -> Callable[[Any], Dict]:
+    """
+    Скомпилировать модель flask-restx в функцию сериализации объекта (ORM или dict) за один проход.
+
+    Результат совпадает с marshal(obj, model): тот же набор и порядок ключей, те же преобразования значений.
+
+    :param model: Выходная модель flask-restx
+    :return: Функция obj -> dict
+    """
+    attributes = ATTRIBUTES.get(model.name, {})
+    compiled = []
+    for name, field in model.items():
+        get = _getter(attributes.get(name, field.attribute or name))
+        compiled.append((name, get, _with_default(field, _formatter(field))))
+
+    def serialize(obj) -> Dict:
+        return {name: format_value(get(obj)) for name, get, format_value in compiled}
+
+    return serialize
+
+
+serialize_inspection_result = compile_model(inspection_result_schema_out)
+
+
+def json_response(data: Any, status: int = 200, headers: Optional[Dict] = None) -> Response:
+    """Ответ с телом, сериализованным orjson."""
+    return Response(orjson.dumps(data), status=status, headers=headers, mimetype="application/json")
+
+
+def inspection_results_response(inspections: Iterable, headers: Optional[Dict] = None) -> Response:
+    return json_response([serialize_inspection_result(inspection) for inspection in inspections], headers=headers)
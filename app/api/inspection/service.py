@@ -1,11 +1,17 @@
+import sys
+import uuid
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Dict, List
+from datetime import datetime
+from typing import Dict, List, Optional
 
+import numpy as np
 
-from app.api.inspection.db import DirectionsDB, InspectionDB
+from app.api.inspection.db import InspectionDB, PartitionDB
+from app.api.inspection.refs_cache import RefsSnapshot, RelInfo, TargetTypeRefs, refs_cache
 
-from app.common.common_data import save_file
+from app.common.storage import storage
+from app.config import DEFAULT_CALCULATION_STRATEGY
 
 
 @dataclass
@@ -35,14 +41,154 @@ class Calculatable:
 #     matched_result_grade: float
 
 
+@dataclass
+class CalculatableBatch:
+    """
+    Колоночное представление групп оцениваемых элементов (группа - проверка или направление).
+
+    Элементы группы i занимают позиции [offsets[i], offsets[i + 1]) в порядке, в котором они
+    передавались бы в calculate. Отсутствующие значения (None) хранятся как NaN.
+    """
+
+    offsets: np.ndarray
+    grades: np.ndarray
+    weights: np.ndarray = None
+    is_critical: np.ndarray = None
+    is_ignored: np.ndarray = None
+    scale_max_values: np.ndarray = None
+    matched_result_grades: np.ndarray = None
+
+    def __post_init__(self):
+        size = len(self.grades)
+        if self.weights is None:
+            self.weights = np.full(size, np.nan)
+        if self.is_critical is None:
+            self.is_critical = np.zeros(size, dtype=bool)
+        if self.is_ignored is None:
+            self.is_ignored = np.zeros(size, dtype=bool)
+        if self.scale_max_values is None:
+            self.scale_max_values = np.full(size, float(Calculatable.scale_max_value))
+        if self.matched_result_grades is None:
+            self.matched_result_grades = np.full(size, np.nan)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def groups(self) -> np.ndarray:
+        """Номер группы каждого элемента."""
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def select(self, mask: np.ndarray) -> "CalculatableBatch":
+        """Оставить элементы по маске с сохранением групп и порядка элементов."""
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.groups[mask], minlength=len(self)), out=offsets[1:])
+        return CalculatableBatch(
+            offsets=offsets,
+            grades=self.grades[mask],
+            weights=self.weights[mask],
+            is_critical=self.is_critical[mask],
+            is_ignored=self.is_ignored[mask],
+            scale_max_values=self.scale_max_values[mask],
+            matched_result_grades=self.matched_result_grades[mask],
+        )
+
+
+# Компенсированное суммирование float в sum() (gh-100425)
+NEUMAIER_SUM = sys.version_info >= (3, 12)
+
+
+def group_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Суммы групп, побитово совпадающие с sum() по элементам группы в их порядке.
+
+    Элементы складываются по столбцам (k-й элемент всех групп за одну операцию). С Python 3.12 sum()
+    для float использует компенсированное суммирование Ноймайера, оно воспроизводится так же.
+    """
+    counts = np.diff(offsets)
+    result = np.zeros(len(counts))
+    compensation = np.zeros(len(counts))
+    for k in range(int(counts.max(initial=0))):
+        groups = np.flatnonzero(counts > k)
+        x = values[offsets[groups] + k]
+        if k == 0 or not NEUMAIER_SUM:
+            result[groups] = result[groups] + x
+            continue
+        total = result[groups]
+        t = total + x
+        compensation[groups] += np.where(np.abs(total) >= np.abs(x), (total - t) + x, (x - t) + total)
+        result[groups] = t
+    if NEUMAIER_SUM:
+        correct = (compensation != 0) & np.isfinite(compensation)
+        result[correct] += compensation[correct]
+    return result
+
+
+def round_grades(result: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """round(x, 2) по маске: встроенный round округляет корректно, np.round - через умножение на 100."""
+    for index in np.flatnonzero(mask):
+        result[index] = round(float(result[index]), 2)
+    return result
+
+
 class GradeCalculationStrategy(ABC):
+    """
+    Стратегия расчета оценок.
+
+    Экземпляры не хранят состояния и используются совместно (см. STRATEGIES). Расчет оценки проверки:
+    prepare - получение из снимка справочников всех нужных стратегии данных за один проход по направлениям
+    и поднаправлениям, затем calculate по элементам calculatable_items.
+    """
+
+    # Имя стратегии в настройках типа проверяемого субъекта и в параметре strategy запросов
+    name: str = None
+    # Оценки рассчитываются по таблицам критериев, а не по весам и критичности
+    uses_criteria: bool = False
+
+    def prepare(self, inspection: "InspectionResultService"):
+        """
+        Подготовить проверку к расчету: получить веса, критичность и игнорирование всех направлений
+        и поднаправлений, затем рассчитать отсутствующие оценки направлений по поднаправлениям.
+
+        :param inspection: Рассчитываемая проверка
+        """
+        inspection.get_calc_info()
+        for direction_result in inspection.direction_results:
+            if direction_result.grade is None:
+                direction_result.grade = direction_result.calculate_grade(self)
+
+    def calculatable_items(self, inspection: "InspectionResultService") -> List[Calculatable]:
+        """
+        Элементы, по которым рассчитывается общая оценка подготовленной проверки.
+
+        :param inspection: Рассчитываемая проверка
+        :return: Оцениваемые элементы
+        """
+        return inspection.direction_results
+
     @staticmethod
     @abstractmethod
     def calculate(items: List[Calculatable]):
         pass
 
+    @staticmethod
+    @abstractmethod
+    def calculate_batch(batch: CalculatableBatch) -> np.ndarray:
+        """
+        Рассчитать оценки всех групп пачки (векторный аналог calculate, результат побитово совпадает).
+
+        :param batch: Группы оцениваемых элементов
+        :return: Оценка каждой группы; NaN - если calculate для группы завершился бы исключением
+        """
+
 
 class StrategyAVGCritical(GradeCalculationStrategy):
+    name = "avg"
+
     @staticmethod
     def calculate(items: List[Calculatable]):
         if not items:
@@ -62,8 +208,24 @@ class StrategyAVGCritical(GradeCalculationStrategy):
         result = round(result, 2)
         return result
 
+    @staticmethod
+    def calculate_batch(batch: CalculatableBatch) -> np.ndarray:
+        batch = batch.select(~batch.is_ignored)
+        counts = batch.counts
+        groups = batch.groups
+        failed = np.bincount(groups, weights=np.isnan(batch.grades), minlength=len(batch)) > 0
+        critical = np.full(len(batch), np.inf)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            np.minimum.at(critical, groups[batch.is_critical], batch.grades[batch.is_critical])
+            result = np.minimum(group_sum(batch.grades, batch.offsets) / counts, critical)
+        result[counts == 0] = 0
+        result[failed] = np.nan
+        return round_grades(result, (counts > 0) & ~failed)
+
 
 class StrategyWeights(GradeCalculationStrategy):
+    name = "weights"
+
     @staticmethod
     def calculate(items: List[Calculatable]):
         if not items:
@@ -85,8 +247,44 @@ class StrategyWeights(GradeCalculationStrategy):
         result = round(result, 2)
         return result
 
+    @staticmethod
+    def calculate_batch(batch: CalculatableBatch) -> np.ndarray:
+        batch = batch.select(~batch.is_ignored)
+        counts = batch.counts
+        groups = batch.groups
+        max_possible_result = group_sum(batch.scale_max_values * batch.weights, batch.offsets)
+        actual_result = group_sum(batch.grades * batch.weights, batch.offsets)
+        failed = np.bincount(groups, weights=np.isnan(batch.grades) | np.isnan(batch.weights), minlength=len(batch))
+        failed = (failed > 0) | ((counts > 0) & (max_possible_result == 0))
+        # Шкала результата - шкала первого учитываемого элемента группы
+        first_scale = np.full(len(batch), np.nan)
+        first_scale[counts > 0] = batch.scale_max_values[batch.offsets[:-1][counts > 0]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = actual_result / max_possible_result * first_scale
+        result[counts == 0] = 0
+        result[failed] = np.nan
+        return round_grades(result, (counts > 0) & ~failed)
+
 
 class StrategyCriteria(GradeCalculationStrategy):
+    name = "criteria"
+    uses_criteria = True
+
+    def prepare(self, inspection: "InspectionResultService"):
+        """Получить результирующие оценки по таблицам критериев. Оценки направлений по поднаправлениям не считаются."""
+        inspection.get_criteria_info()
+
+    def calculatable_items(self, inspection: "InspectionResultService") -> List[Calculatable]:
+        """Направления и поднаправления, для оценок которых нашлась результирующая оценка."""
+        items = []
+        for direction in inspection.direction_results:
+            if direction.matched_result_grade is not None:
+                items.append(direction)
+            for topic in direction.topic_results:
+                if topic.matched_result_grade is not None:
+                    items.append(topic)
+        return items
+
     @staticmethod
     def calculate(items: List[Calculatable]):
         if not items:
@@ -95,153 +293,256 @@ class StrategyCriteria(GradeCalculationStrategy):
         res = min([item.matched_result_grade for item in items])
         return res
 
+    @staticmethod
+    def calculate_batch(batch: CalculatableBatch) -> np.ndarray:
+        # Учитываются только элементы с найденной результирующей оценкой
+        matched = ~np.isnan(batch.matched_result_grades)
+        result = np.full(len(batch), np.inf)
+        np.minimum.at(result, batch.groups[matched], batch.matched_result_grades[matched])
+        result[np.isinf(result)] = 0
+        return result
+
+
+# Стратегии расчета по имени, экземпляры используются совместно
+STRATEGIES: Dict[str, GradeCalculationStrategy] = {
+    strategy.name: strategy for strategy in (StrategyCriteria(), StrategyWeights(), StrategyAVGCritical())
+}
+
+
+def get_strategy(name: str) -> GradeCalculationStrategy:
+    """
+    Получить стратегию расчета по имени.
+
+    :param name: Имя стратегии (см. STRATEGIES)
+    :return: Стратегия расчета
+    :raises ValueError: Если стратегии с таким именем нет
+    """
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Неизвестная стратегия расчета: {name}") from None
+
+
+def resolve_strategy(refs: Optional[TargetTypeRefs]) -> GradeCalculationStrategy:
+    """
+    Стратегия расчета, заданная для типа проверяемого субъекта (из кэша справочников, без обращения к БД).
+
+    :param refs: Справочная информация типа проверяемого субъекта
+    :return: Стратегия типа или стратегия по умолчанию, если тип неизвестен
+    """
+    return get_strategy(refs.strategy if refs is not None else DEFAULT_CALCULATION_STRATEGY)
+
+
+def as_float(grade):
+    """Оценки приводятся к float: sum() складывает int и float по-разному, а в пакетном расчете все оценки float."""
+    return None if grade is None else float(grade)
+
+
+def as_datetime(value) -> datetime:
+    """
+    Дата проверки - ключ секционирования таблиц результатов, поэтому приводится к datetime до записи в БД:
+    по ней выбирается секция, она же копируется в результаты направлений и поднаправлений.
+    """
+    if value is None:
+        return datetime.now()
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
 
 class TopicResult(Calculatable):
     def __init__(self, topic_result_payload):
         self.description = topic_result_payload.get("description")
         self.id = topic_result_payload.get("topic_id")
-        self.grade = topic_result_payload.get("grade")
+        self.grade = as_float(topic_result_payload.get("grade"))
         # super().__init__(grade=topic_result_payload.get("grade"))
 
 
 class DirectionResult(Calculatable):
-    def __init__(
-        self,
-        direction_result_payload,
-        inspection_target_id,
-        calculation_strategy=StrategyCriteria(),
-    ):
-        self.inspection_target_id = inspection_target_id
+    def __init__(self, direction_result_payload):
         self.description = direction_result_payload.get("description")
         self.id = direction_result_payload.get("direction_id")
         self.topic_results = [
             TopicResult(topic_result) for topic_result in direction_result_payload.get("topic_results")
         ]
-        self.grade = direction_result_payload.get("grade")
+        self.grade = as_float(direction_result_payload.get("grade"))
         # super.__init__(grade=direction_result_payload.get("grade"))
-        if (self.grade is None) and (type(calculation_strategy) != StrategyCriteria):
-            self.grade = self.calculate_grade(calculation_strategy)
 
     def calculate_grade(self, calculation_strategy: GradeCalculationStrategy):
-        # Получаем нужную информацию
-        if type(calculation_strategy) in (StrategyWeights, StrategyAVGCritical):
-            self.get_topics_calc_info()
-        # Считаем результат
+        # Веса и критичность поднаправлений уже получены в InspectionResultService.get_calc_info
         grade = calculation_strategy.calculate(self.topic_results)
         return grade
 
-    def get_topics_calc_info(self):
-        """
-        Получить веса и критичность поднаправлений, по которым пришли результаты
-        """
-        topic_ids = [topic_result.id for topic_result in self.topic_results]
-        topics_info = DirectionsDB.get_topic_info_by_ids(topic_ids, self.inspection_target_id)
-        topics_info = {topic_info.topic_id: topic_info for topic_info in topics_info}
-        for topic_result in self.topic_results:
-            topic_info = topics_info.get(topic_result.id)
-            if topic_info is None:
-                # Ошибка - не для всех поднаправлений получилось получить вес/критичность. (в бд нет записи по этому ид направления)
-                continue
-            topic_result.is_critical = topic_info.is_critical
-            topic_result.weight = topic_info.weight
-            topic_result.is_ignored = topic_info.is_ignored
-
 
 class InspectionResultService:
     def __init__(
         self,
         payload,
-        calculation_strategy=StrategyCriteria(),
+        calculation_strategy: GradeCalculationStrategy = None,
+        refs_snapshot: RefsSnapshot = None,
     ):
+        """
+        :param payload: Данные об инспекторской проверке
+        :param calculation_strategy: Стратегия расчета оценок (None - заданная для типа проверяемого субъекта)
+        :param refs_snapshot: Снимок справочников (по умолчанию - актуальный из кэша)
+        """
         self.name = payload.get("name")
         self.description = payload.get("description")
         self.inspection_organ_id = payload.get("inspection_organ_id")
         self.inspection_target_id = payload.get("inspection_target_id")
         self.operator_id = payload.get("operator_id")
-        self.inspection_date = payload.get("inspection_date")
-        self.files = None
-        if "files" in payload and len(payload.get("files")) > 0:
-            self.files = [save_file(file) for file in payload.files]
+        self.inspection_date = as_datetime(payload.get("inspection_date"))
+        # Файлы загружаются заранее (POST /api/files/), в проверке хранятся только их ключи.
+        self.files = payload.get("files") or None
 
         self.direction_results = [
-            DirectionResult(direction_result, self.inspection_target_id, calculation_strategy)
-            for direction_result in payload.get("direction_results")
+            DirectionResult(direction_result) for direction_result in payload.get("direction_results")
         ]
+        # Справочная информация запрашивается один раз на всю проверку.
+        if refs_snapshot is None:
+            refs_snapshot = refs_cache.get()
+        self.refs = refs_snapshot.for_inspection_target(self.inspection_target_id)
+        self.calculation_strategy = calculation_strategy or resolve_strategy(self.refs)
+
+        self.calculation_strategy.prepare(self)
         self.grade = payload.get("grade")
         if self.grade is None:
-            self.grade = self.calculate_grade(calculation_strategy)
+            self.grade = self.calculate_grade(self.calculation_strategy)
 
     def calculate_grade(self, calculation_strategy: GradeCalculationStrategy):
-        calculatable_items = []  # что будет использовано для расчета оценки
-        # Получаем нужную информацию
-        if type(calculation_strategy) in (StrategyWeights, StrategyAVGCritical):
-            self.get_directions_calc_info()
-            calculatable_items = self.direction_results
-        elif type(calculation_strategy) == StrategyCriteria:
-            self.get_criteria_info()
-            for direction in self.direction_results:
-                if direction.matched_result_grade is not None:
-                    calculatable_items.append(direction)
-                for topic in direction.topic_results:
-                    if topic.matched_result_grade is not None:
-                        calculatable_items.append(topic)
-        # Считаем результат
-        grade = calculation_strategy.calculate(calculatable_items)
+        grade = calculation_strategy.calculate(calculation_strategy.calculatable_items(self))
         return grade
 
-    def get_directions_calc_info(self):
+    def get_calc_info(self):
         """
-        Получить веса и критичность направлений, по которым пришли результаты
+        Получить веса, критичность и игнорирование всех направлений и поднаправлений, по которым пришли результаты
         """
-        direction_ids = [direction_result.id for direction_result in self.direction_results]
-        directions_info = DirectionsDB.get_direction_info_by_ids(direction_ids, self.inspection_target_id)
-        directions_info = {direction_info.direction_id: direction_info for direction_info in directions_info}
+        directions_info = self.refs.directions if self.refs is not None else {}
+        topics_info = self.refs.topics if self.refs is not None else {}
         for direction_result in self.direction_results:
-            direction_info = directions_info.get(direction_result.id)
-            if direction_info is None:
-                # Ошибка - не для всех направлений получилось получить вес/критичность. (в бд нет записи по этому ид направления)
-                continue
-            direction_result.is_critical = direction_info.is_critical
-            direction_result.weight = direction_info.weight
-            direction_result.is_ignored = direction_info.is_ignored
+            self.set_calc_info(direction_result, directions_info.get(direction_result.id))
+            for topic_result in direction_result.topic_results:
+                self.set_calc_info(topic_result, topics_info.get(topic_result.id))
+
+    @staticmethod
+    def set_calc_info(item: Calculatable, info: RelInfo):
+        if info is None:
+            # Ошибка - не для всех направлений/поднаправлений получилось получить вес/критичность.
+            # (в бд нет записи по этому ид)
+            return
+        item.is_critical = info.is_critical
+        item.weight = info.weight
+        item.is_ignored = info.is_ignored
 
     def get_criteria_info(self):
-        direction_grades = [
-            (direction_result.id, direction_result.grade) for direction_result in self.direction_results
-        ]
-        topic_grades = [
-            (topic.id, topic.grade)
-            for direction_result in self.direction_results
-            for topic in direction_result.topic_results
-        ]
-        criteria_info_directions = DirectionsDB.get_criteria_result_directions(
-            direction_grades, self.inspection_target_id
-        )
-        criteria_info_topics = DirectionsDB.get_criteria_result_topics(topic_grades, self.inspection_target_id)
-        criteria_info_directions = {
-            direction_info.direction_id: direction_info for direction_info in criteria_info_directions
-        }
-        criteria_info_topics = {topic_info.topic_id: topic_info for topic_info in criteria_info_topics}
+        """
+        Получить результирующие оценки из таблиц критериев для пришедших оценок направлений и поднаправлений
+        """
+        if self.refs is None:
+            return
         for direction_result in self.direction_results:
-            direction_info = criteria_info_directions.get(direction_result.id)
-            if direction_info is not None:
-                direction_result.matched_result_grade = direction_info.result_grade
-
+            direction_result.matched_result_grade = self.refs.direction_criteria.lookup(
+                direction_result.id, direction_result.grade
+            )
             for topic_result in direction_result.topic_results:
-                topic_info = criteria_info_topics.get(topic_result.id)
-                if topic_info is not None:
-                    topic_result.matched_result_grade = topic_info.result_grade
+                topic_result.matched_result_grade = self.refs.topic_criteria.lookup(
+                    topic_result.id, topic_result.grade
+                )
+
+    def check_files(self):
+        """
+        Проверить, что файлы вложений загружены (только перед сохранением: расчет оценок от файлов не зависит).
+
+        :raises ValueError: Если файла с указанным ключом нет в хранилище
+        """
+        for key in self.files or []:
+            if not storage.exists(key):
+                raise ValueError(f"Файл не найден: {key}")
+
+    def check_partition(self):
+        """
+        Проверить, что для месяца даты проверки есть секция (только перед сохранением).
+
+        :raises ValueError: Если секции нет
+        """
+        PartitionDB.check_partitions([self.inspection_date])
 
     def write_to_db(self):
+        self.check_files()
+        self.check_partition()
         res = InspectionDB.write_inspection_into_db(self)
         return res
 
     @staticmethod
-    def get_info(inspection_id: str):
+    def write_many_to_db(payloads: List[Dict], calculation_strategy: GradeCalculationStrategy = None) -> List[Dict]:
+        """
+        Рассчитать оценки и пакетно сохранить инспекторские проверки.
+
+        :param payloads: Данные об инспекторских проверках
+        :param calculation_strategy: Стратегия расчета оценок (None - заданная для типа проверяемого субъекта)
+        :return: Результат по каждой проверке: ID и оценка либо текст ошибки
+        """
+        refs_snapshot = refs_cache.get()
+        results = [{"index": index} for index in range(len(payloads))]
+        calculated = []
+        for result, payload in zip(results, payloads):
+            try:
+                inspection = InspectionResultService(payload, calculation_strategy, refs_snapshot)
+                inspection.check_files()
+                inspection.check_partition()
+                calculated.append((result, inspection))
+            except Exception as e:
+                result["error"] = f"Некорректные данные проверки: {e!r}"
+
+        written = InspectionDB.write_inspections_into_db([inspection for _, inspection in calculated])
+        for (result, inspection), (inspection_id, error) in zip(calculated, written):
+            if error is not None:
+                result["error"] = error
+                continue
+            result["id"] = inspection_id
+            result["grade"] = inspection.grade
+        return results
+
+    @staticmethod
+    def simulate(
+        payloads: List[Dict], strategy_names: List[Optional[str]], refs_snapshot: RefsSnapshot = None
+    ) -> List[Dict]:
+        """
+        Рассчитать оценки без сохранения (предварительный просмотр).
+
+        Используются только справочники из кэша, обращений к БД и хранилищу файлов нет.
+
+        :param payloads: Данные об инспекторских проверках
+        :param strategy_names: Имена стратегий расчета (см. STRATEGIES), None - заданная для типа проверяемого субъекта
+        :param refs_snapshot: Снимок справочников (по умолчанию - актуальный из кэша)
+        :return: Результат по каждой паре (проверка, стратегия): общая оценка и оценки направлений либо текст ошибки
+        """
+        refs_snapshot = refs_snapshot or refs_cache.get()
+        results = []
+        for index, payload in enumerate(payloads):
+            for strategy_name in strategy_names:
+                result = {"index": index, "strategy": strategy_name}
+                try:
+                    strategy = None if strategy_name is None else get_strategy(strategy_name)
+                    inspection = InspectionResultService(payload, strategy, refs_snapshot)
+                except Exception as e:
+                    result["error"] = f"Некорректные данные проверки: {e!r}"
+                else:
+                    result["strategy"] = inspection.calculation_strategy.name
+                    result["grade"] = inspection.grade
+                    result["direction_results"] = [
+                        {"direction_id": direction.id, "grade": direction.grade}
+                        for direction in inspection.direction_results
+                    ]
+                results.append(result)
+        return results
+
+    @staticmethod
+    def get_info(inspection_id: uuid.UUID):
         return InspectionDB.get_by_id(inspection_id)
 
     @staticmethod
-    def delete_from_db(inspection_id: str):
+    def delete_from_db(inspection_id: uuid.UUID):
         res = InspectionDB.delete_inspection_by_id(inspection_id)
         return res
 
@@ -258,6 +559,10 @@ class InspectionResultService:
         end_date_filter,
         direction_id_filter,
         description_filter,
+        cursor=None,
+        date_field="created_date",
+        search=None,
+        search_children=False,
     ):
         return InspectionDB.get_inspections(
             limit,
@@ -271,12 +576,66 @@ class InspectionResultService:
             end_date_filter,
             direction_id_filter,
             description_filter,
+            cursor,
+            date_field,
+            search,
+            search_children,
         )
 
     @staticmethod
-    def update_in_db(inspection_id: str, payload: Dict):
-        res = InspectionDB.update_inspection_in_db(inspection_id, payload)
-        return res
+    def update_in_db(inspection_id: uuid.UUID, payload: Dict, calculation_strategy: GradeCalculationStrategy = None):
+        """
+        Обновить инспекторскую проверку.
+
+        Не указанные в запросе оценки направлений рассчитываются так же, как при создании проверки, и сохраняются
+        тем же UPDATE, что и остальные изменения. Общая оценка пересчитывается, только если она не указана в запросе
+        и изменились данные, от которых она зависит, и записывается тем же UPDATE строки проверки.
+
+        :param inspection_id: ID инспекторской проверки
+        :param payload: Обновленные данные об инспекторской проверке
+        :param calculation_strategy: Стратегия расчета оценок (None - заданная для типа проверяемого субъекта)
+        :return: Обновленная проверка или None, если она не найдена
+        """
+        payload = InspectionResultService.with_direction_grades(inspection_id, payload, calculation_strategy)
+        return InspectionDB.update_inspection_in_db(
+            inspection_id, payload, lambda data: InspectionResultService(data, calculation_strategy).grade
+        )
+
+    @staticmethod
+    def with_direction_grades(
+        inspection_id: uuid.UUID, payload: Dict, calculation_strategy: GradeCalculationStrategy = None
+    ) -> Dict:
+        """
+        Дополнить данные обновления рассчитанными оценками направлений, не указанными в запросе.
+
+        :param inspection_id: ID инспекторской проверки
+        :param payload: Обновленные данные об инспекторской проверке
+        :param calculation_strategy: Стратегия расчета оценок (None - заданная для типа проверяемого субъекта)
+        :return: Данные обновления с оценками направлений
+        """
+        directions = payload.get("direction_results")
+        if not directions or all(direction.get("grade") is not None for direction in directions):
+            return payload
+        if "inspection_target_id" in payload:
+            inspection_target_id = payload["inspection_target_id"]
+        else:
+            inspection_target_id = InspectionDB.get_inspection_target_id(inspection_id)
+        calculated = InspectionResultService(
+            {
+                **payload,
+                "inspection_target_id": inspection_target_id,
+                "direction_results": [
+                    {**direction, "topic_results": direction.get("topic_results") or []} for direction in directions
+                ],
+            },
+            calculation_strategy,
+        ).direction_results
+        return {
+            **payload,
+            "direction_results": [
+                {**direction, "grade": result.grade} for direction, result in zip(directions, calculated)
+            ],
+        }
 
     @staticmethod
     def get_overall_results_by_inspection_target_id(inspection_target_id):
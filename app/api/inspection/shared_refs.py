@@ -0,0 +1,90 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+from app.api.inspection.criteria import CriteriaTable
+
+
+# Файлы таблиц: <каталог>/refs-<sha256 содержимого>.bin
+FILE_PREFIX = "refs-"
+FILE_SUFFIX = ".bin"
+
+
+def share_criteria_tables(tables: List[CriteriaTable], directory: str) -> List[CriteriaTable]:
+    """
+    Перенести таблицы критериев в общую память процессов.
+
+    Массивы всех таблиц записываются подряд в один файл, который каждый процесс отображает в память только на чтение:
+    страницы файла хранятся в страничном кэше ОС один раз на все рабочие процессы, поиск идет по ним без копирования.
+    Имя файла строится из SHA-256 содержимого, поэтому процессы, загрузившие одни и те же справочники,
+    используют один файл. Файлы прежних версий удаляются: уже отображенные в память остаются доступны.
+
+    :param tables: Таблицы критериев
+    :param directory: Каталог файлов таблиц (лучше в tmpfs, например /dev/shm)
+    :return: Таблицы с теми же данными, массивы которых отображены из общего файла
+    """
+    layouts: List[Dict[str, Tuple[int, int, int]]] = []
+    chunks = []
+    position = 0
+    for table in tables:
+        layout = {}
+        for item_id, (offset, values) in table.tables.items():
+            layout[item_id] = (offset, position, len(values))
+            chunks.append(memoryview(values).cast("B"))
+            position += len(values)
+        layouts.append(layout)
+    if not position:
+        return tables
+
+    payload = b"".join(chunks)
+    path = os.path.join(directory, f"{FILE_PREFIX}{hashlib.sha256(payload).hexdigest()}{FILE_SUFFIX}")
+    values = _attach(path, payload).cast("d")
+    _remove_stale(directory, path)
+    return [
+        CriteriaTable.from_tables(
+            {item_id: (offset, values[start : start + length]) for item_id, (offset, start, length) in layout.items()},
+            table.step,
+        )
+        for table, layout in zip(tables, layouts)
+    ]
+
+
+def _attach(path: str, payload: bytes) -> memoryview:
+    """Отобразить файл в память, предварительно записав его, если его еще нет."""
+    for _ in range(2):
+        if not os.path.exists(path):
+            _write(path, payload)
+        try:
+            with open(path, "rb") as file:
+                # Отображение остается действительным после закрытия файла и после его удаления.
+                return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            # Файл удален процессом, перешедшим на другую версию справочников, записываем заново.
+            continue
+    raise FileNotFoundError(path)
+
+
+def _write(path: str, payload: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Во временный файл в том же каталоге, чтобы другие процессы видели только полностью записанный файл.
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".", delete=False) as tmp:
+        try:
+            tmp.write(payload)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+
+
+def _remove_stale(directory: str, current_path: str):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX) and path != current_path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -1,5 +1,6 @@
 from flask import Flask
 
+from app.config import GRADE_ROLLUP_REFRESHER, REFS_CACHE_LISTENER
 from app.config_object import DevConfig
 from flask_cors import CORS
 
@@ -15,8 +16,27 @@ def get_app(config=DevConfig) -> Flask:
     app.config["RESTX_INCLUDE_ALL_MODELS"] = True
     CORS(app)
 
+    from app.auth import register_auth
+
+    register_auth(app)
+
     from . import api
 
     api.init_app(app)
 
+    from app.commands import register_commands
+
+    register_commands(app)
+
+    from app.api.inspection.refs_cache import refs_cache
+
+    refs_cache.get()
+    if REFS_CACHE_LISTENER:
+        refs_cache.start_listener()
+
+    if GRADE_ROLLUP_REFRESHER:
+        from app.api.analytics.refresher import grade_rollup_refresher
+
+        grade_rollup_refresher.start()
+
     return app
@@ -0,0 +1,31 @@
+from flask import Flask, abort, g, request
+
+from app.session import current_role
+
+
+def register_auth(app: Flask):
+    """
+    Привязка запросов к роли БД пользователя.
+
+    При DB_SET_ROLE соединения пула переключаются (SET ROLE) на пользователя, имя которого передает SSO-прокси
+    в заголовке AUTH_USER_HEADER. Запросы без заголовка отклоняются, чтобы не выполнять их с правами логина пула.
+    :param app:
+    :return:
+    """
+    if not app.config.get("DB_SET_ROLE"):
+        return
+
+    header = app.config["AUTH_USER_HEADER"]
+
+    @app.before_request
+    def set_request_role():
+        user = request.headers.get(header)
+        if not user:
+            abort(401)
+        g.role_token = current_role.set(user)
+
+    @app.teardown_request
+    def reset_request_role(exc):
+        token = g.pop("role_token", None)
+        if token is not None:
+            current_role.reset(token)
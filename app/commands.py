@@ -0,0 +1,99 @@
+import click
+from flask import Flask
+
+
+def register_commands(app: Flask):
+    """
+    Регистрация консольных команд приложения (flask --app app.debug <команда>).
+    :param app:
+    :return:
+    """
+
+    @app.cli.command("rebuild-latest-topic-results")
+    def rebuild_latest_topic_results():
+        """Перестроить модель чтения последних результатов по поднаправлениям."""
+        from app.api.inspection.db import InspectionDB
+
+        count = InspectionDB.rebuild_latest_topic_results()
+        click.echo(f"Записей в latest_topic_result: {count}")
+
+    @app.cli.command("recalculate-grades")
+    @click.option(
+        "--strategy",
+        type=click.Choice(["criteria", "weights", "avg"]),
+        default=None,
+        help="Стратегия расчета (по умолчанию - заданная для типа проверяемого субъекта)",
+    )
+    @click.option("--target-type", "inspection_target_type_id", default=None, help="ID типа проверяемого субъекта")
+    @click.option("--batch-size", type=int, default=None)
+    def recalculate_grades(strategy, inspection_target_type_id, batch_size):
+        """Пересчитать общие оценки сохраненных проверок по актуальным справочникам."""
+        from app.api.inspection.db import RecalculationJobDB
+        from app.api.inspection.recalculation import GradeRecalculation
+        from app.api.inspection.service import get_strategy
+        from app.config import RECALCULATION_BATCH_SIZE
+
+        job = RecalculationJobDB.create_job(strategy, inspection_target_type_id)
+        click.echo(f"Задание пересчета: {job.id}")
+        progress = GradeRecalculation(
+            get_strategy(strategy) if strategy else None,
+            inspection_target_type_id,
+            batch_size or RECALCULATION_BATCH_SIZE,
+            on_progress=lambda progress: click.echo(
+                f"Обработано: {progress.processed}, изменено: {progress.changed}, ошибок: {progress.failed}"
+            ),
+            job_id=job.id,
+        ).run()
+        click.echo(f"Готово. Обработано: {progress.processed}, изменено: {progress.changed}, ошибок: {progress.failed}")
+
+    @app.cli.command("refresh-grade-rollup")
+    def refresh_grade_rollup():
+        """Пересчитать агрегаты оценок групп, измененных с прошлого пересчета."""
+        from app.api.analytics.db import GradeRollupDB
+
+        refreshed = GradeRollupDB.refresh()
+        click.echo(f"Пересчитано групп (месяц, орган): {refreshed}")
+
+    @app.cli.command("rebuild-grade-rollup")
+    @click.option(
+        "--from-month",
+        type=click.DateTime(formats=["%Y-%m"]),
+        default=None,
+        help="Первый перестраиваемый месяц, ГГГГ-ММ (по умолчанию - все; агрегаты архивированных месяцев теряются)",
+    )
+    def rebuild_grade_rollup(from_month):
+        """Полностью перестроить агрегаты оценок по результатам проверок."""
+        from app.api.analytics.db import GradeRollupDB
+
+        count = GradeRollupDB.rebuild(from_month.date() if from_month else None)
+        click.echo(f"Записей в grade_rollup: {count}")
+
+    @app.cli.command("maintain-partitions")
+    @click.option("--months-ahead", type=int, default=None, help="На сколько месяцев вперед создать секции")
+    @click.option(
+        "--from",
+        "date_from",
+        type=click.DateTime(formats=["%Y-%m-%d"]),
+        default=None,
+        help="Создать секции начиная с месяца даты (по умолчанию - с текущего месяца)",
+    )
+    @click.option(
+        "--archive-before",
+        type=click.DateTime(formats=["%Y-%m-%d"]),
+        default=None,
+        help="Отсоединить и перенести в схему archive секции месяцев, закончившихся до даты",
+    )
+    def maintain_partitions(months_ahead, date_from, archive_before):
+        """Создать секции результатов проверок на следующие месяцы и архивировать старые."""
+        from datetime import datetime
+
+        from app.api.inspection.db import PartitionDB
+        from app.config import PARTITION_MONTHS_AHEAD
+
+        now = datetime.now()
+        months = now.year * 12 + now.month - 1 + (PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead)
+        created = PartitionDB.create_partitions(date_from or now, datetime(months // 12, months % 12 + 1, 1))
+        click.echo(f"Создано секций: {created}")
+        if archive_before is not None:
+            detached = PartitionDB.detach_partitions(archive_before)
+            click.echo(f"Перенесено в архив месяцев: {detached}")
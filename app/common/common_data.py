@@ -1,7 +1,8 @@
 import base64
 import datetime
-import os
+import json
 import uuid
+from typing import Tuple
 
 from flask_restx import fields
 
@@ -18,12 +19,25 @@ class TimeFormat(fields.Raw):
         return datetime.datetime.strftime(dt_obj, "%Y/%m/%d %H:%M")
 
 
-def save_file(file_data) -> str:  # file path
-    save_dir = "G:/media/"
-    with open(file_data, "rb") as file:
-        file_name = os.path.basename(file_data)
-        new_file_name = uuid.uuid4().hex + "_" + file_name
-        save_path = os.path.join(save_dir, new_file_name)
-        with open(save_path, "wb") as save_file:
-            save_file.write(file.read())
-        return save_path
+def encode_cursor(created_date: datetime.datetime, inspection_id: uuid.UUID) -> str:
+    """Кодирование курсора постраничного вывода (created_date, id) в непрозрачную строку."""
+    raw = json.dumps([created_date.isoformat(), str(inspection_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, uuid.UUID]:
+    """
+    Декодирование курсора постраничного вывода.
+
+    :raises ValueError: Если курсор некорректен
+    """
+    try:
+        created_date, inspection_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_date), uuid.UUID(inspection_id)
+    except (AttributeError, TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+def escape_like(value: str, escape: str = "/") -> str:
+    """Экранирование спецсимволов шаблона LIKE в пользовательской строке."""
+    return value.replace(escape, escape * 2).replace("%", escape + "%").replace("_", escape + "_")
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+import uuid
+
+
+# Случайная часть UUIDv7: 12 бит rand_a и 62 бита rand_b
+_RANDOM_BITS = 74
+_RAND_B_BITS = 62
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Идентификатор записи: UUID версии 7 (RFC 9562), создается приложением до записи в БД.
+
+    Старшие 48 бит - время в миллисекундах Unix, поэтому новые записи добавляются в конец индексов
+    первичного и внешних ключей, а не в случайные страницы. Идентификаторы дочерних записей известны
+    до вставки, и пакет вставляется без RETURNING. В пределах процесса значения строго возрастают:
+    в одну миллисекунду случайная часть увеличивается на единицу.
+
+    :return: UUID
+    """
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            # Старший бит случайной части нулевой - запас для увеличения в ту же миллисекунду.
+            _last_ms, _last_random = now_ms, int.from_bytes(os.urandom(10), "big") >> (80 - _RANDOM_BITS + 1)
+        else:
+            _last_random += 1
+            if _last_random >> _RANDOM_BITS:
+                _last_ms, _last_random = _last_ms + 1, 0
+        unix_ms, random = _last_ms, _last_random
+
+    return uuid.UUID(
+        int=(unix_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | (random >> _RAND_B_BITS) << 64
+        | 0b10 << 62
+        | random & ((1 << _RAND_B_BITS) - 1)
+    )
+
+
+def _reset_after_fork():
+    """В дочернем процессе (рабочие процессы gunicorn) последовательность начинается заново со случайной части."""
+    global _lock, _last_ms, _last_random
+    _lock = threading.Lock()
+    _last_ms, _last_random = 0, 0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,11 +1,26 @@
-from datetime import datetime
+import uuid
+from datetime import date, datetime
 
 from typing import List, Set
 
 
-from sqlalchemy import Boolean, Float, ForeignKey, ForeignKeyConstraint, Text, func, JSON, DateTime
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Integer,
+    JSON,
+    Text,
+    Uuid,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.base_models import Base
+from app.common.ids import uuid7
 
 
 class UserInfo(Base):
@@ -119,6 +134,8 @@ class InspectionTargetType(Base):
     )
     topics: Mapped[Set["Topic"]] = relationship("InspectionTargetTypeTopicRel", back_populates="inspection_target_type")
     scale_id: Mapped[str] = mapped_column(Text, ForeignKey("refs.scale.id"), nullable=False)
+    # Стратегия расчета оценок проверок субъектов этого типа: criteria, weights или avg
+    strategy: Mapped[str] = mapped_column(Text, nullable=False, server_default="criteria")
 
     def __repr__(self) -> str:
         return f"<id: {self.id}, name: {self.name}>"
@@ -130,14 +147,13 @@ class InspectionResult(Base):
     __tablename__ = "inspection_result"
     __table_args__ = {"schema": "tables"}
 
-    id: Mapped[str] = mapped_column(
-        Text, primary_key=True, nullable=False, server_default=func.public.uuid_generate_v4()
-    )
+    # Идентификатор создается приложением (UUIDv7), поэтому известен до вставки записи
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, nullable=False, default=uuid7)
     name: Mapped[str] = mapped_column(Text, nullable=False)
     grade: Mapped[float] = mapped_column(Float, nullable=True)
     description: Mapped[str] = mapped_column(Text, nullable=False)
     direction_results: Mapped[Set["DirectionResult"]] = relationship(
-        back_populates="inspection_result", uselist=True, lazy="subquery"
+        back_populates="inspection_result", uselist=True, lazy="selectin"
     )
     inspection_organ_id: Mapped[str] = mapped_column(Text, ForeignKey("tables.inspection_organ.id"))
     inspection_organ: Mapped["InspectionOrgan"] = relationship(back_populates="inspections", uselist=False)
@@ -151,7 +167,10 @@ class InspectionResult(Base):
     updated_date: Mapped[datetime] = mapped_column(
         DateTime(timezone=False), nullable=False, default=datetime.now, onupdate=datetime.now
     )
-    inspection_date: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False, default=datetime.now)
+    # Ключ секционирования (секции по месяцам) входит в первичный ключ таблицы
+    inspection_date: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), primary_key=True, nullable=False, default=datetime.now
+    )
     files: Mapped[List[str]] = mapped_column(JSON, nullable=True)
 
     def __repr__(self):
@@ -170,23 +189,27 @@ class DirectionResult(Base):
     """Модель результата проверки по направлению."""
 
     __tablename__ = "direction_result"
-    __table_args__ = {"schema": "tables"}
-
-    id: Mapped[str] = mapped_column(
-        Text, primary_key=True, nullable=False, server_default=func.public.uuid_generate_v4()
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["inspection_result_id", "inspection_date"],
+            ["tables.inspection_result.id", "tables.inspection_result.inspection_date"],
+            ondelete="CASCADE",
+            onupdate="CASCADE",
+        ),
+        {"schema": "tables"},
     )
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, nullable=False, default=uuid7)
     grade: Mapped[float] = mapped_column(Float, nullable=True)
     description: Mapped[str] = mapped_column(Text, nullable=False)
     direction_id: Mapped[str] = mapped_column(Text, ForeignKey("refs.direction.id", ondelete="SET NULL"), nullable=True)
     direction: Mapped["Direction"] = relationship(uselist=False, lazy="joined")
     topic_results: Mapped[Set["TopicResult"]] = relationship(
-        back_populates="direction_result", uselist=True, lazy="subquery"
-    )
-    inspection_result_id: Mapped[str] = mapped_column(
-        Text,
-        ForeignKey("tables.inspection_result.id", ondelete="CASCADE"),
-        nullable=True,
+        back_populates="direction_result", uselist=True, lazy="selectin"
     )
+    inspection_result_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=True)
+    # Ключ секционирования: дата проверки, копируется из inspection_result (заполняется связью).
+    inspection_date: Mapped[datetime] = mapped_column(DateTime(timezone=False), primary_key=True, nullable=False)
     inspection_result: Mapped["InspectionResult"] = relationship(back_populates="direction_results", uselist=False)
 
     def __repr__(self):
@@ -203,18 +226,24 @@ class TopicResult(Base):
     """Модель результата проверки по поднаправлению."""
 
     __tablename__ = "topic_result"
-    __table_args__ = {"schema": "tables"}
-
-    id: Mapped[str] = mapped_column(
-        Text, primary_key=True, nullable=False, server_default=func.public.uuid_generate_v4()
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["direction_result_id", "inspection_date"],
+            ["tables.direction_result.id", "tables.direction_result.inspection_date"],
+            ondelete="CASCADE",
+            onupdate="CASCADE",
+        ),
+        {"schema": "tables"},
     )
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, nullable=False, default=uuid7)
     grade: Mapped[float] = mapped_column(Float, nullable=True)
     description: Mapped[str] = mapped_column(Text, nullable=False)
     topic_id: Mapped[str] = mapped_column(Text, ForeignKey("refs.topic.id", ondelete="SET NULL"), nullable=True)
     topic: Mapped["Topic"] = relationship(uselist=False, lazy="selectin")
-    direction_result_id: Mapped[str] = mapped_column(
-        Text, ForeignKey("tables.direction_result.id", ondelete="CASCADE"), nullable=True
-    )
+    direction_result_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=True)
+    # Ключ секционирования: дата проверки, копируется из direction_result (заполняется связью).
+    inspection_date: Mapped[datetime] = mapped_column(DateTime(timezone=False), primary_key=True, nullable=False)
     direction_result: Mapped["DirectionResult"] = relationship(back_populates="topic_results", uselist=False)
 
     def __repr__(self):
@@ -227,6 +256,35 @@ class TopicResult(Base):
         )
 
 
+class LatestTopicResult(Base):
+    """
+    Модель чтения: последний результат по поднаправлению для проверяемого субъекта и проверяющего органа
+    (поддерживается триггерами).
+    """
+
+    __tablename__ = "latest_topic_result"
+    __table_args__ = {"schema": "tables"}
+
+    # В БД ключ - уникальный индекс ux_latest_topic_result_key (NULLS NOT DISTINCT): орган может быть не задан.
+    inspection_target_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    topic_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    inspection_organ_id: Mapped[str] = mapped_column(Text, primary_key=True, nullable=True)
+    topic_result_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
+    inspection_result_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
+    grade: Mapped[float] = mapped_column(Float, nullable=True)
+    description: Mapped[str] = mapped_column(Text, nullable=True)
+    created_date: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<inspection_target_id: {self.inspection_target_id}, "
+            f"topic_id: {self.topic_id}, "
+            f"inspection_organ_id: {self.inspection_organ_id}, "
+            f"grade: {self.grade}, "
+            f"topic_result_id: {self.topic_result_id}>"
+        )
+
+
 class InspectionOrgan(Base):
     """Модель проверяющего органа."""
 
@@ -249,6 +307,75 @@ class InspectionOrgan(Base):
         return f"<id: {self.id}, name: {self.name}, short_name: {self.short_name}, type_id: {self.type_id}>"
 
 
+class InspectionOrganClosure(Base):
+    """Таблица замыкания иерархии проверяющих органов: пары (предок, потомок), включая (орган, орган)."""
+
+    __tablename__ = "inspection_organ_closure"
+    __table_args__ = {"schema": "tables"}
+
+    ancestor_id: Mapped[str] = mapped_column(Text, ForeignKey("tables.inspection_organ.id"), primary_key=True)
+    descendant_id: Mapped[str] = mapped_column(Text, ForeignKey("tables.inspection_organ.id"), primary_key=True)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class GradeRollup(Base):
+    """
+    Агрегаты оценок по месяцу, проверяющему органу, типу проверяемого субъекта, направлению и оценке
+    (пересчитываются по очереди изменений, см. миграцию 0.0.0.13).
+    """
+
+    __tablename__ = "grade_rollup"
+    __table_args__ = {"schema": "tables"}
+
+    # Ключ группы (в БД без ограничения: тип субъекта и направление могут быть NULL)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    inspection_organ_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    inspection_target_type_id: Mapped[str] = mapped_column(Text, primary_key=True, nullable=True)
+    # NULL - общая оценка проверки
+    direction_id: Mapped[str] = mapped_column(Text, primary_key=True, nullable=True)
+    # Оценка, округленная до целого
+    grade: Mapped[float] = mapped_column(Float, primary_key=True)
+    result_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    grade_sum: Mapped[float] = mapped_column(Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return (
+            f"<month: {self.month}, "
+            f"inspection_organ_id: {self.inspection_organ_id}, "
+            f"direction_id: {self.direction_id}, "
+            f"grade: {self.grade}, "
+            f"result_count: {self.result_count}>"
+        )
+
+
+class RecalculationJob(Base):
+    """Модель задания пересчета оценок сохраненных проверок (см. миграцию 0.0.0.14)."""
+
+    __tablename__ = "recalculation_job"
+    __table_args__ = {"schema": "tables"}
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid7)
+    # Имя стратегии расчета, NULL - заданная для типа проверяемого субъекта
+    strategy: Mapped[str] = mapped_column(Text, nullable=True)
+    inspection_target_type_id: Mapped[str] = mapped_column(Text, nullable=True)
+    # queued, running, done или failed
+    status: Mapped[str] = mapped_column(Text, nullable=False, server_default="queued")
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    changed: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_by: Mapped[str] = mapped_column(Text, nullable=False, server_default=func.current_user())
+    created_date: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False, server_default=func.localtimestamp()
+    )
+    updated_date: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False, server_default=func.localtimestamp()
+    )
+
+    def __repr__(self) -> str:
+        return f"<id: {self.id}, status: {self.status}, processed: {self.processed}, changed: {self.changed}>"
+
+
 class InspectionOrganType(Base):
     """Модель типа проверяющего органа."""
 
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+
+from app.config import FILE_CHUNK_SIZE, FILE_MAX_SIZE, MEDIA_ROOT
+
+
+class FileStorage(ABC):
+    """
+    Хранилище файлов вложений.
+
+    Файлы адресуются по содержимому: ключ строится из SHA-256, поэтому одинаковые файлы хранятся один раз.
+    """
+
+    # Максимальный размер файла, байты
+    max_size: int = FILE_MAX_SIZE
+
+    @abstractmethod
+    def save(self, stream: BinaryIO, filename: str = "") -> str:
+        """
+        Сохранить файл, читая поток частями.
+
+        :param stream: Поток с содержимым файла
+        :param filename: Исходное имя файла (используется только расширение)
+        :return: Ключ файла в хранилище
+        :raises ValueError: Если размер файла превышает допустимый
+        """
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """
+        Открыть файл на чтение.
+
+        :param key: Ключ файла
+        :return: Поток с содержимым файла
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+
+class LocalFileStorage(FileStorage):
+    """Хранилище в локальной файловой системе: <root>/<ab>/<cd>/<sha256><.ext>."""
+
+    KEY_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[0-9a-z]{1,16})?$")
+
+    def __init__(self, root: str = MEDIA_ROOT, chunk_size: int = FILE_CHUNK_SIZE, max_size: int = FILE_MAX_SIZE):
+        self.root = os.path.abspath(root)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.tmp_dir = os.path.join(self.root, ".tmp")
+
+    def save(self, stream: BinaryIO, filename: str = "") -> str:
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # Во временный файл в том же каталоге хранилища, чтобы перемещение было атомарным (os.replace).
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir, delete=False) as tmp:
+            try:
+                size = 0
+                while chunk := stream.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise ValueError(f"Размер файла превышает {self.max_size} байт")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+
+        key = self._key(digest.hexdigest(), filename)
+        path = self._path(key)
+        if os.path.exists(path):
+            os.unlink(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)
+        return key
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return self.is_valid_key(key) and os.path.exists(self._path(key))
+
+    @classmethod
+    def is_valid_key(cls, key: str) -> bool:
+        return isinstance(key, str) and cls.KEY_PATTERN.match(key) is not None
+
+    @staticmethod
+    def _key(hexdigest: str, filename: str) -> str:
+        extension = os.path.splitext(filename or "")[1].lower()
+        if not re.fullmatch(r"\.[0-9a-z]{1,16}", extension):
+            extension = ""
+        return f"{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}"
+
+    def _path(self, key: str) -> str:
+        if not self.is_valid_key(key):
+            raise ValueError("Некорректный ключ файла")
+        return os.path.join(self.root, *key.split("/"))
+
+
+storage: FileStorage = LocalFileStorage()
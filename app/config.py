@@ -9,3 +9,51 @@ DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
+
+# Пул соединений с БД
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "yes")
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
+# Переключение роли БД (SET ROLE) на пользователя запроса: DB_USER - общий логин пула,
+# имя пользователя берется из заголовка, выставляемого SSO-прокси.
+DB_SET_ROLE = os.environ.get("DB_SET_ROLE", "False").lower() in ("true", "1", "yes")
+AUTH_USER_HEADER = os.environ.get("AUTH_USER_HEADER", "X-Remote-User")
+
+# Кэш справочников
+REFS_CACHE_TTL = float(os.environ.get("REFS_CACHE_TTL", 300))
+# Канал NOTIFY передается триггерам справочников при миграции 0.0.0.3: после изменения триггеры пересоздаются.
+REFS_CACHE_CHANNEL = os.environ.get("REFS_CACHE_CHANNEL", "refs_changed")
+# Каталог файлов таблиц критериев, общих для рабочих процессов (см. shared_refs). Пусто - таблицы в памяти процесса.
+REFS_SHARED_DIR = os.environ.get("REFS_SHARED_DIR") or None
+# Слушатель изменений справочников запускается при создании приложения. При запуске через gunicorn
+# приложение создается в мастер-процессе, слушатель запускается в каждом рабочем процессе (gunicorn.conf.py).
+REFS_CACHE_LISTENER = os.environ.get("REFS_CACHE_LISTENER", "True").lower() in ("true", "1", "yes")
+
+# Хранилище файлов вложений
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", "media")
+FILE_CHUNK_SIZE = int(os.environ.get("FILE_CHUNK_SIZE", 1024 * 1024))
+# Максимальный размер загружаемого файла, байты
+FILE_MAX_SIZE = int(os.environ.get("FILE_MAX_SIZE", 50 * 1024 * 1024))
+
+# Шаг квантования оценок при сопоставлении с таблицами критериев
+CRITERIA_GRADE_STEP = float(os.environ.get("CRITERIA_GRADE_STEP", 0.01))
+
+# Стратегия расчета оценок для субъектов неизвестного типа (для известных задается в refs.inspection_target_type)
+DEFAULT_CALCULATION_STRATEGY = os.environ.get("DEFAULT_CALCULATION_STRATEGY", "criteria")
+
+# Пересчет оценок сохраненных проверок: размер пачки
+RECALCULATION_BATCH_SIZE = int(os.environ.get("RECALCULATION_BATCH_SIZE", 5000))
+
+# Секционирование результатов проверок по месяцам даты проверки: на сколько месяцев вперед создаются секции
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))
+# Как долго рабочий процесс считает секцию месяца существующей без повторной проверки, секунды
+# (секции отсоединяются командой maintain-partitions в другом процессе)
+PARTITION_CHECK_TTL = float(os.environ.get("PARTITION_CHECK_TTL", 300))
+
+# Агрегаты оценок (tables.grade_rollup): интервал фонового пересчета измененных групп, секунды (0 - только командой
+# refresh-grade-rollup). Как и слушатель справочников, при запуске через gunicorn поток запускается в рабочих процессах.
+GRADE_ROLLUP_REFRESH_INTERVAL = float(os.environ.get("GRADE_ROLLUP_REFRESH_INTERVAL", 60))
+GRADE_ROLLUP_REFRESHER = os.environ.get("GRADE_ROLLUP_REFRESHER", "True").lower() in ("true", "1", "yes")
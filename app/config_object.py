@@ -1,7 +1,27 @@
-from app.config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from app.config import (
+    AUTH_USER_HEADER,
+    DB_HOST,
+    DB_MAX_OVERFLOW,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PORT,
+    DB_SET_ROLE,
+    DB_USER,
+)
 
 
 class DevConfig:
     """Development configuration."""
 
     DB_URI = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    DB_POOL_SIZE = DB_POOL_SIZE
+    DB_MAX_OVERFLOW = DB_MAX_OVERFLOW
+    DB_POOL_TIMEOUT = DB_POOL_TIMEOUT
+    DB_POOL_PRE_PING = DB_POOL_PRE_PING
+    DB_POOL_RECYCLE = DB_POOL_RECYCLE
+    DB_SET_ROLE = DB_SET_ROLE
+    AUTH_USER_HEADER = AUTH_USER_HEADER
@@ -1,24 +1,87 @@
-import os
 from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import Session as SessionSQLA
-from sqlalchemy.pool import NullPool
 
 from app.config_object import DevConfig
 
 
-session_maker = sessionmaker()
+def get_engine(config=DevConfig) -> Engine:
+    """
+    Создание пула соединений с БД.
+
+    :param config: Конфигурация приложения
+    :return: Движок SQLAlchemy с пулом соединений
+    """
+    engine = create_engine(
+        config.DB_URI,
+        client_encoding="utf8",
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_recycle=config.DB_POOL_RECYCLE,
+    )
+    if config.DB_SET_ROLE:
+        event.listen(engine, "checkout", set_role_on_checkout)
+        event.listen(engine, "checkin", reset_role_on_checkin)
+    return engine
+
+
+# Роль БД пользователя текущего запроса (CURRENT_USER для RLS). None - роль логина пула.
+current_role: ContextVar[Optional[str]] = ContextVar("current_role", default=None)
+
+
+def set_role_on_checkout(dbapi_connection, connection_record, connection_proxy):
+    """Выдача соединения из пула: переключиться на роль пользователя текущего запроса."""
+    role = current_role.get()
+    with dbapi_connection.cursor() as cursor:
+        if role is None:
+            cursor.execute("RESET ROLE")
+        else:
+            # Аналог SET ROLE с передачей имени роли параметром, без подстановки в текст запроса.
+            cursor.execute("SELECT set_config('role', %s, false)", (role,))
+    dbapi_connection.commit()
+
+
+def reset_role_on_checkin(dbapi_connection, connection_record):
+    """Возврат соединения в пул: вернуться к роли логина пула."""
+    if dbapi_connection is None:
+        return
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute("RESET ROLE")
+    dbapi_connection.commit()
+
+
+# Движок создается один раз на процесс, соединения переиспользуются из пула.
+engine = get_engine()
+session_maker = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Сессия текущей единицы работы (запроса). Вложенные session_scope переиспользуют ее.
+current_session: ContextVar[Optional[SessionSQLA]] = ContextVar("current_session", default=None)
 
 
 @contextmanager
 def session_scope(session: SessionSQLA = session_maker) -> SessionSQLA:
-    """Provide a transactional scope around a series of operations."""
-    session.configure(bind=create_engine(DevConfig.DB_URI, client_encoding="utf8", poolclass=NullPool))
+    """
+    Provide a transactional scope around a series of operations.
+
+    If a scope is already open in the current context, its session and transaction are reused,
+    commit and rollback are left to the outermost scope.
+    """
+    sess = current_session.get()
+    if sess is not None:
+        yield sess
+        return
+
     sess = session()
+    token = current_session.set(sess)
     sess.begin()
-    sess.expire_on_commit = False
     try:
         yield sess
     except Exception:
@@ -27,4 +90,34 @@ def session_scope(session: SessionSQLA = session_maker) -> SessionSQLA:
     else:
         sess.commit()
     finally:
+        current_session.reset(token)
         sess.close()
+
+
+@contextmanager
+def login_session_scope() -> SessionSQLA:
+    """
+    Отдельная сессия и транзакция от имени логина пула, вне сессии и роли пользователя текущего запроса.
+
+    Для служебных чтений, результат которых используется всеми запросами процесса (кэш справочников):
+    они не должны зависеть от прав пользователя запроса и выполняться в его транзакции.
+    """
+    role_token = current_role.set(None)
+    session_token = current_session.set(None)
+    try:
+        with session_scope() as sess:
+            yield sess
+    finally:
+        current_session.reset(session_token)
+        current_role.reset(role_token)
+
+
+def transactional(func):
+    """Выполнить функцию (обработчик запроса) в одной сессии и транзакции."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with session_scope():
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,29 @@
+# Конфигурация многопроцессного запуска (SERVER=gunicorn в app.sh).
+# Расчет оценок и сериализация ответов упираются в GIL, поэтому запросы обслуживают несколько процессов.
+import multiprocessing
+import os
+
+# Таблицы критериев - в общей памяти рабочих процессов (см. app/api/inspection/shared_refs.py).
+os.environ.setdefault("REFS_SHARED_DIR", "/dev/shm/inspection-refs")
+# Слушатель изменений справочников запускается в каждом рабочем процессе (post_fork), а не в мастер-процессе.
+os.environ.setdefault("REFS_CACHE_LISTENER", "False")
+# Фоновый пересчет агрегатов оценок - тоже в рабочих процессах.
+os.environ.setdefault("GRADE_ROLLUP_REFRESHER", "False")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+# Приложение и снимок справочников создаются в мастер-процессе один раз, рабочие процессы получают их через fork.
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app.api.analytics.refresher import grade_rollup_refresher
+    from app.api.inspection.refs_cache import refs_cache
+    from app.session import engine
+
+    # Соединения, открытые мастер-процессом при загрузке справочников, не должны использоваться совместно.
+    engine.dispose(close=False)
+    refs_cache.start_listener()
+    grade_rollup_refresher.start()
@@ -1,5 +1,44 @@
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
 import pytest
-from app.api.inspection.service import InspectionResultService, StrategyAVGCritical, StrategyCriteria, StrategyWeights
+from flask_restx import marshal
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+
+from app.api.analytics.db import GradeRollupDB
+from app.api.analytics.service import GradeAnalyticsService
+from app.api.files.db import FilesDB
+from app.api.inspection.schemas import InspectionResultSchema, inspection_result_schema_out
+from app.api.inspection.serializers import serialize_inspection_result
+from app.api.inspection.service import (
+    Calculatable,
+    CalculatableBatch,
+    InspectionResultService,
+    STRATEGIES,
+    StrategyAVGCritical,
+    StrategyCriteria,
+    StrategyWeights,
+    group_sum,
+)
+from app.api.inspection.criteria import CriteriaTable
+from app.api.inspection.db import InspectionDB, PartitionDB, RecalculationDB, RecalculationJobDB
+from app.api.inspection.recalculation import GradeRecalculation, start_recalculation_job
+from app.api.inspection.refs_cache import RefsSnapshot, RelInfo, TargetTypeRefs
+from app.api.inspection.shared_refs import share_criteria_tables
+from app.common.ids import uuid7
+from app.common.storage import LocalFileStorage
+from app.common import models
+from app.session import current_role, engine, login_session_scope, session_scope
+import numpy as np
 from payloads import payload_criteria_2, payload_criteria_1, payload_generic_5
 
 
@@ -29,3 +68,765 @@ class TestInspectionResultService:
         assert inspection_result.grade == result
         for direction_result in inspection_result.direction_results:
             assert direction_result.grade == 5
+
+
+class TestCriteriaTable:
+
+    criteria = [("1", 1, 1), ("1", 2, 2), ("1", 4, 2), ("2", 2.5, 1)]
+
+    @pytest.mark.parametrize(
+        "item_id, grade, result",
+        [
+            ("1", 1, 1),
+            ("1", 2.0, 2),
+            ("1", 3, None),
+            ("1", 4, 2),
+            ("1", 5, None),
+            ("1", 0, None),
+            ("2", 2.5, 1),
+            ("2", 2.5000001, 1),
+            ("3", 1, None),
+            ("1", None, None),
+        ],
+    )
+    def test_lookup(self, item_id, grade, result):
+        assert CriteriaTable(self.criteria).lookup(item_id, grade) == result
+
+    def test_shared_matches_private(self, tmp_path):
+        tables = [CriteriaTable(self.criteria), CriteriaTable([("1", 3, 5)]), CriteriaTable([])]
+        shared = share_criteria_tables(tables, str(tmp_path))
+        assert share_criteria_tables(tables, str(tmp_path))[0].tables.keys() == tables[0].tables.keys()
+        assert len(list(tmp_path.iterdir())) == 1
+        grades = np.array([0, 1, 2, 2.5, 3, 4, 5, np.nan])
+        for table, shared_table in zip(tables, shared):
+            for item_id in ("1", "2", "3"):
+                assert [shared_table.lookup(item_id, grade) for grade in (1, 2.5, 3, 4, None)] == [
+                    table.lookup(item_id, grade) for grade in (1, 2.5, 3, 4, None)
+                ]
+                np.testing.assert_array_equal(
+                    shared_table.lookup_many([item_id] * len(grades), grades),
+                    table.lookup_many([item_id] * len(grades), grades),
+                )
+
+
+class TestInspectionResultSerializer:
+
+    @staticmethod
+    def make_inspection():
+        inspection = models.InspectionResult(
+            id="1",
+            name="Проверка",
+            grade=2,
+            description=None,
+            inspection_organ_id="2",
+            inspection_target_id="3",
+            operator_id="1",
+            created_date=datetime(2024, 1, 2, 3, 4, 5, 6),
+            updated_date=datetime(2024, 1, 2, 3, 4, 5, 7),
+            inspection_date=datetime(2024, 3, 31, 19, 25, 41, 110084),
+            files=["a.png"],
+        )
+        direction_result = models.DirectionResult(
+            id="1", grade=3.5, description="string", direction=models.Direction(id="1", name="Направление")
+        )
+        direction_result.topic_results.add(
+            models.TopicResult(id="1", grade=4, description="string", topic=models.Topic(id="1", name="Поднаправление"))
+        )
+        inspection.direction_results.add(direction_result)
+        inspection.direction_results.add(models.DirectionResult(id="2", grade=None, description=None))
+        return inspection
+
+    def test_matches_marshal(self):
+        inspection = self.make_inspection()
+        expected = marshal(InspectionResultSchema().dump(inspection), inspection_result_schema_out)
+        result = serialize_inspection_result(inspection)
+        assert list(result) == list(expected)
+        key = lambda direction_result: direction_result["direction_name"] or ""
+        assert sorted(result.pop("direction_results"), key=key) == sorted(expected.pop("direction_results"), key=key)
+        assert result == expected
+
+    def test_none_matches_marshal(self):
+        assert serialize_inspection_result(None) == marshal({}, inspection_result_schema_out)
+
+
+class TestLocalFileStorage:
+
+    def test_save_deduplicates(self, tmp_path):
+        storage = LocalFileStorage(str(tmp_path), chunk_size=4)
+        content = b"photo content"
+        key = storage.save(io.BytesIO(content), "IMG.JPG")
+        assert key.endswith(".jpg")
+        assert storage.save(io.BytesIO(content), "copy.jpg") == key
+        assert storage.exists(key)
+        with storage.open(key) as file:
+            assert file.read() == content
+        assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+    def test_max_size(self, tmp_path):
+        storage = LocalFileStorage(str(tmp_path), chunk_size=4, max_size=8)
+        assert storage.exists(storage.save(io.BytesIO(b"8 bytes!")))
+        with pytest.raises(ValueError):
+            storage.save(io.BytesIO(b"nine bytes"))
+        assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+    def test_attached_visibility(self):
+        """Файл доступен, только если он указан во вложениях видимой пользователю проверки (нужна БД)."""
+        key = "ab/cd/" + hashlib.sha256(b"attached").hexdigest() + ".pdf"
+        with session_scope() as session:
+            assert not FilesDB.is_attached(key)
+            # Проверка органа 2: видна antonovaa (дочерние органы), не видна petrovpp (только орган 1).
+            session.add(
+                models.InspectionResult(
+                    name="files",
+                    description="files",
+                    operator_id="1",
+                    inspection_organ_id="2",
+                    inspection_date=datetime(2024, 6, 10),
+                    files=[key],
+                )
+            )
+            session.flush()
+            assert FilesDB.is_attached(key)
+            session.execute(text("SET LOCAL ROLE antonovaa"))
+            assert FilesDB.is_attached(key)
+            session.execute(text("SET LOCAL ROLE petrovpp"))
+            assert not FilesDB.is_attached(key)
+            session.rollback()
+
+    @pytest.mark.parametrize("key", ["../etc/passwd", "ab/cd/" + "0" * 64 + "/../x", "", None])
+    def test_invalid_key(self, tmp_path, key):
+        assert not LocalFileStorage(str(tmp_path)).exists(key)
+
+
+class TestIds:
+    def test_uuid7(self):
+        ids = [uuid7() for _ in range(10000)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        assert {item.version for item in ids} == {7}
+        assert {item.variant for item in ids} == {uuid.RFC_4122}
+        now_ms = time.time_ns() // 1_000_000
+        assert abs((ids[-1].int >> 80) - now_ms) < 1000
+
+
+class TestGradeRecalculation:
+
+    refs = RefsSnapshot(
+        version=1,
+        loaded_at=0,
+        target_types={
+            "1": TargetTypeRefs(
+                id="1",
+                scale_id="1",
+                directions={"1": RelInfo(False, 2.0, False, "1"), "2": RelInfo(True, 1.0, False, "1")},
+                topics={"1": RelInfo(False, 1.0, False, "1"), "2": RelInfo(False, 0.5, True, "1")},
+                direction_criteria=CriteriaTable([("1", 4, 4), ("2", 3, 2)]),
+                topic_criteria=CriteriaTable([("1", 5, 3), ("2", 1, 1)]),
+            )
+        },
+        target_type_ids={"1": "1"},
+        scales={},
+        grades={},
+    )
+    payloads = [
+        {"inspection_target_id": "1", "direction_results": []},
+        {
+            "inspection_target_id": "1",
+            "direction_results": [
+                {"direction_id": "1", "grade": 4, "topic_results": [{"topic_id": "1", "grade": 5}]},
+                {"direction_id": "2", "grade": None, "topic_results": [{"topic_id": "1", "grade": 3.33}]},
+            ],
+        },
+        {
+            "inspection_target_id": "1",
+            "direction_results": [
+                {
+                    "direction_id": "2",
+                    "grade": 3,
+                    "topic_results": [{"topic_id": "2", "grade": 1}, {"topic_id": "1", "grade": 4.7}],
+                },
+                {"direction_id": "1", "grade": 2.5, "topic_results": []},
+            ],
+        },
+        {
+            "inspection_target_id": "2",
+            "direction_results": [{"direction_id": "1", "grade": 1, "topic_results": []}],
+        },
+    ]
+
+    def rows(self):
+        direction_row = namedtuple("DirectionRow", "inspection_result_id id direction_id grade")
+        topic_row = namedtuple("TopicRow", "direction_result_id topic_id grade")
+        direction_rows, topic_rows = [], []
+        for inspection_id, payload in enumerate(self.payloads):
+            for direction_index, direction in enumerate(payload["direction_results"]):
+                direction_id = f"{inspection_id}.{direction_index}"
+                direction_rows.append(
+                    direction_row(inspection_id, direction_id, direction["direction_id"], direction["grade"])
+                )
+                topic_rows.extend(
+                    topic_row(direction_id, topic["topic_id"], topic["grade"]) for topic in direction["topic_results"]
+                )
+        return direction_rows, topic_rows
+
+    @pytest.mark.parametrize("strategy", [StrategyCriteria(), StrategyWeights(), StrategyAVGCritical()])
+    def test_matches_service(self, strategy):
+        expected = []
+        for payload in self.payloads:
+            try:
+                expected.append(InspectionResultService(payload, strategy, self.refs).grade)
+            except Exception:
+                expected.append(None)
+        grades = GradeRecalculation(strategy, refs_snapshot=self.refs).calculate(
+            list(range(len(self.payloads))),
+            [self.refs.for_inspection_target(payload["inspection_target_id"]) for payload in self.payloads],
+            *self.rows(),
+        )
+        assert [None if math.isnan(grade) else grade for grade in grades.tolist()] == expected
+
+    def test_target_type_strategy(self):
+        refs = RefsSnapshot(
+            version=1,
+            loaded_at=0,
+            target_types={**self.refs.target_types, "2": TargetTypeRefs(id="2", scale_id="1", strategy="avg")},
+            target_type_ids={"1": "1", "2": "2"},
+            scales={},
+            grades={},
+        )
+        expected = [InspectionResultService(payload, refs_snapshot=refs) for payload in self.payloads]
+        assert [inspection.calculation_strategy.name for inspection in expected] == ["criteria"] * 3 + ["avg"]
+        grades = GradeRecalculation(refs_snapshot=refs).calculate(
+            list(range(len(self.payloads))),
+            [refs.for_inspection_target(payload["inspection_target_id"]) for payload in self.payloads],
+            *self.rows(),
+        )
+        assert grades.tolist() == [inspection.grade for inspection in expected]
+
+    def test_simulate_matches_service(self):
+        results = InspectionResultService.simulate(self.payloads, list(STRATEGIES), self.refs)
+        assert len(results) == len(self.payloads) * len(STRATEGIES)
+        for result in results:
+            strategy = STRATEGIES[result["strategy"]]
+            try:
+                expected = InspectionResultService(self.payloads[result["index"]], strategy, self.refs).grade
+            except Exception:
+                assert "error" in result
+            else:
+                assert result["grade"] == expected
+
+
+class TestRecalculationJob:
+    """Задания пересчета оценок (нужна БД после миграции 0.0.0.14)."""
+
+    @pytest.fixture
+    def jobs(self):
+        created = []
+        yield created
+        with session_scope() as session:
+            session.execute(
+                text("DELETE FROM tables.recalculation_job WHERE id = ANY(:ids)"), {"ids": [job.id for job in created]}
+            )
+
+    def test_background_job_progress(self, jobs):
+        # Тип без проверок: пересчет ничего не изменяет.
+        job = start_recalculation_job(None, "no-such-type")
+        jobs.append(job)
+        assert job.status == "queued" and job.created_by
+        deadline = time.monotonic() + 10
+        while (job := RecalculationJobDB.get_job(job.id)).status in ("queued", "running"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert (job.status, job.processed, job.changed, job.error) == ("done", 0, 0, None)
+
+    def test_failed_job(self, jobs):
+        job = RecalculationJobDB.create_job(None, None)
+        jobs.append(job)
+        recalculation = GradeRecalculation(refs_snapshot=TestGradeRecalculation.refs, job_id=job.id)
+        recalculation.calculate = lambda *args: 1 / 0
+        with pytest.raises(ZeroDivisionError):
+            recalculation.run()
+        job = RecalculationJobDB.get_job(job.id)
+        assert job.status == "failed" and "ZeroDivisionError" in job.error
+
+    def test_restricted(self):
+        # petrovpp (инспектор) не входит в perm_grade_recalculation, antonovaa (супер оператор) входит.
+        with session_scope() as session:
+            session.execute(text("SET LOCAL ROLE antonovaa"))
+            with session.begin_nested():
+                RecalculationJobDB.create_job(None, None)
+            session.execute(text("SET LOCAL ROLE petrovpp"))
+            with pytest.raises(DBAPIError, match="permission denied"), session.begin_nested():
+                RecalculationJobDB.create_job(None, None)
+            session.rollback()
+
+
+class TestCalculateBatch:
+
+    @staticmethod
+    def make_groups(seed: int):
+        rng = random.Random(seed)
+        values = [0.1, 0.2, 0.3, 1.0, 2.5, 3.33, 4.7, 5.0, 1e16]
+        groups = []
+        for _ in range(300):
+            groups.append(
+                [
+                    Calculatable(
+                        grade=rng.choice(values + [rng.uniform(0, 5)]),
+                        weight=rng.choice([0.1, 0.5, 1.0, 2.0, 0.7]),
+                        is_critical=rng.random() < 0.2,
+                        is_ignored=rng.random() < 0.1,
+                        matched_result_grade=rng.choice([None, 1.0, 2.0, 3.5]),
+                    )
+                    for _ in range(rng.randint(0, 8))
+                ]
+            )
+        return groups
+
+    @staticmethod
+    def make_batch(groups) -> CalculatableBatch:
+        items = [item for group in groups for item in group]
+        floats = lambda values: np.array([np.nan if value is None else value for value in values], dtype=float)
+        return CalculatableBatch(
+            offsets=np.cumsum([0] + [len(group) for group in groups]),
+            grades=floats([item.grade for item in items]),
+            weights=floats([item.weight for item in items]),
+            is_critical=np.array([item.is_critical for item in items], dtype=bool),
+            is_ignored=np.array([item.is_ignored for item in items], dtype=bool),
+            scale_max_values=floats([item.scale_max_value for item in items]),
+            matched_result_grades=floats([item.matched_result_grade for item in items]),
+        )
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    @pytest.mark.parametrize("strategy", [StrategyAVGCritical(), StrategyWeights()])
+    def test_matches_calculate(self, strategy, seed):
+        groups = self.make_groups(seed)
+        result = strategy.calculate_batch(self.make_batch(groups))
+        assert [float(grade).hex() for grade in result] == [float(strategy.calculate(group)).hex() for group in groups]
+
+    def test_criteria_matches_calculate(self):
+        groups = self.make_groups(4)
+        result = StrategyCriteria.calculate_batch(self.make_batch(groups))
+        expected = [
+            StrategyCriteria.calculate([item for item in group if item.matched_result_grade is not None])
+            for group in groups
+        ]
+        assert result.tolist() == expected
+
+    def test_group_sum_matches_sum(self):
+        rng = random.Random(5)
+        groups = [
+            [rng.uniform(-1e3, 1e3) * 10 ** rng.randint(-5, 16) for _ in range(rng.randint(0, 20))] for _ in range(500)
+        ]
+        values = np.array([value for group in groups for value in group])
+        result = group_sum(values, np.cumsum([0] + [len(group) for group in groups]))
+        assert [float(value).hex() for value in result] == [float(sum(group)).hex() for group in groups]
+
+
+# Проверка '1' тестовых данных 0.0.0.2: миграция 0.0.0.12 заменила ее текстовый ID на UUID из MD5
+LEGACY_INSPECTION_ID = uuid.UUID(hashlib.md5(b"1").hexdigest())
+
+
+def read_recalculation_batches(inspection_target_type_id):
+    for session, rows in RecalculationDB.stream_inspections(inspection_target_type_id, 100):
+        inspection_ids = [row.id for row in rows]
+        RecalculationDB.get_direction_results(session, inspection_ids)
+        RecalculationDB.get_topic_results(session, inspection_ids)
+
+
+def partition_indexes(index: str):
+    """Индекс секционированной таблицы и индексы его секций (их имена PostgreSQL формирует сам)."""
+    with session_scope() as session:
+        return [index] + session.scalars(
+            text(
+                "SELECT pg_class.relname FROM pg_inherits JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = to_regclass(:index)"
+            ),
+            {"index": f"tables.{index}"},
+        ).all()
+
+
+class TestQueryPlans:
+    """Запросы к дереву проверки используют индексы миграции 0.0.0.10 (нужна БД с тестовыми данными 0.0.0.2)."""
+
+    @staticmethod
+    def explain(cursor, statement, parameters) -> str:
+        # На тестовых данных последовательное чтение дешевле любого индекса.
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        return json.dumps(cursor.fetchone()[0])
+
+    @pytest.fixture
+    def plans(self):
+        plans = []
+
+        def explain(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                # Отдельный курсор: курсор потокового чтения - серверный.
+                with conn.connection.cursor() as explain_cursor:
+                    plans.append(self.explain(explain_cursor, statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", explain)
+        yield plans
+        event.remove(engine, "before_cursor_execute", explain)
+
+    @pytest.mark.parametrize(
+        "query, indexes",
+        [
+            (
+                lambda: InspectionDB.get_inspections(10, 0, None, None, "2", None, None, None, None, None, None),
+                ["ix_inspection_result_inspection_organ_id"],
+            ),
+            (
+                lambda: InspectionDB.get_inspections(10, 0, None, None, None, "1", None, None, None, None, None),
+                ["ix_inspection_result_inspection_target_id"],
+            ),
+            (
+                lambda: InspectionDB.get_inspections(10, 0, None, None, None, None, None, None, None, "1", None),
+                ["ix_direction_result_direction_id"],
+            ),
+            (
+                lambda: InspectionDB.get_by_id(LEGACY_INSPECTION_ID),
+                ["ix_direction_result_inspection_result_id", "ix_topic_result_direction_result_id"],
+            ),
+            (
+                lambda: FilesDB.is_attached("ab/cd/" + "0" * 64),
+                ["ix_inspection_result_files"],
+            ),
+            (
+                lambda: read_recalculation_batches("1"),
+                [
+                    "ix_inspection_target_type_id",
+                    "ix_direction_result_inspection_result_id",
+                    "ix_topic_result_direction_result_id",
+                ],
+            ),
+        ],
+    )
+    def test_queries_use_indexes(self, plans, query, indexes):
+        # Имена индексов секций читаются до запроса, чтобы их запрос не попал в проверяемые планы.
+        names = {index: partition_indexes(index) for index in indexes}
+        plans.clear()
+        query()
+        for index in indexes:
+            assert any(name in plan for name in names[index] for plan in plans), index
+
+    @pytest.mark.parametrize(
+        "statement, index",
+        [
+            (
+                "DELETE FROM tables.direction_result WHERE inspection_result_id = %s AND inspection_date = %s",
+                "ix_direction_result_inspection_result_id",
+            ),
+            (
+                "DELETE FROM tables.topic_result WHERE direction_result_id = %s AND inspection_date = %s",
+                "ix_topic_result_direction_result_id",
+            ),
+            (
+                "UPDATE tables.direction_result SET direction_id = NULL WHERE direction_id = %s",
+                "ix_direction_result_direction_id",
+            ),
+            ("UPDATE tables.topic_result SET topic_id = NULL WHERE topic_id = %s", "ix_topic_result_topic_id"),
+            (
+                "UPDATE tables.inspection_result SET inspection_target_id = NULL WHERE inspection_target_id = %s",
+                "ix_inspection_result_inspection_target_id",
+            ),
+        ],
+    )
+    def test_foreign_key_actions_use_indexes(self, statement, index):
+        """Запросы, которые выполняют триггеры внешних ключей при удалении родительской записи (ON DELETE)."""
+        names = partition_indexes(index)
+        parameters = (str(LEGACY_INSPECTION_ID) if "_result_id" in statement else "1", datetime(2024, 1, 23))[
+            : statement.count("%s")
+        ]
+        with session_scope() as session:
+            with session.connection().connection.cursor() as cursor:
+                plan = self.explain(cursor, statement, parameters)
+        assert any(name in plan for name in names), index
+
+    def test_inspection_date_filter_prunes_partitions(self, plans):
+        """Фильтр по дате проверки читает только секцию ее месяца."""
+        day = int(datetime(2024, 1, 23, tzinfo=timezone.utc).timestamp())
+        InspectionDB.get_inspections(
+            10, 0, None, None, None, None, None, day, day, None, None, date_field="inspection_date"
+        )
+        assert {name for plan in plans for name in re.findall(r"inspection_result_p\d{6}", plan)} == {
+            "inspection_result_p202401"
+        }
+
+
+class TestPartitions:
+    """Обслуживание секций результатов проверок (нужна БД после миграции 0.0.0.11)."""
+
+    def test_create_and_detach(self):
+        month = datetime(1990, 1, 1)
+        try:
+            # Секции при записи не создаются: запись за месяц без секции отклоняется.
+            with pytest.raises(ValueError):
+                PartitionDB.check_partitions([datetime(1990, 1, 15)])
+            assert PartitionDB.create_partitions(month, month) == 3
+            PartitionDB.check_partitions([datetime(1990, 1, 15)])
+            assert PartitionDB.create_partitions(month, month) == 0
+            with session_scope() as session:
+                inspection = models.InspectionResult(
+                    name="archive", description="archive", operator_id="1", inspection_date=datetime(1990, 1, 15)
+                )
+                models.DirectionResult(description="archive", inspection_result=inspection)
+                session.add(inspection)
+                session.flush()
+                inspection_id = inspection.id
+                assert next(iter(inspection.direction_results)).inspection_date == datetime(1990, 1, 15)
+
+            assert PartitionDB.detach_partitions(datetime(1990, 2, 1)) == 1
+            assert InspectionDB.get_by_id(inspection_id) is None
+            with session_scope() as session:
+                assert session.scalar(
+                    text("SELECT count(*) FROM archive.direction_result_p199001 WHERE inspection_result_id = :id"),
+                    {"id": inspection_id},
+                ) == 1
+
+            # Секция отсоединена другим процессом, а кэш рабочего процесса о ней еще помнит: запись отклоняется
+            # ошибкой данных, а не ошибкой БД, и месяц исключается из кэша.
+            PartitionDB.check_partitions([datetime(1990, 1, 15)])
+            payload = json.loads(json.dumps(payload_generic_5))
+            payload["inspection_date"] = "1990-01-15T00:00:00"
+            with pytest.raises(ValueError, match="1990-01"):
+                InspectionResultService(payload, StrategyWeights()).write_to_db()
+            with pytest.raises(ValueError):
+                PartitionDB.check_partitions([datetime(1990, 1, 15)])
+        finally:
+            PartitionDB.detach_partitions(datetime(1990, 2, 1))
+            with session_scope() as session:
+                for table in ("topic_result", "direction_result", "inspection_result"):
+                    session.execute(text(f"DROP TABLE IF EXISTS archive.{table}_p199001"))
+
+
+class TestUpdateInspection:
+    """Обновление проверки (нужна БД с тестовыми данными 0.0.0.2)."""
+
+    def test_direction_grades_match_create(self):
+        payload = json.loads(json.dumps(payload_generic_5))
+        payload["direction_results"][1]["topic_results"][0]["grade"] = 2
+        with session_scope() as session:
+            created = InspectionResultService(payload, StrategyWeights()).write_to_db()
+            created_grades = {
+                direction.direction_id: direction.grade
+                for direction in InspectionDB.get_by_id(created.id).direction_results
+            }
+            assert None not in created_grades.values()
+
+            # Оценки направлений, сохраненные при создании, сбрасываются и рассчитываются заново при обновлении.
+            session.execute(
+                text("UPDATE tables.direction_result SET grade = NULL WHERE inspection_result_id = :id"),
+                {"id": created.id},
+            )
+            session.expire_all()
+            del payload["inspection_target_id"]
+            updated = InspectionResultService.update_in_db(created.id, payload, StrategyWeights())
+            updated_grades = {direction.direction_id: direction.grade for direction in updated.direction_results}
+            assert updated_grades == created_grades
+            assert updated.grade == created.grade
+            session.rollback()
+
+    def test_single_inspection_update(self):
+        """Пересчитанная общая оценка записывается тем же UPDATE строки проверки, по ключу секции."""
+        payload = json.loads(json.dumps(payload_generic_5))
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("UPDATE TABLES.INSPECTION_RESULT "):
+                statements.append(statement)
+
+        with session_scope() as session:
+            created = InspectionResultService(payload, StrategyWeights()).write_to_db()
+            created_grade = created.grade
+            payload["direction_results"][0]["topic_results"][0]["grade"] = 1
+            payload["direction_results"][0]["grade"] = 1
+            event.listen(engine, "before_cursor_execute", capture)
+            try:
+                updated = InspectionResultService.update_in_db(created.id, payload, StrategyWeights())
+            finally:
+                event.remove(engine, "before_cursor_execute", capture)
+            assert updated.grade != created_grade
+            assert len(statements) == 1
+            assert "grade=" in statements[0] and "inspection_date =" in statements[0]
+            session.rollback()
+
+
+class TestLoginSessionScope:
+    """Служебные чтения выполняются вне сессии и роли пользователя запроса (нужна БД)."""
+
+    def test_separate_session(self):
+        token = current_role.set("antonovaa")
+        try:
+            with session_scope() as session:
+                with login_session_scope() as login_session:
+                    assert login_session is not session
+                    assert current_role.get() is None
+                    with session_scope() as nested:
+                        assert nested is login_session
+                assert current_role.get() == "antonovaa"
+                with session_scope() as nested:
+                    assert nested is session
+        finally:
+            current_role.reset(token)
+
+
+class TestBulkInsert:
+    """Пакетная запись проверок (нужна БД)."""
+
+    def test_single_insert_per_table(self):
+        statements = []
+
+        def collect(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT"):
+                statements.append(statement.split("(", 1)[0])
+
+        event.listen(engine, "before_cursor_execute", collect)
+        try:
+            with session_scope() as session:
+                results = InspectionResultService.write_many_to_db(
+                    [payload_criteria_1, payload_criteria_2, payload_criteria_1]
+                )
+                session.rollback()
+        finally:
+            event.remove(engine, "before_cursor_execute", collect)
+        assert ["error" in result for result in results] == [False, False, False]
+        assert all(result["id"].version == 7 for result in results)
+        assert sorted(statements) == [
+            "INSERT INTO tables.direction_result ",
+            "INSERT INTO tables.inspection_result ",
+            "INSERT INTO tables.topic_result ",
+        ]
+
+
+class TestLatestTopicResult:
+    """Модель чтения последних результатов по поднаправлениям (нужна БД с тестовыми данными 0.0.0.2)."""
+
+    @staticmethod
+    def latest():
+        return {
+            row.topic_id: row.topic_result_id for row in InspectionDB.get_overall_results_by_inspection_target_id("1")
+        }
+
+    @staticmethod
+    def rows(session):
+        return sorted(
+            session.execute(text("SELECT * FROM tables.latest_topic_result")).all(),
+            key=lambda row: tuple(map(str, row)),
+        )
+
+    def test_latest_visible_result(self):
+        with session_scope() as session:
+            inspections, topics = [], []
+            for organ_id, created_date in (("1", datetime(2030, 1, 1)), ("2", datetime(2030, 2, 1))):
+                inspection = models.InspectionResult(
+                    name="latest",
+                    description="latest",
+                    operator_id="1",
+                    inspection_organ_id=organ_id,
+                    inspection_target_id="1",
+                    created_date=created_date,
+                    inspection_date=datetime(2024, 6, 10),
+                )
+                direction = models.DirectionResult(description="latest", inspection_result=inspection)
+                topics.append(models.TopicResult(description="latest", topic_id="1", direction_result=direction))
+                inspections.append(inspection)
+            session.add_all(inspections)
+            session.flush()
+            assert self.latest()["1"] == topics[1].id
+
+            # Пользователю виден только орган 1: последний видимый ему результат - более ранний.
+            session.execute(text("SET LOCAL ROLE petrovpp"))
+            assert self.latest()["1"] == topics[0].id
+            session.execute(text("RESET ROLE"))
+
+            inspections[1].inspection_organ_id = "1"
+            session.flush()
+            session.execute(text("SET LOCAL ROLE petrovpp"))
+            assert self.latest()["1"] == topics[1].id
+            session.execute(text("RESET ROLE"))
+
+            # Пересчет триггерами совпадает с полным перестроением.
+            session.execute(text("DELETE FROM tables.inspection_result WHERE id = :id"), {"id": inspections[1].id})
+            assert self.latest()["1"] == topics[0].id
+            refreshed = self.rows(session)
+            InspectionDB.rebuild_latest_topic_results()
+            assert self.rows(session) == refreshed
+            session.rollback()
+
+
+class TestGradeRollup:
+    """Агрегаты оценок (нужна БД после миграции 0.0.0.13)."""
+
+    MONTH = {"start_month": "2024-06", "end_month": "2024-06"}
+
+    @staticmethod
+    def totals(inspection_organ_id=None, **kwargs):
+        return {
+            item["inspection_organ_id"]: (item["count"], round(item["avg_grade"] * item["count"], 6))
+            for item in GradeAnalyticsService.get_grades(inspection_organ_id, **kwargs)
+        }
+
+    @staticmethod
+    def rollup_rows(session):
+        return sorted(
+            session.execute(text("SELECT * FROM tables.grade_rollup")).all(), key=lambda row: tuple(map(str, row))
+        )
+
+    def test_refresh_follows_changes(self):
+        with session_scope() as session:
+            GradeRollupDB.refresh()
+            before = self.totals("1", **self.MONTH)
+            inspections = [
+                models.InspectionResult(
+                    name="rollup",
+                    description="rollup",
+                    operator_id="1",
+                    inspection_organ_id="2",
+                    inspection_target_id="1",
+                    grade=grade,
+                    inspection_date=datetime(2024, 6, 10),
+                )
+                for grade in (4, 3.4, 2)
+            ]
+            session.add_all(inspections)
+            session.flush()
+            assert GradeRollupDB.refresh() == 1
+
+            after = self.totals("1", **self.MONTH)
+            for organ_id in ("1", "2"):
+                count, grade_sum = before.get(organ_id, (0, 0))
+                assert after[organ_id] == (count + 3, round(grade_sum + 9.4, 6))
+            (item,) = [
+                item
+                for item in GradeAnalyticsService.get_grades("2", inspection_target_type_id="1", **self.MONTH)
+                if item["inspection_organ_id"] == "2"
+            ]
+            assert {grade["grade"]: grade["count"] for grade in item["distribution"]}[3] >= 1
+
+            inspections[0].grade = 1
+            session.delete(inspections[1])
+            session.flush()
+            assert GradeRollupDB.refresh() == 1
+            count, grade_sum = before.get("2", (0, 0))
+            assert self.totals("1", **self.MONTH)["2"] == (count + 2, round(grade_sum + 3, 6))
+
+            # Пересчет по очереди совпадает с полным перестроением.
+            refreshed = self.rollup_rows(session)
+            GradeRollupDB.rebuild()
+            assert self.rollup_rows(session) == refreshed
+            session.rollback()
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"level": "topic"},
+            {"group_by": ["organ"]},
+            {"group_by": ["direction"]},
+            {"direction_id": "1"},
+            {"start_month": "2024-13"},
+        ],
+    )
+    def test_invalid_parameters(self, kwargs):
+        with pytest.raises(ValueError):
+            GradeAnalyticsService.get_grades(**kwargs)